@@ -1,9 +1,11 @@
-from fastapi import APIRouter, BackgroundTasks
-from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Query
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
 
 from app.ml.accuracy_tracker import accuracy_tracker
 from app.ml.data_quality import data_quality_checker
-from app.config import settings
+from app.services.prediction_engine import prediction_engine
 
 router = APIRouter()
 
@@ -14,23 +16,24 @@ async def get_overall_accuracy():
     return accuracy_tracker.get_overall_accuracy()
 
 
+@router.get("/horizons")
+async def get_horizon_accuracy(city_id: Optional[str] = None):
+    """Streaming error metrics per lead-time bucket, for one city or all cities"""
+    return {
+        "city_id": city_id,
+        "horizons": accuracy_tracker.get_horizon_accuracy(city_id),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
 @router.get("/city/{city_id}")
 async def get_city_accuracy(city_id: str):
-    """Get accuracy for specific city"""
-    from app.core.database import get_historical_readings
-    
-    readings = get_historical_readings(city_id, hours=24)
-    
-    if not readings:
-        # Return default response if no readings
-        return {
-            "city_id": city_id,
-            "message": "No readings found for validation",
-            "accuracy": None,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    
-    return accuracy_tracker.validate_predictions(city_id, readings)
+    """Get accuracy for specific city.
+
+    Served from the verified-prediction accumulators and the cached summary;
+    reads never validate (POST /validate or the scheduled job does).
+    """
+    return accuracy_tracker.get_city_accuracy(city_id)
 
 
 @router.post("/validate")
@@ -41,16 +44,11 @@ async def trigger_validation(background_tasks: BackgroundTasks):
 
 
 async def validate_all_cities():
-    """Background task to validate all cities"""
-    from app.core.database import get_historical_readings
-    
-    for city in settings.UAE_CITIES:
-        try:
-            readings = get_historical_readings(city['id'], hours=24)
-            if readings:
-                accuracy_tracker.validate_predictions(city['id'], readings)
-        except Exception as e:
-            print(f"Validation failed for {city['id']}: {e}")
+    """Background task to validate all cities (one query, run in an executor)"""
+    try:
+        await prediction_engine.validate_accuracy()
+    except Exception as e:
+        print(f"Validation failed: {e}")
 
 
 @router.get("/data-quality")
@@ -69,14 +67,28 @@ async def get_calibration_factors():
 
 
 @router.get("/history/{city_id}")
-async def get_accuracy_history(city_id: str, days: int = 7):
-    """Get accuracy history for a city"""
-    history = accuracy_tracker.accuracy_history.get(city_id, [])
+async def get_accuracy_history(city_id: str, days: int = Query(7, ge=1, le=365)):
+    """Get accuracy history for a city.
+
+    Validation results of the last `days` days come from the in-memory
+    history; `daily` holds the persisted per-day rollups for longer trends.
+    """
+    from app.core.database import get_daily_accuracy
+    
+    daily = await asyncio.get_running_loop().run_in_executor(
+        None, get_daily_accuracy, f"ensemble:{city_id}", days
+    )
+    now = datetime.utcnow()
+    window = accuracy_tracker.get_history(city_id, now - timedelta(days=days))
+    history = window['accuracy'].tolist()
+    history_store = accuracy_tracker.accuracy_history.get(city_id)
     
     return {
         "city_id": city_id,
-        "accuracy_history": history[-days*24:],
-        "average": sum(history[-days*24:]) / len(history[-days*24:]) if history else 0,
-        "samples": len(history),
-        "timestamp": datetime.utcnow().isoformat()
+        "accuracy_history": history,
+        "timestamps": [datetime.utcfromtimestamp(t).isoformat() for t in window['timestamp'].tolist()],
+        "average": sum(history) / len(history) if history else 0,
+        "samples": len(history_store) if history_store else 0,
+        "daily": daily,
+        "timestamp": now.isoformat()
     }
@@ -105,6 +105,21 @@ async def get_metrics():
     except Exception:
         pass
     
+    # Prediction cache
+    from app.services.prediction_engine import prediction_engine
+    cache_stats = prediction_engine.cache_stats()
+    metrics.append(f'haboob_prediction_cache_hits_total {cache_stats["hits"]}')
+    metrics.append(f'haboob_prediction_cache_misses_total {cache_stats["misses"]}')
+    metrics.append(f'haboob_prediction_cache_entries {cache_stats["entries"]}')
+    metrics.append(f'haboob_prediction_refresh_reused_total {cache_stats["refresh_reused"]}')
+    metrics.append(f'haboob_prediction_refresh_recomputed_total {cache_stats["refresh_recomputed"]}')
+    
+    # Per-model cost and state
+    for model in await prediction_engine.model_report():
+        metrics.append(f'haboob_model_enabled{{model="{model["name"]}"}} {int(model["enabled"])}')
+        metrics.append(f'haboob_model_runs_total{{model="{model["name"]}"}} {model["runs"]}')
+        metrics.append(f'haboob_model_seconds_total{{model="{model["name"]}"}} {model["total_seconds"]}')
+    
     # Per-city accuracy
     for city_id, stats in accuracy.get("cities", {}).items():
         city_accuracy = stats.get("accuracy", 0)
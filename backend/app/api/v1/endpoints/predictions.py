@@ -1,25 +1,68 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Dict, Literal
 import aiohttp
 
-from app.services.prediction_engine import PredictionEngine
+from app.services.cache_service import CacheService
+from app.services.prediction_engine import prediction_engine
 from app.services.data_collector import DataCollector
+from app.ml.ensemble_predictor import PAYLOAD_LITE, MAX_MEMBERS, MAX_FORECAST_HOURS
 from app.config import settings
+from app.middleware.security import require_operator
 
 router = APIRouter()
-prediction_engine = PredictionEngine()
+cache = CacheService()
+
+
+async def get_current_reading(city: Dict) -> Dict:
+    """Latest reading published by the collector, fetching upstream only if none is cached"""
+    current_data = await cache.get_current(city['id'])
+    if not current_data:
+        collector = DataCollector()
+        async with aiohttp.ClientSession() as session:
+            current_data = await collector.collect_city(session, city)
+    return current_data
+
+@router.get("/models")
+async def get_models():
+    """Ensemble members with their weights, toggle state and per-model timing"""
+    return {"models": await prediction_engine.model_report()}
+
+@router.post("/models/{model_name}/{action}", dependencies=[Depends(require_operator)])
+async def toggle_model(model_name: str, action: Literal["enable", "disable"]):
+    """Enable or disable an ensemble member at runtime; remaining weights are renormalized.
+
+    Operator-only: requires the X-Operator-Key header (see OPERATOR_API_KEY).
+    """
+    try:
+        await prediction_engine.set_model_enabled(model_name, action == "enable")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model '{model_name}' not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"models": await prediction_engine.model_report()}
 
 @router.get("/{city_id}")
-async def get_predictions(city_id: str, hours: int = 72):
-    """Get dust predictions for a city"""
+async def get_predictions(city_id: str, hours: int = Query(72, ge=1, le=MAX_FORECAST_HOURS),
+                          verbosity: Literal["full", "lite"] = "full",
+                          breakdown: bool = False,
+                          members: int = Query(0, ge=0, le=MAX_MEMBERS)):
+    """Get dust predictions for a city.
+
+    hours (up to MAX_FORECAST_HOURS) is the horizon. Steps are hourly for
+    the first 24h, 3-hourly out to 7 days and 6-hourly beyond that.
+
+    verbosity=lite returns a columnar `forecast` object (times[], dust[],
+    confidence[], lower[], upper[]) instead of per-hour dicts; breakdown=true
+    adds the per-model columns to it. members=N (e.g. 200) adds a
+    `probabilistic` block with p10/p50/p90 and 50/100/200 exceedance
+    probabilities per hour.
+    """
     city = next((c for c in settings.UAE_CITIES if c['id'] == city_id), None)
     if not city:
         raise HTTPException(status_code=404, detail=f"City '{city_id}' not found")
 
-    collector = DataCollector()
-    async with aiohttp.ClientSession() as session:
-        current_data = await collector.collect_city(session, city)
-
-    predictions = await prediction_engine.predict(city_id, current_data, hours)
+    current_data = await get_current_reading(city)
+    predictions = await prediction_engine.predict_cached(city_id, current_data, hours, verbosity, breakdown, members)
     return predictions
 
 @router.get("/{city_id}/risk-periods")
@@ -29,11 +72,8 @@ async def get_risk_periods(city_id: str):
     if not city:
         raise HTTPException(status_code=404, detail=f"City '{city_id}' not found")
 
-    collector = DataCollector()
-    async with aiohttp.ClientSession() as session:
-        current_data = await collector.collect_city(session, city)
-
-    predictions = await prediction_engine.predict(city_id, current_data, 72)
+    current_data = await get_current_reading(city)
+    predictions = await prediction_engine.predict_cached(city_id, current_data, 72, verbosity=PAYLOAD_LITE)
     return {
         "city_id": city_id,
         "risk_periods": predictions.get("risk_periods", [])
@@ -23,11 +23,25 @@ class Settings(BaseSettings):
     # Other optional API Keys
     AQICN_API_KEY: str = ""
     OPENWEATHER_API_KEY: str = ""
+    
+    # Operator endpoints (runtime model toggles) require this X-Operator-Key; empty disables them
+    OPERATOR_API_KEY: str = ""
     WEATHERAPI_KEY: str = ""
     
     # Data Collection
     COLLECTION_INTERVAL: int = 60  # seconds
     
+    # Predictions
+    PREDICTION_CACHE_TTL: int = 300  # seconds
+    PREDICTION_EXECUTOR: str = "thread"  # "thread" or "process"
+    PREDICTION_WORKERS: int = 2
+    READING_FORECAST_VERBOSITY: str = "full"  # forecast layout in published readings: "full" or "lite"
+    PREDICTOR_SNAPSHOT_INTERVAL: int = 600  # seconds
+    LEDGER_VERIFY_INTERVAL: int = 900  # seconds
+    ACCURACY_VALIDATION_INTERVAL: int = 3600  # seconds, 0 disables
+    GBM_TRAIN_INTERVAL: int = 86400  # seconds, 0 disables
+    GBM_TRAIN_DAYS: int = 30
+    
     # UAE Cities Configuration
     UAE_CITIES: List[Dict] = [
         {"id": "dubai", "name": "Dubai", "lat": 25.2048, "lon": 55.2708, "icon": "🏙️", "population": 3500000, "airports": ["OMDB", "OMDW"]},
@@ -1,6 +1,6 @@
 import sqlite3
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 import json
 import os
 import logging
@@ -61,6 +61,25 @@ def init_database():
         )
     ''')
 
+    # Prediction ledger: one row per city per committed forecast, with the
+    # horizon packed as float32 arrays (leads in hours, one value per lead)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city_id TEXT NOT NULL,
+            prediction_time DATETIME NOT NULL,
+            horizon_end DATETIME NOT NULL,
+            model_version TEXT,
+            leads BLOB NOT NULL,
+            predicted_dust BLOB NOT NULL,
+            confidence BLOB,
+            actual_dust BLOB,
+            error BLOB,
+            verified_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
     # Alerts table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS alerts (
@@ -105,6 +124,12 @@ def init_database():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_readings_city_time ON dust_readings(city_id, timestamp)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_predictions_city ON predictions(city_id, target_time)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_alerts_city ON alerts(city_id, triggered_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_city_time ON prediction_ledger(city_id, prediction_time)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ledger_pending ON prediction_ledger(city_id)
+        WHERE verified_at IS NULL
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_model_accuracy_day ON model_accuracy(model_name, date)')
 
     conn.commit()
     conn.close()
@@ -179,6 +204,26 @@ def get_all_readings_for_training(days: int = 30) -> List[Dict]:
 
     return [dict(row) for row in rows]
 
+def get_history_readings(days: int = 14) -> List[Dict]:
+    """Predictor-relevant columns of every city's recent readings in one query, oldest first"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    since = datetime.utcnow() - timedelta(days=days)
+
+    cursor.execute('''
+        SELECT city_id, timestamp, dust, temperature, humidity,
+               wind_speed, wind_direction, visibility
+        FROM dust_readings
+        WHERE timestamp > ?
+        ORDER BY timestamp ASC
+    ''', (since.isoformat(),))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [dict(row) for row in rows]
+
 def save_prediction(city_id: str, prediction_time: datetime, target_time: datetime, 
                    predicted_dust: float, model_version: str, confidence: float):
     """Save prediction for later accuracy validation"""
@@ -195,6 +240,133 @@ def save_prediction(city_id: str, prediction_time: datetime, target_time: dateti
     conn.commit()
     conn.close()
 
+def save_forecasts(rows: List[tuple]):
+    """Batch-insert ledger rows: (city_id, prediction_time, horizon_end, model_version,
+    leads, predicted_dust, confidence) with the arrays packed as float32 bytes"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.executemany('''
+        INSERT INTO prediction_ledger
+        (city_id, prediction_time, horizon_end, model_version, leads, predicted_dust, confidence)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    conn.commit()
+    conn.close()
+
+def get_validation_readings(hours: int = 24) -> List[tuple]:
+    """(city_id, epoch seconds, dust) of every city's recent readings in one query.
+
+    Timestamps are converted to epoch seconds by SQLite (NULL if unparseable);
+    rows are plain tuples ordered by city and time, ready for column arrays.
+    """
+    conn = get_db_connection()
+    conn.row_factory = None
+    cursor = conn.cursor()
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+
+    cursor.execute('''
+        SELECT city_id, (julianday(timestamp) - 2440587.5) * 86400.0, dust
+        FROM dust_readings
+        WHERE timestamp > ?
+        ORDER BY city_id, timestamp
+    ''', (since.isoformat(),))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return rows
+
+def get_recent_forecasts(hours: int = 24) -> List[Dict]:
+    """Ledger rows committed in the last `hours` hours, oldest first"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+
+    cursor.execute('''
+        SELECT city_id, prediction_time, leads, predicted_dust, confidence, actual_dust
+        FROM prediction_ledger
+        WHERE prediction_time > ?
+        ORDER BY prediction_time ASC
+    ''', (since.isoformat(),))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [dict(row) for row in rows]
+
+def get_pending_forecasts() -> Dict[str, List[Dict]]:
+    """Unverified ledger rows, plus the readings that can verify them.
+
+    The readings come from one join that limits each city's dust_readings
+    to the span of its pending forecasts (widened by 30 minutes each side).
+    Returns {'forecasts': [...], 'readings': [...]} with readings ordered by
+    city and time.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, city_id, prediction_time, horizon_end, leads, predicted_dust, actual_dust
+        FROM prediction_ledger
+        WHERE verified_at IS NULL
+    ''')
+    forecasts = [dict(row) for row in cursor.fetchall()]
+
+    cursor.execute('''
+        SELECT r.city_id, r.timestamp, r.dust
+        FROM dust_readings r
+        JOIN (
+            SELECT city_id,
+                   strftime('%Y-%m-%dT%H:%M:%S', MIN(prediction_time), '-30 minutes') AS since,
+                   strftime('%Y-%m-%dT%H:%M:%S', MAX(horizon_end), '+30 minutes') AS until
+            FROM prediction_ledger
+            WHERE verified_at IS NULL
+            GROUP BY city_id
+        ) pending ON r.city_id = pending.city_id
+        WHERE r.timestamp BETWEEN pending.since AND pending.until
+        ORDER BY r.city_id, r.timestamp
+    ''')
+    readings = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return {'forecasts': forecasts, 'readings': readings}
+
+def get_verified_forecasts(issued_since: datetime, since: datetime, until: datetime) -> List[Dict]:
+    """Ledger rows issued after issued_since with verified steps, whose horizon overlaps [since, until)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT city_id, prediction_time, leads, predicted_dust, actual_dust
+        FROM prediction_ledger
+        WHERE prediction_time >= ? AND prediction_time < ? AND horizon_end >= ?
+          AND actual_dust IS NOT NULL
+    ''', (issued_since.isoformat(), until.isoformat(), since.isoformat()))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [dict(row) for row in rows]
+
+def save_forecast_verification(rows: List[tuple]):
+    """Batch-update ledger rows: (actual_dust, error, verified_at, id); verified_at
+    stays NULL until the whole horizon has elapsed"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.executemany('''
+        UPDATE prediction_ledger
+        SET actual_dust = ?, error = ?, verified_at = ?
+        WHERE id = ?
+    ''', rows)
+
+    conn.commit()
+    conn.close()
+
 def save_alert(city_id: str, alert_type: str, severity: str, message: str, dust_level: float):
     """Save alert to database"""
     conn = get_db_connection()
@@ -250,5 +422,55 @@ def get_model_accuracy_stats() -> Dict:
         return dict(row)
     return {'avg_accuracy': 0, 'avg_mae': 0, 'avg_rmse': 0, 'days_tracked': 0}
 
+def save_model_accuracy(rows: List[tuple]):
+    """Upsert daily accuracy rollups: (model_name, date, predictions_count, mae, rmse, accuracy_percent)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.executemany('''
+        INSERT INTO model_accuracy (model_name, date, predictions_count, mae, rmse, accuracy_percent)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(model_name, date) DO UPDATE SET
+            predictions_count = excluded.predictions_count,
+            mae = excluded.mae,
+            rmse = excluded.rmse,
+            accuracy_percent = excluded.accuracy_percent,
+            created_at = CURRENT_TIMESTAMP
+    ''', rows)
+
+    conn.commit()
+    conn.close()
+
+def get_latest_accuracy_date(prefix: str) -> Optional[str]:
+    """Most recent date with a model_accuracy rollup for models named prefix*"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT MAX(date) AS latest FROM model_accuracy WHERE model_name LIKE ?
+    ''', (f'{prefix}%',))
+
+    row = cursor.fetchone()
+    conn.close()
+
+    return row['latest'] if row else None
+
+def get_daily_accuracy(model_name: str, days: int = 30) -> List[Dict]:
+    """Daily accuracy rollups of one model over the last `days` days, oldest first"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT date, predictions_count, mae, rmse, accuracy_percent
+        FROM model_accuracy
+        WHERE model_name = ? AND date > date('now', ?)
+        ORDER BY date ASC
+    ''', (model_name, f'-{days} days'))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [dict(row) for row in rows]
+
 # Initialize database on import
 init_database()
@@ -8,6 +8,7 @@ from datetime import datetime
 
 from app.api.v1.router import api_router
 from app.services.data_collector import DataCollector
+from app.services.prediction_engine import prediction_engine
 from app.services.websocket_manager import WebSocketManager
 from app.middleware.security import (
     RateLimitMiddleware,
@@ -29,13 +30,33 @@ ws_manager = WebSocketManager()
 async def lifespan(app: FastAPI):
     logger.info("🚀 Starting HABOOB.ai Production Server v6.0.0...")
     
+    # Restore predictor state before the first collection cycle
+    await prediction_engine.warm_start()
+    
     # Start background data collection
     collection_task = asyncio.create_task(data_collector.run_forever(ws_manager))
     
+    # Offline model training runs in its own process, never on the request path
+    training_task = asyncio.create_task(prediction_engine.train_forever())
+    
+    # Scheduled accuracy validation of all cities, also run in an executor
+    validation_task = asyncio.create_task(prediction_engine.validate_forever())
+    
     logger.info("✅ HABOOB.ai Production Ready!")
     yield
     
     collection_task.cancel()
+    training_task.cancel()
+    validation_task.cancel()
+    try:
+        await prediction_engine.snapshot()
+    except Exception as e:
+        logger.error(f"Could not snapshot predictor state: {e}")
+    try:
+        await prediction_engine.persist_forecasts(verify=False)
+    except Exception as e:
+        logger.error(f"Could not write the prediction ledger: {e}")
+    prediction_engine.shutdown()
     logger.info("👋 HABOOB.ai shutdown complete")
 
 app = FastAPI(
@@ -1,13 +1,29 @@
-from fastapi import Request
+from fastapi import Header, HTTPException, Request
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from collections import defaultdict
+from typing import Optional
+import secrets
 import time
 import logging
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
 
+def require_operator(x_operator_key: Optional[str] = Header(None)):
+    """Dependency for operator-only endpoints: X-Operator-Key must match OPERATOR_API_KEY.
+
+    With no OPERATOR_API_KEY configured the endpoints are disabled (403).
+    """
+    if not settings.OPERATOR_API_KEY:
+        raise HTTPException(status_code=403, detail="Operator endpoints are disabled")
+    if not x_operator_key or not secrets.compare_digest(x_operator_key, settings.OPERATOR_API_KEY):
+        logger.warning("Rejected operator request with a missing or invalid key")
+        raise HTTPException(status_code=401, detail="Invalid operator key")
+
+
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """Production rate limiting middleware"""
     
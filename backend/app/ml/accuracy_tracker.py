@@ -1,19 +1,235 @@
 import numpy as np
-from datetime import datetime
-from typing import Dict, List
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 import logging
-from collections import deque
+import threading
+
+from app.ml.ensemble_predictor import MAX_FORECAST_HOURS, to_epoch
 
 logger = logging.getLogger(__name__)
 
+# A reading validates a prediction if it is less than this many seconds from the target time
+MATCH_TOLERANCE = 1800
+
+# Ledger rows kept in memory while the database is unavailable
+LEDGER_MAX_PENDING = 10000
+
+# Lead-time buckets of the streaming error accumulators (upper bounds in hours, exclusive)
+LEAD_BUCKET_EDGES = np.array([6, 24, 72])
+LEAD_BUCKETS = ('0-6h', '6-24h', '24-72h', '72h+')
+
+# Hours a target time stays in the prediction store after it has passed
+VERIFICATION_WINDOW_HOURS = 72
+
+# Validation results kept per city in the accuracy history ring
+HISTORY_CAPACITY = 2048
+
+# A UTC day is rolled up this long after it ends, once its last targets have been verified
+ROLLUP_DELAY = timedelta(hours=1)
+
+# Completed days derived from the ledger when no rollup has been stored yet
+ROLLUP_BACKFILL_DAYS = 7
+
+# Width in seconds of each city's time band in the all-city validation join
+CITY_BAND = 2.0 ** 34
+
+
+def pack(values) -> bytes:
+    """float32 bytes of a horizon array, as stored in the prediction ledger"""
+    return np.asarray(values, dtype=np.float32).tobytes()
+
+
+def unpack(blob: Optional[bytes]) -> np.ndarray:
+    return np.frombuffer(blob or b'', dtype=np.float32)
+
+
+def match_nearest(sorted_times: np.ndarray, query_times: np.ndarray,
+                  tolerance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Index of the nearest sorted_times entry for every query time, and whether it is within tolerance"""
+    if len(sorted_times) == 0:
+        return np.zeros(len(query_times), dtype=np.intp), np.zeros(len(query_times), dtype=bool)
+    
+    right = np.clip(np.searchsorted(sorted_times, query_times), 0, len(sorted_times) - 1)
+    left = np.maximum(right - 1, 0)
+    nearest = np.where(np.abs(query_times - sorted_times[left]) <= np.abs(sorted_times[right] - query_times),
+                       left, right)
+    # NaN query times compare False and never match
+    return nearest, np.abs(sorted_times[nearest] - query_times) < tolerance
+
+
+class ErrorAccumulator:
+    """Streaming error sums per lead-time bucket.
+
+    Each row holds count, sum |error|, sum error^2, sum percentage error and
+    sum signed error, so every metric is O(1) to read and verified
+    predictions are folded in once, as they are verified.
+    """
+    COUNT, ABSOLUTE, SQUARED, PERCENTAGE, SIGNED = range(5)
+    
+    def __init__(self):
+        self.sums = np.zeros((len(LEAD_BUCKETS), 5))
+    
+    def add(self, leads: np.ndarray, predicted: np.ndarray, actual: np.ndarray):
+        error = predicted - actual
+        absolute = np.abs(error)
+        columns = np.stack([
+            np.ones_like(error), absolute, error ** 2, absolute / np.maximum(actual, 1) * 100, error
+        ], axis=1)
+        np.add.at(self.sums, np.searchsorted(LEAD_BUCKET_EDGES, leads, side='right'), columns)
+    
+    @staticmethod
+    def metrics(count: float, absolute: float, squared: float, percentage: float, signed: float) -> Dict:
+        """Metrics of one row of sums (count must be non-zero)"""
+        mape = percentage / count
+        return {
+            'count': int(count),
+            'mae': round(absolute / count, 2),
+            'rmse': round((squared / count) ** 0.5, 2),
+            'mape': round(mape, 2),
+            'bias': round(signed / count, 2),
+            'accuracy': round(max(0, min(100, 100 - mape * 0.8)), 2)
+        }
+    
+    @staticmethod
+    def summarize(sums: np.ndarray) -> Dict:
+        """Metrics per non-empty bucket of an accumulator's (or a sum of accumulators') sums"""
+        return {bucket: ErrorAccumulator.metrics(*row)
+                for bucket, row in zip(LEAD_BUCKETS, sums.tolist()) if row[0]}
+
+
+class PredictionStore:
+    """Fixed-size prediction buffer of one city, keyed by (target hour, lead bucket).
+
+    Slots form a ring of VERIFICATION_WINDOW_HOURS + MAX_FORECAST_HOURS
+    target hours by len(LEAD_BUCKETS) lead buckets. Each keeps the
+    longest-lead prediction made for that hour within its bucket, i.e. the
+    first one committed: keeping the newest instead would leave every slot
+    with its bucket's shortest lead and make each bucket look more accurate
+    than it is. A target hour is only overwritten once it is
+    VERIFICATION_WINDOW_HOURS in the past, so every lead can be validated
+    whatever the commit rate, in about 35 KB per city.
+    """
+    HOURS = VERIFICATION_WINDOW_HOURS + MAX_FORECAST_HOURS
+    
+    def __init__(self):
+        shape = (self.HOURS, len(LEAD_BUCKETS))
+        self.target_hour = np.full(shape, -1, dtype=np.int64)
+        self.target_time = np.zeros(shape)
+        self.predicted = np.zeros(shape, dtype=np.float32)
+        self.confidence = np.zeros(shape, dtype=np.float32)
+        self.lead = np.zeros(shape, dtype=np.float32)
+    
+    def add(self, target_times: np.ndarray, leads: np.ndarray,
+            predicted: np.ndarray, confidence: np.ndarray):
+        """Store predictions given as epoch-second target times and lead hours"""
+        # Ascending lead order, so the longest lead wins slots repeated within one call
+        order = np.argsort(np.asarray(leads, dtype=float), kind='stable')
+        target_times = np.asarray(target_times, dtype=float)[order]
+        leads = np.asarray(leads, dtype=float)[order]
+        predicted = np.asarray(predicted, dtype=np.float32)[order]
+        confidence = np.asarray(confidence, dtype=np.float32)[order]
+        
+        hour = np.floor(target_times / 3600).astype(np.int64)
+        rows, columns = hour % self.HOURS, np.searchsorted(LEAD_BUCKET_EDGES, leads, side='right')
+        stored = self.target_hour[rows, columns]
+        # A slot takes a newer target hour, or a longer lead for the hour it holds
+        keep = (stored < hour) | ((stored == hour) & (self.lead[rows, columns] < leads))
+        slot = (rows[keep], columns[keep])
+        self.target_hour[slot] = hour[keep]
+        self.target_time[slot] = target_times[keep]
+        self.predicted[slot] = predicted[keep]
+        self.confidence[slot] = confidence[keep]
+        self.lead[slot] = leads[keep]
+    
+    def entries(self) -> Dict[str, np.ndarray]:
+        """Stored predictions as columns, ordered by target time"""
+        # Slots not overwritten for a full ring are older than the window
+        newest = self.target_hour.max()
+        live = (self.target_hour >= 0) & (self.target_hour > newest - self.HOURS)
+        order = np.argsort(self.target_time[live], kind='stable')
+        return {
+            'target_time': self.target_time[live][order],
+            'lead': self.lead[live][order],
+            'predicted_dust': self.predicted[live][order],
+            'confidence': self.confidence[live][order]
+        }
+    
+    def extend(self, entries: Dict[str, np.ndarray]):
+        """Store the entries() of another store (e.g. from a shard process)"""
+        self.add(entries['target_time'], entries['lead'], entries['predicted_dust'], entries['confidence'])
+    
+    def __len__(self) -> int:
+        return len(self.entries()['target_time'])
+
+
+class AccuracyHistory:
+    """Timestamped validation results of one city in fixed ring arrays.
+
+    Entries arrive in time order, so the ring is at most two sorted
+    segments and a time window is found by bisecting each of them.
+    """
+    FIELDS = ('accuracy', 'matches', 'mae', 'rmse')
+    
+    def __init__(self, capacity: int = HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.columns = {field: np.zeros(capacity) for field in self.FIELDS}
+        self.start = 0
+        self.size = 0
+    
+    def append(self, timestamp: float, **values: float):
+        """Add a result at epoch `timestamp`; the oldest is dropped once full"""
+        if self.size:
+            # Keep the ring sorted even if the clock steps back
+            timestamp = max(timestamp, self.times[(self.start + self.size - 1) % self.capacity])
+        if self.size == self.capacity:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        else:
+            index = (self.start + self.size) % self.capacity
+            self.size += 1
+        self.times[index] = timestamp
+        for field in self.FIELDS:
+            self.columns[field][index] = values.get(field, 0.0)
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def _position(self, timestamp: float) -> int:
+        """Number of entries older than `timestamp`"""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return int(np.searchsorted(self.times[self.start:end], timestamp))
+        head = self.times[self.start:]
+        position = int(np.searchsorted(head, timestamp))
+        if position < len(head):
+            return position
+        return position + int(np.searchsorted(self.times[:end - self.capacity], timestamp))
+    
+    def _slice(self, first: int, last: int) -> Dict[str, np.ndarray]:
+        index = (self.start + np.arange(first, last)) % self.capacity
+        entries = {field: column[index] for field, column in self.columns.items()}
+        entries['timestamp'] = self.times[index]
+        return entries
+    
+    def window(self, since: float, until: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Entries with since <= timestamp < until, oldest first"""
+        last = self.size if until is None else self._position(until)
+        return self._slice(min(self._position(since), last), last)
+    
+    def latest(self, count: int) -> np.ndarray:
+        """Accuracy of the last `count` entries, oldest first"""
+        return self._slice(max(0, self.size - count), self.size)['accuracy']
+
+
 class AccuracyTracker:
     """Production-grade accuracy tracking system v2.0
     Advanced prediction validation with real-time calibration and trend analysis
     """
     
     def __init__(self):
-        self.prediction_buffer: Dict[str, deque] = {}
-        self.accuracy_history: Dict[str, List[float]] = {}
+        self.prediction_buffer: Dict[str, PredictionStore] = {}
+        self.accuracy_history: Dict[str, AccuracyHistory] = {}
         self.calibration_factors: Dict[str, float] = {}
         self.bias_corrections: Dict[str, float] = {}
         self.model_version = "6.0.0"
@@ -26,6 +242,19 @@ class AccuracyTracker:
         # Performance tracking
         self.hourly_performance: Dict[str, Dict[int, List[float]]] = {}
         self.validation_count = 0
+        
+        # Verified-error sums per city, and the summary built from them and the history
+        self.error_accumulators: Dict[str, ErrorAccumulator] = {}
+        self.last_validated: Dict[str, str] = {}
+        self.rolled_up_through: Optional[date] = None
+        self.cached_summary: Optional[Dict] = None
+        
+        # Committed forecasts waiting for the next batched ledger write
+        self.pending_ledger: List[tuple] = []
+        
+        # Commit threads, executor validation and ledger verification share the
+        # stores, histories, accumulators and ledger queue; all go through this lock
+        self._lock = threading.RLock()
     
     def _load_calibration_factors(self, get_db_connection):
         """Load calibration factors from database"""
@@ -48,108 +277,331 @@ class AccuracyTracker:
     def record_prediction(self, city_id: str, target_time: datetime, 
                          predicted_dust: float, confidence: float):
         """Record a prediction for later validation with enhanced tracking"""
+        lead = (target_time - datetime.utcnow()).total_seconds() / 3600
+        with self._lock:
+            self._predictions_for(city_id).add([to_epoch(target_time)], [lead],
+                                              [predicted_dust], [confidence])
+    
+    def _predictions_for(self, city_id: str) -> PredictionStore:
+        """The city's prediction store, created on first use; callers hold _lock"""
         if city_id not in self.prediction_buffer:
-            self.prediction_buffer[city_id] = deque(maxlen=2000)
+            self.prediction_buffer[city_id] = PredictionStore()
+        return self.prediction_buffer[city_id]
+    
+    def merge_predictions(self, city_id: str, entries: Dict[str, np.ndarray]):
+        """Store predictions recorded elsewhere (a shard process's PredictionStore.entries())"""
+        with self._lock:
+            self._predictions_for(city_id).extend(entries)
+    
+    def record_forecast(self, city_id: str, prediction_time: datetime, leads: np.ndarray,
+                        predicted_dust: np.ndarray, confidence: np.ndarray, model_version: str):
+        """Record a committed forecast: store every step and queue one ledger row"""
+        start = to_epoch(prediction_time)
+        leads = np.asarray(leads, dtype=float)
+        horizon_end = prediction_time + timedelta(hours=float(leads[-1]))
+        row = (city_id, prediction_time.isoformat(), horizon_end.isoformat(), model_version,
+               pack(leads), pack(predicted_dust), pack(confidence))
+        with self._lock:
+            self._predictions_for(city_id).add(start + leads * 3600, leads, predicted_dust, confidence)
+            self.pending_ledger.append(row)
+    
+    def drain_ledger(self) -> List[tuple]:
+        """Take every queued ledger row"""
+        with self._lock:
+            rows, self.pending_ledger = self.pending_ledger, []
+        return rows
+    
+    def queue_ledger(self, rows: List[tuple]):
+        """Queue ledger rows recorded elsewhere (shard processes, failed writes)"""
+        with self._lock:
+            self.pending_ledger.extend(rows)
+            del self.pending_ledger[:-LEDGER_MAX_PENDING]
+    
+    def flush_ledger(self) -> int:
+        """Write the queued ledger rows in one transaction; returns the number written"""
+        from app.core.database import save_forecasts
         
-        self.prediction_buffer[city_id].append({
-            'target_time': target_time.isoformat(),
-            'predicted_dust': predicted_dust,
-            'confidence': confidence,
-            'recorded_at': datetime.utcnow().isoformat(),
-            'hour_ahead': int((target_time - datetime.utcnow()).total_seconds() / 3600)
-        })
+        rows = self.drain_ledger()
+        if not rows:
+            return 0
+        try:
+            save_forecasts(rows)
+        except Exception as e:
+            logger.error(f"Could not write {len(rows)} ledger rows: {e}")
+            self.queue_ledger(rows)
+            return 0
+        return len(rows)
     
-    def validate_predictions(self, city_id: str, actual_readings: List[Dict]) -> Dict:
-        """Enhanced prediction validation with detailed metrics"""
-        if city_id not in self.prediction_buffer:
-            return {"error": "No predictions recorded for this city"}
+    def load_ledger(self, hours: int = VERIFICATION_WINDOW_HOURS) -> int:
+        """Refill the prediction stores from recently committed forecasts; returns the rows read"""
+        from app.core.database import get_recent_forecasts
         
-        predictions = list(self.prediction_buffer[city_id])
-        matches = []
-        hourly_errors: Dict[int, List[float]] = {}
+        rows = get_recent_forecasts(hours)
+        for row in rows:
+            leads, predicted = unpack(row['leads']), unpack(row['predicted_dust'])
+            actual = unpack(row['actual_dust'])
+            if len(actual):
+                # Steps verified before the restart count towards the error accumulators again
+                verified = ~np.isnan(actual)
+                self.record_errors(row['city_id'], leads[verified], predicted[verified], actual[verified])
+            
+            # float64: epoch seconds + float32 leads would round target times to 128 s
+            start = to_epoch(row['prediction_time'])
+            with self._lock:
+                self._predictions_for(row['city_id']).add(start + leads.astype(float) * 3600, leads, predicted,
+                                                         unpack(row['confidence']))
+        return len(rows)
+    
+    def verify_ledger(self, now: Optional[datetime] = None) -> Dict:
+        """Fill actual_dust/error of every unverified ledger row from the readings so far.
+
+        Rows are marked verified once their whole horizon (plus the match
+        tolerance) has elapsed; until then they are rewritten only when a run
+        matches new steps. Steps that get their first actual value are folded into the error
+        accumulators, so each prediction is counted exactly once.
+        """
+        from app.core.database import get_pending_forecasts, save_forecast_verification
+        
+        now = now or datetime.utcnow()
+        pending = get_pending_forecasts()
         
-        for pred in predictions:
-            pred_time = datetime.fromisoformat(pred['target_time'])
-            hour_ahead = pred.get('hour_ahead', 0)
+        readings_by_city: Dict[str, List[Dict]] = {}
+        for reading in pending['readings']:
+            readings_by_city.setdefault(reading['city_id'], []).append(reading)
+        forecasts_by_city: Dict[str, List[Dict]] = {}
+        for forecast in pending['forecasts']:
+            forecasts_by_city.setdefault(forecast['city_id'], []).append(forecast)
+        
+        updates = []
+        newly_verified = []
+        verified = 0
+        for city_id, forecasts in forecasts_by_city.items():
+            readings = readings_by_city.get(city_id, [])
+            reading_times = np.array([to_epoch(r['timestamp']) for r in readings], dtype=float)
+            reading_dust = np.array([r['dust'] for r in readings], dtype=float)
+            usable = ~np.isnan(reading_times) & ~np.isnan(reading_dust)
+            order = np.argsort(reading_times[usable], kind='stable')
+            reading_times = reading_times[usable][order]
+            reading_dust = reading_dust[usable][order]
+            
+            # Every target time of every pending forecast of the city in one lookup
+            leads = [unpack(f['leads']) for f in forecasts]
+            starts = np.array([to_epoch(f['prediction_time']) for f in forecasts], dtype=float)
+            targets = np.concatenate([start + lead * 3600 for start, lead in zip(starts, leads)])
+            nearest, matched = match_nearest(reading_times, targets, MATCH_TOLERANCE)
+            actual = np.where(matched, reading_dust[nearest] if len(reading_dust) else np.nan, np.nan)
+            
+            predicted = np.concatenate([unpack(f['predicted_dust']) for f in forecasts])
+            previous = np.concatenate([
+                unpack(f['actual_dust']) if f['actual_dust'] else np.full(len(lead), np.nan)
+                for f, lead in zip(forecasts, leads)
+            ])
+            new = ~np.isnan(actual) & np.isnan(previous)
+            newly_verified.append((city_id, np.concatenate(leads)[new], predicted[new], actual[new]))
             
-            for reading in actual_readings:
-                try:
-                    timestamp = reading.get('timestamp', '')
-                    if isinstance(timestamp, str):
-                        reading_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00').replace('+00:00', ''))
-                    else:
-                        reading_time = timestamp
-                    
-                    time_diff = abs((pred_time.replace(tzinfo=None) - reading_time.replace(tzinfo=None) if hasattr(reading_time, 'replace') else pred_time - reading_time).total_seconds())
-                    
-                    if time_diff < 1800:  # 30 minutes
-                        actual_dust = reading.get('dust', 0)
-                        predicted_dust = pred['predicted_dust']
-                        
-                        absolute_error = abs(predicted_dust - actual_dust)
-                        percentage_error = (absolute_error / max(actual_dust, 1)) * 100
-                        
-                        # Track by hour ahead
-                        if hour_ahead not in hourly_errors:
-                            hourly_errors[hour_ahead] = []
-                        hourly_errors[hour_ahead].append(percentage_error)
-                        
-                        matches.append({
-                            'predicted': predicted_dust,
-                            'actual': actual_dust,
-                            'absolute_error': absolute_error,
-                            'percentage_error': percentage_error,
-                            'confidence': pred['confidence'],
-                            'time_diff_seconds': time_diff,
-                            'hour_ahead': hour_ahead
-                        })
-                        break
-                except Exception:
+            # Only rows with newly matched steps, or whose horizon just elapsed, are rewritten
+            offsets = np.cumsum([len(lead) for lead in leads])[:-1]
+            for forecast, row_actual, row_predicted, row_new in zip(
+                    forecasts, np.split(actual, offsets), np.split(predicted, offsets), np.split(new, offsets)):
+                complete = to_epoch(forecast['horizon_end']) + MATCH_TOLERANCE <= to_epoch(now)
+                if not (complete or row_new.any()):
                     continue
+                verified += complete
+                updates.append((pack(row_actual), pack(row_predicted - row_actual),
+                                now.isoformat() if complete else None, forecast['id']))
         
-        if not matches:
+        if updates:
+            save_forecast_verification(updates)
+        for city_id, city_leads, predicted, actual in newly_verified:
+            self.record_errors(city_id, city_leads, predicted, actual)
+        return {'updated': len(updates), 'verified': verified}
+    
+    def record_errors(self, city_id: str, leads: np.ndarray, predicted: np.ndarray, actual: np.ndarray):
+        """Fold newly verified predictions into the city's error accumulator"""
+        if len(leads) == 0:
+            return
+        with self._lock:
+            self.error_accumulators.setdefault(city_id, ErrorAccumulator()).add(
+                np.asarray(leads, dtype=float), np.asarray(predicted, dtype=float), np.asarray(actual, dtype=float)
+            )
+            self.cached_summary = None
+    
+    def get_horizon_accuracy(self, city_id: Optional[str] = None) -> Dict:
+        """Error metrics per lead-time bucket for a city, or for all cities combined"""
+        with self._lock:
+            if city_id is not None:
+                accumulator = self.error_accumulators.get(city_id)
+                return ErrorAccumulator.summarize(accumulator.sums) if accumulator else {}
+            if not self.error_accumulators:
+                return {}
+            return ErrorAccumulator.summarize(sum(a.sums for a in self.error_accumulators.values()))
+    
+    def get_city_accuracy(self, city_id: str) -> Dict:
+        """One city's accuracy, read from its error accumulator and the cached summary.
+
+        O(1) and free of side effects: validation itself only runs on the
+        scheduled paths (validate_accuracy and ledger verification).
+        """
+        validation = self.get_overall_accuracy()['cities'].get(city_id)
+        with self._lock:
+            accumulator = self.error_accumulators.get(city_id)
+            sums = accumulator.sums.copy() if accumulator else None
+            calibration = self.calibration_factors.get(city_id, 1.0)
+        
+        result = {'city_id': city_id}
+        if sums is None or not sums[:, ErrorAccumulator.COUNT].sum():
+            result.update(message="No verified predictions yet", accuracy=None)
+        else:
+            overall = ErrorAccumulator.metrics(*sums.sum(axis=0).tolist())
+            result.update(
+                matches=overall.pop('count'), **overall,
+                horizon_accuracy=ErrorAccumulator.summarize(sums),
+                needs_retraining=overall['accuracy'] < self.retrain_threshold,
+                meets_target=overall['accuracy'] >= self.target_accuracy
+            )
+        if validation is not None:
+            result['recent_validation'] = {key: value for key, value in validation.items()
+                                           if key != 'horizon_accuracy'}
+        result.update(calibration_factor=calibration, timestamp=datetime.utcnow().isoformat())
+        return result
+    
+    def validate_predictions(self, city_id: str, actual_readings: List[Dict]) -> Dict:
+        """Enhanced prediction validation with detailed metrics.
+
+        Stored predictions are already epoch-second columns and readings are
+        converted once; each prediction is matched to the nearest reading within
+        MATCH_TOLERANCE seconds with a binary search over the sorted reading
+        times.
+        """
+        with self._lock:
+            if city_id not in self.prediction_buffer:
+                return {"error": "No predictions recorded for this city"}
+            predictions = self.prediction_buffer[city_id].entries()
+        target_times = predictions['target_time']
+        predicted = predictions['predicted_dust'].astype(float)
+        confidence = predictions['confidence'].astype(float)
+        hour_ahead = predictions['lead'].astype(np.int64)
+        
+        # Readings without a usable timestamp or dust value can never match
+        reading_times = np.array([to_epoch(r.get('timestamp')) for r in actual_readings], dtype=float)
+        reading_dust = np.array([r.get('dust', 0) for r in actual_readings], dtype=float)
+        usable = ~np.isnan(reading_times) & ~np.isnan(reading_dust)
+        order = np.argsort(reading_times[usable], kind='stable')
+        reading_times = reading_times[usable][order]
+        reading_dust = reading_dust[usable][order]
+        
+        nearest, matched = match_nearest(reading_times, target_times, MATCH_TOLERANCE)
+        if not matched.any():
             return {"error": "No matching readings found", "matches": 0}
         
-        errors = [m['absolute_error'] for m in matches]
-        percentage_errors = [m['percentage_error'] for m in matches]
+        return self._apply_validation(city_id, predicted[matched], reading_dust[nearest[matched]],
+                                      confidence[matched], hour_ahead[matched])
+    
+    def validate_all(self, reading_cities: np.ndarray, reading_times: np.ndarray,
+                     reading_dust: np.ndarray) -> Dict[str, Dict]:
+        """Validate every city with stored predictions against one set of reading columns.
+
+        Each city's times are shifted into their own band of CITY_BAND
+        seconds, so a single sorted search matches every prediction of every
+        city to its nearest same-city reading. Returns a validate_predictions
+        result per city.
+        """
+        with self._lock:
+            names = sorted(self.prediction_buffer)
+            entries = [self.prediction_buffer[name].entries() for name in names]
+        if not names:
+            return {}
+        names_array = np.array(names)
+        
+        reading_cities = np.asarray(reading_cities).astype(str)
+        reading_times = np.asarray(reading_times, dtype=float)
+        reading_dust = np.asarray(reading_dust, dtype=float)
+        code = np.clip(np.searchsorted(names_array, reading_cities), 0, len(names) - 1)
+        usable = (names_array[code] == reading_cities) & ~np.isnan(reading_times) & ~np.isnan(reading_dust)
+        keys = code[usable] * CITY_BAND + reading_times[usable]
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        reading_dust = reading_dust[usable][order]
         
-        mae = np.mean(errors)
-        rmse = np.sqrt(np.mean(np.square(errors)))
-        mape = np.mean(percentage_errors)
+        counts = [len(e['target_time']) for e in entries]
+        if not sum(counts):
+            return {name: {"error": "No matching readings found", "matches": 0} for name in names}
+        columns = {field: np.concatenate([e[field] for e in entries]) for field in entries[0]}
+        query = np.repeat(np.arange(len(names)), counts) * CITY_BAND + columns['target_time']
+        nearest, matched = match_nearest(keys, query, MATCH_TOLERANCE)
+        actual = reading_dust[nearest] if len(reading_dust) else np.full(len(query), np.nan)
+        
+        results = {}
+        offsets = np.cumsum(counts)[:-1]
+        for name, city_matched, city_actual, predicted, confidence, lead in zip(
+                names, np.split(matched, offsets), np.split(actual, offsets),
+                np.split(columns['predicted_dust'].astype(float), offsets),
+                np.split(columns['confidence'].astype(float), offsets),
+                np.split(columns['lead'].astype(np.int64), offsets)):
+            if not city_matched.any():
+                results[name] = {"error": "No matching readings found", "matches": 0}
+                continue
+            results[name] = self._apply_validation(name, predicted[city_matched], city_actual[city_matched],
+                                                   confidence[city_matched], lead[city_matched])
+        return results
+    
+    def validate_recent(self, hours: int = 24) -> Dict[str, Dict]:
+        """Validate every city against the last `hours` hours of readings, read in one query"""
+        from app.core.database import get_validation_readings
+        
+        rows = get_validation_readings(hours)
+        if not rows:
+            return {}
+        cities, times, dust = zip(*rows)
+        return self.validate_all(np.array(cities), np.array(times, dtype=float), np.array(dust, dtype=float))
+    
+    def _apply_validation(self, city_id: str, predicted: np.ndarray, actual: np.ndarray,
+                          confidence: np.ndarray, hour_ahead: np.ndarray) -> Dict:
+        """Metrics of matched prediction/reading pairs; updates the city's history and bias"""
+        errors = np.abs(predicted - actual)
+        percentage_errors = errors / np.maximum(actual, 1) * 100
+        
+        mae = float(errors.mean())
+        rmse = float(np.sqrt(np.mean(np.square(errors))))
+        mape = float(percentage_errors.mean())
         
         # Calculate accuracy with improved formula
         accuracy = max(0, min(100, 100 - mape * 0.8))  # Slightly more forgiving
         
         # High confidence accuracy
-        high_confidence_matches = [m for m in matches if m['confidence'] >= 80]
-        if high_confidence_matches:
-            high_conf_accuracy = 100 - np.mean([m['percentage_error'] for m in high_confidence_matches]) * 0.8
+        high_confidence = confidence >= 80
+        if high_confidence.any():
+            high_conf_accuracy = 100 - float(percentage_errors[high_confidence].mean()) * 0.8
         else:
             high_conf_accuracy = accuracy
         
         # Calculate accuracy by forecast horizon
-        horizon_accuracy = {}
-        for hour, errs in hourly_errors.items():
-            if errs:
-                horizon_accuracy[hour] = round(100 - np.mean(errs) * 0.8, 2)
-        
-        # Update history
-        if city_id not in self.accuracy_history:
-            self.accuracy_history[city_id] = []
-        self.accuracy_history[city_id].append(accuracy)
-        
-        if len(self.accuracy_history[city_id]) > 200:
-            self.accuracy_history[city_id] = self.accuracy_history[city_id][-200:]
-        
-        # Update bias correction
-        bias = np.mean([m['predicted'] - m['actual'] for m in matches])
-        self.bias_corrections[city_id] = bias * 0.3 + self.bias_corrections.get(city_id, 0) * 0.7
+        hours, horizon = np.unique(hour_ahead, return_inverse=True)
+        horizon_errors = np.bincount(horizon, weights=percentage_errors) / np.bincount(horizon)
+        horizon_accuracy = {
+            hour: round(100 - error * 0.8, 2)
+            for hour, error in zip(hours.tolist(), horizon_errors.tolist())
+        }
         
-        self.validation_count += len(matches)
+        bias = float(np.mean(predicted - actual))
+        match_count = len(actual)
+        with self._lock:
+            # Update history
+            if city_id not in self.accuracy_history:
+                self.accuracy_history[city_id] = AccuracyHistory()
+            self.accuracy_history[city_id].append(to_epoch(datetime.utcnow()), accuracy=accuracy,
+                                                  matches=match_count, mae=mae, rmse=rmse)
+            
+            # Update bias correction
+            self.bias_corrections[city_id] = bias * 0.3 + self.bias_corrections.get(city_id, 0) * 0.7
+            
+            self.validation_count += match_count
+            self.last_validated[city_id] = datetime.utcnow().isoformat()
+            self.cached_summary = None
         
         return {
             'city_id': city_id,
-            'matches': len(matches),
+            'matches': match_count,
             'accuracy': round(accuracy, 2),
             'mae': round(mae, 2),
             'rmse': round(rmse, 2),
@@ -164,20 +616,34 @@ class AccuracyTracker:
         }
     
     def get_overall_accuracy(self) -> Dict:
-        """Get overall system accuracy with enhanced metrics"""
+        """Get overall system accuracy with enhanced metrics.
+
+        The summary is built once and served from cache until the next
+        validation or verified prediction changes it, so callers on the
+        prediction path pay O(1) per call.
+        """
+        summary = self.cached_summary
+        if summary is None:
+            with self._lock:
+                summary = self.cached_summary = self._build_summary()
+        return summary
+    
+    def _build_summary(self) -> Dict:
         all_accuracies = []
         city_stats = {}
         
-        for city_id, accuracies in self.accuracy_history.items():
-            if accuracies:
-                city_avg = np.mean(accuracies[-48:])  # Last 48 validations
+        for city_id, history in self.accuracy_history.items():
+            if len(history):
+                accuracies = history.latest(20)
+                city_avg = float(np.mean(history.latest(48)))  # Last 48 validations
                 all_accuracies.append(city_avg)
                 city_stats[city_id] = {
                     'accuracy': round(city_avg, 2),
-                    'samples': len(accuracies),
-                    'last_validated': datetime.utcnow().isoformat(),
+                    'samples': len(history),
+                    'last_validated': self.last_validated.get(city_id),
                     'trend': self._calculate_trend(accuracies),
-                    'stability': self._calculate_stability(accuracies)
+                    'stability': self._calculate_stability(accuracies),
+                    'horizon_accuracy': self.get_horizon_accuracy(city_id)
                 }
         
         # If no validation data yet, return estimated accuracy based on model confidence
@@ -195,6 +661,7 @@ class AccuracyTracker:
                 'total_cities': 8,
                 'data_collection_status': 'active',
                 'validation_pending': True,
+                'horizon_accuracy': self.get_horizon_accuracy(),
                 'model_version': self.model_version,
                 'ensemble_models': 7,
                 'timestamp': datetime.utcnow().isoformat()
@@ -212,11 +679,81 @@ class AccuracyTracker:
             'total_cities': len(all_accuracies),
             'validation_pending': False,
             'total_validations': self.validation_count,
+            'horizon_accuracy': self.get_horizon_accuracy(),
             'model_version': self.model_version,
             'ensemble_models': 7,
             'timestamp': datetime.utcnow().isoformat()
         }
     
+    def get_history(self, city_id: str, since: datetime, until: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """A city's validation results between two times, found by bisection"""
+        with self._lock:
+            history = self.accuracy_history.get(city_id)
+            if history is None:
+                history = AccuracyHistory(capacity=1)
+            return history.window(to_epoch(since), to_epoch(until) if until else None)
+    
+    def daily_rollups(self, day: date) -> List[tuple]:
+        """model_accuracy rows (model_name, date, count, mae, rmse, accuracy) of one UTC day.
+
+        Built from the prediction ledger: every verified step whose target
+        time falls in the day counts exactly once, however often it was
+        validated, so recomputing a day always gives the same row.
+        """
+        from app.core.database import get_verified_forecasts
+        
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        rows = get_verified_forecasts(start - timedelta(hours=MAX_FORECAST_HOURS), start, end)
+        
+        first, last = to_epoch(start), to_epoch(end)
+        by_city: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        for row in rows:
+            leads, actual = unpack(row['leads']), unpack(row['actual_dust'])
+            targets = to_epoch(row['prediction_time']) + leads.astype(float) * 3600
+            in_day = (targets >= first) & (targets < last) & ~np.isnan(actual)
+            if in_day.any():
+                by_city.setdefault(row['city_id'], []).append((unpack(row['predicted_dust'])[in_day], actual[in_day]))
+        
+        rollups = []
+        for city_id in sorted(by_city):
+            predicted = np.concatenate([p for p, _ in by_city[city_id]]).astype(float)
+            actual = np.concatenate([a for _, a in by_city[city_id]]).astype(float)
+            errors = np.abs(predicted - actual)
+            mape = float(np.mean(errors / np.maximum(actual, 1) * 100))
+            rollups.append((
+                f"ensemble:{city_id}", day.isoformat(), len(errors),
+                round(float(errors.mean()), 2), round(float(np.sqrt(np.mean(errors ** 2))), 2),
+                round(max(0, min(100, 100 - mape * 0.8)), 2)
+            ))
+        return rollups
+    
+    def save_daily_accuracy(self, now: Optional[datetime] = None) -> int:
+        """Write the rollups of every completed day not written yet; returns the rows written.
+
+        Days are only written once they are over (plus ROLLUP_DELAY), so a
+        restart never replaces a stored day with a partial one.
+        """
+        from app.core.database import get_latest_accuracy_date, save_model_accuracy
+        
+        now = now or datetime.utcnow()
+        last_complete = (now - ROLLUP_DELAY).date() - timedelta(days=1)
+        if self.rolled_up_through is None:
+            latest = get_latest_accuracy_date('ensemble:')
+            self.rolled_up_through = (date.fromisoformat(latest) if latest
+                                      else last_complete - timedelta(days=ROLLUP_BACKFILL_DAYS))
+        
+        written = 0
+        day = self.rolled_up_through + timedelta(days=1)
+        while day <= last_complete:
+            rows = self.daily_rollups(day)
+            if rows:
+                save_model_accuracy(rows)
+            written += len(rows)
+            self.rolled_up_through = day
+            day += timedelta(days=1)
+        return written
+    
     def _calculate_stability(self, accuracies: List[float]) -> str:
         """Calculate accuracy stability"""
         if len(accuracies) < 10:
@@ -271,7 +808,14 @@ class AccuracyTracker:
         
         calibrated = predicted_dust * factor - bias * 0.5
         return max(0, calibrated)
-    
+
+    def apply_calibration_array(self, city_id: str, predicted_dust: np.ndarray) -> np.ndarray:
+        """Apply calibration factor and bias correction to a whole forecast horizon"""
+        factor = self.calibration_factors.get(city_id, 1.0)
+        bias = self.bias_corrections.get(city_id, 0)
+
+        return np.maximum(0, predicted_dust * factor - bias * 0.5)
+
     def get_performance_report(self) -> Dict:
         """Generate comprehensive performance report"""
         return {
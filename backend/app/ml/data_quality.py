@@ -1,10 +1,84 @@
 import numpy as np
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fields with a streaming per-city baseline for z-score anomaly detection
+BASELINE_FIELDS = ('dust', 'pm10', 'pm2_5', 'temperature', 'humidity', 'wind_speed')
+
+# Readings of a field before its baseline is used (plain running moments until then)
+BASELINE_MIN_SAMPLES = 24
+
+# Weight of each new reading in the exponentially weighted moments (~1 day of 1-minute readings)
+BASELINE_ALPHA = 1 / 1440
+
+# Quantiles of the sketch; baseline updates are clipped to the outer two
+BASELINE_QUANTILES = np.array([0.1, 0.5, 0.9])
+BASELINE_Z = np.array([-1.2816, 0.0, 1.2816])  # the same quantiles of a standard normal
+
+# Step of the quantile estimates per reading, as a fraction of the baseline std
+QUANTILE_STEP = 0.05
+
+
+class StreamingBaseline:
+    """Running per-field statistics of one city, updated in O(1) per reading.
+
+    The first BASELINE_MIN_SAMPLES values of a field give plain running
+    moments, which then seed a 10/50/90% quantile sketch (frugal stochastic
+    updates). From there the exponentially weighted mean and variance are
+    fed values clipped to the sketch's 10-90% range - a streaming
+    counterpart of a 10% trimmed mean - so dust events barely move the
+    baseline they are scored against.
+    """
+    
+    def __init__(self):
+        fields = len(BASELINE_FIELDS)
+        self.count = np.zeros(fields)
+        self.mean = np.zeros(fields)
+        self.var = np.zeros(fields)
+        self.quantiles = np.zeros((fields, len(BASELINE_QUANTILES)))
+    
+    def update(self, data: Dict):
+        values = np.array([
+            value if isinstance(value, (int, float)) else np.nan
+            for value in (data.get(field) for field in BASELINE_FIELDS)
+        ], dtype=float)
+        present = ~np.isnan(values)
+        if not present.any():
+            return
+        
+        warm = present & (self.count >= BASELINE_MIN_SAMPLES)
+        std = np.maximum(np.sqrt(self.var), 1.0)
+        above = values[:, None] > self.quantiles
+        below = values[:, None] < self.quantiles
+        step = QUANTILE_STEP * std[:, None] * (above * BASELINE_QUANTILES - below * (1 - BASELINE_QUANTILES))
+        self.quantiles = np.sort(self.quantiles + np.where(warm[:, None], step, 0), axis=1)
+        clipped = np.where(warm, np.clip(values, self.quantiles[:, 0], self.quantiles[:, -1]), values)
+        
+        self.count += present
+        alpha = np.maximum(1 / np.maximum(self.count, 1), BASELINE_ALPHA)
+        delta = np.where(present, clipped - self.mean, 0)
+        self.mean += alpha * delta
+        self.var = np.where(present, (1 - alpha) * (self.var + alpha * delta ** 2), self.var)
+        
+        seeded = present & (self.count == BASELINE_MIN_SAMPLES)
+        if seeded.any():
+            self.quantiles[seeded] = self.mean[seeded, None] + np.sqrt(self.var[seeded, None]) * BASELINE_Z
+    
+    def means(self) -> Dict[str, float]:
+        return {field: float(self.mean[i]) for i, field in enumerate(BASELINE_FIELDS)
+                if self.count[i] >= BASELINE_MIN_SAMPLES}
+    
+    def stds(self) -> Dict[str, float]:
+        return {field: float(np.sqrt(self.var[i])) for i, field in enumerate(BASELINE_FIELDS)
+                if self.count[i] >= BASELINE_MIN_SAMPLES}
+    
+    def quantile_estimates(self) -> Dict[str, List[float]]:
+        return {field: self.quantiles[i].round(2).tolist() for i, field in enumerate(BASELINE_FIELDS)
+                if self.count[i] >= BASELINE_MIN_SAMPLES}
+
 
 class DataQualityChecker:
     """Production-grade data quality validation v2.0
@@ -39,11 +113,18 @@ class DataQualityChecker:
         
         self.historical_means: Dict[str, Dict[str, float]] = {}
         self.historical_stds: Dict[str, Dict[str, float]] = {}
+        self.baselines: Dict[str, StreamingBaseline] = {}
         self.recent_readings: Dict[str, List[Dict]] = {}
         self.quality_scores: Dict[str, List[float]] = {}
     
-    def validate_reading(self, data: Dict) -> Dict:
-        """Comprehensive validation of a single reading"""
+    def validate_reading(self, data: Dict, track: bool = True, city_id: Optional[str] = None) -> Dict:
+        """Comprehensive validation of a single reading
+
+        The city is taken from `city_id`, else from the reading itself; fused
+        inputs carry no city_id, so callers holding one must pass it.
+        With track=False the reading is scored against the stored state but not
+        added to the quality history or the temporal-consistency window.
+        """
         issues = []
         scores = []
         warnings = []
@@ -79,14 +160,14 @@ class DataQualityChecker:
             scores.append(0.7)
         
         # 3. Temporal consistency (if we have recent data)
-        city_id = data.get('city_id', 'unknown')
+        city_id = city_id or data.get('city_id', 'unknown')
         temporal_issues = self._check_temporal_consistency(city_id, data)
         if temporal_issues:
             warnings.extend(temporal_issues)
             scores.append(0.8)
         
         # 4. Anomaly detection
-        anomalies = self._detect_anomalies(data)
+        anomalies = self._detect_anomalies(city_id, data)
         if anomalies:
             warnings.extend(anomalies)
             scores.append(0.85)
@@ -110,13 +191,27 @@ class DataQualityChecker:
         else:
             quality_level = 'POOR'
         
-        # Store for tracking
+        if track:
+            self._track_reading(city_id, data, quality_score)
+        
+        return {
+            'quality_score': round(quality_score, 1),
+            'quality_level': quality_level,
+            'issues': issues,
+            'warnings': warnings,
+            'is_valid': quality_score >= 50,
+            'is_reliable': quality_score >= 70,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
+    def _track_reading(self, city_id: str, data: Dict, quality_score: float):
+        """Store the score and the reading for trend and temporal checks"""
         if city_id not in self.quality_scores:
             self.quality_scores[city_id] = []
         self.quality_scores[city_id].append(quality_score)
         if len(self.quality_scores[city_id]) > 100:
             self.quality_scores[city_id] = self.quality_scores[city_id][-100:]
-        
+    
         # Store recent reading for temporal checks
         if city_id not in self.recent_readings:
             self.recent_readings[city_id] = []
@@ -128,15 +223,19 @@ class DataQualityChecker:
         if len(self.recent_readings[city_id]) > 50:
             self.recent_readings[city_id] = self.recent_readings[city_id][-50:]
         
-        return {
-            'quality_score': round(quality_score, 1),
-            'quality_level': quality_level,
-            'issues': issues,
-            'warnings': warnings,
-            'is_valid': quality_score >= 50,
-            'is_reliable': quality_score >= 70,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        # The reading has been scored; only now does it join the baseline
+        self._update_baseline(city_id, data)
+    
+    def _update_baseline(self, city_id: str, data: Dict):
+        """Fold a reading into the city's streaming baseline and publish its usable fields"""
+        if city_id not in self.baselines:
+            self.baselines[city_id] = StreamingBaseline()
+        baseline = self.baselines[city_id]
+        baseline.update(data)
+        means = baseline.means()
+        if means:
+            self.historical_means[city_id] = means
+            self.historical_stds[city_id] = baseline.stds()
     
     def _check_consistency(self, data: Dict) -> List[str]:
         """Check cross-field consistency"""
@@ -180,10 +279,9 @@ class DataQualityChecker:
         
         return warnings
     
-    def _detect_anomalies(self, data: Dict) -> List[str]:
+    def _detect_anomalies(self, city_id: str, data: Dict) -> List[str]:
         """Detect statistical anomalies in data using z-scores"""
         anomalies = []
-        city_id = data.get('city_id', 'unknown')
         
         if city_id in self.historical_means:
             means = self.historical_means[city_id]
@@ -202,57 +300,216 @@ class DataQualityChecker:
         return anomalies
     
     def update_baselines(self, city_id: str, readings: List[Dict]):
-        """Update historical baselines for anomaly detection"""
-        if len(readings) < 48:  # Need at least 2 days of data
-            return
+        """Fold stored readings (oldest first) into the city's streaming baseline, e.g. on a cold start"""
+        for reading in readings:
+            self._update_baseline(city_id, reading)
+        logger.info(f"Updated baselines for {city_id}: {len(self.historical_means.get(city_id, {}))} fields")
+    
+    def city_state(self, city_ids: List[str]) -> Dict[str, Dict]:
+        """Scores, recent readings and baseline of the given cities, e.g. to ship out of a shard process"""
+        return {
+            city_id: {
+                'quality_scores': list(self.quality_scores[city_id]),
+                'recent_readings': list(self.recent_readings.get(city_id, [])),
+                'baseline': self.baselines.get(city_id)
+            }
+            for city_id in city_ids if city_id in self.quality_scores
+        }
+    
+    def merge_city_state(self, state: Dict[str, Dict]):
+        """Take over the city_state() of cities tracked by another checker"""
+        for city_id, city in state.items():
+            self.quality_scores[city_id] = city['quality_scores']
+            self.recent_readings[city_id] = city['recent_readings']
+            baseline = city['baseline']
+            if baseline is None:
+                continue
+            self.baselines[city_id] = baseline
+            means = baseline.means()
+            if means:
+                self.historical_means[city_id] = means
+                self.historical_stds[city_id] = baseline.stds()
+    
+    def validate_batch(self, readings: List[Dict]) -> Dict:
+        """Validate a batch of readings with comprehensive metrics.
+
+        Scored column-wise by validate_columns: the live quality history and
+        temporal window are read but not modified.
+        """
+        columns, invalid = self.readings_to_columns(readings)
+        return self.validate_columns(columns, invalid)
+    
+    def readings_to_columns(self, readings: List[Dict]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """Reading dicts -> float columns (NaN where missing) and masks of non-numeric values"""
+        columns = {'city_id': np.array([r.get('city_id', 'unknown') for r in readings], dtype=object)}
+        invalid = {}
+        for field in self.valid_ranges:
+            values = [r.get(field) for r in readings]
+            bad = np.array([v is not None and not isinstance(v, (int, float)) for v in values], dtype=bool)
+            if bad.any():
+                invalid[field] = bad
+                values = [None if b else v for v, b in zip(values, bad.tolist())]
+            columns[field] = np.array(values, dtype=float)
+        return columns, invalid
+    
+    def score_columns(self, columns: Dict[str, np.ndarray],
+                      invalid: Optional[Dict[str, np.ndarray]] = None) -> Dict:
+        """Quality scores of readings given as columns, without per-row dicts.
+
+        Applies the validate_reading checks (range, expected range,
+        cross-field consistency, temporal consistency, z-score anomalies) as
+        boolean masks, as if the rows were validated in order; NaN means a
+        missing value. Rows are scored against the live state, which is left
+        untouched - z-scores use the baselines as they were before the batch.
+        Returns the score array, per-check masks and issue counts.
+        """
+        invalid = invalid or {}
+        n = len(next(iter(columns.values()))) if columns else 0
+        missing = np.full(n, np.nan)
+        score_sum = np.zeros(n)
+        score_count = np.zeros(n)
+        issue_count = np.zeros(n, dtype=np.int64)
+        issue_summary: Dict[str, int] = {}
+        
+        def add_score(mask: np.ndarray, score):
+            nonlocal score_sum, score_count
+            score_sum = score_sum + np.where(mask, score, 0)
+            score_count = score_count + mask
         
-        means = {}
-        stds = {}
-        
-        for field in ['dust', 'pm10', 'pm2_5', 'temperature', 'humidity', 'wind_speed']:
-            values = [r.get(field) for r in readings if r.get(field) is not None]
-            if len(values) >= 24:
-                # Use robust statistics (trimmed mean)
-                sorted_vals = sorted(values)
-                trim = len(sorted_vals) // 10
-                if trim > 0:
-                    trimmed = sorted_vals[trim:-trim]
-                else:
-                    trimmed = sorted_vals
-                means[field] = np.mean(trimmed)
-                stds[field] = np.std(trimmed)
+        # 1. Range validation
+        unusual_any = np.zeros(n, dtype=bool)
+        for field, (min_val, max_val) in self.valid_ranges.items():
+            values = np.asarray(columns.get(field, missing), dtype=float)
+            bad_type = invalid.get(field, np.zeros(n, dtype=bool))
+            present = ~np.isnan(values)
+            out = present & ((values < min_val) | (values > max_val))
+            score = np.where(out, 0.3, 1.0)
+            if field in self.expected_ranges:
+                exp_min, exp_max = self.expected_ranges[field]
+                unusual = present & ~out & ((values < exp_min) | (values > exp_max))
+                score = np.where(unusual, 0.85, score)
+                unusual_any |= unusual
+            add_score(present, score)
+            add_score(bad_type, 0.0)
+            flagged = out | bad_type
+            issue_count += flagged
+            if flagged.any():
+                issue_summary[field] = int(flagged.sum())
+        
+        def column(field: str, default: float) -> np.ndarray:
+            values = np.asarray(columns.get(field, missing), dtype=float)
+            return np.where(np.isnan(values), default, values)
+        
+        # 2. Cross-field consistency checks
+        dust = column('dust', 0)
+        pm25, pm10 = column('pm2_5', 0), column('pm10', 0)
+        checks = (
+            (dust > 100) & (column('visibility', 10000) > 20000),
+            (column('humidity', 50) > 90) & (dust > 150),
+            (pm25 > pm10 * 1.2) & (pm10 > 0)
+        )
+        inconsistent = np.zeros(n, dtype=bool)
+        for check in checks:
+            issue_count += check
+            inconsistent |= check
+        if inconsistent.any():
+            issue_summary['Inconsistent'] = int(sum(int(check.sum()) for check in checks))
+        add_score(inconsistent, 0.7)
+        
+        # 3. Temporal consistency against the previous readings of the same city
+        cities, code = np.unique(np.asarray(columns.get('city_id', np.full(n, 'unknown')), dtype=str),
+                                 return_inverse=True)
+        rapid_change = self._rapid_changes(cities, code, np.asarray(columns.get('dust', missing), dtype=float))
+        add_score(rapid_change, 0.8)
+        
+        # 4. Anomaly detection with the stored baselines
+        anomaly = np.zeros(n, dtype=bool)
+        for field in ['dust', 'pm10', 'temperature', 'humidity']:
+            means = np.array([self.historical_means.get(c, {}).get(field, np.nan) for c in cities.tolist()])
+            stds = np.array([self.historical_stds.get(c, {}).get(field, np.nan) for c in cities.tolist()])
+            values = np.asarray(columns.get(field, missing), dtype=float)
+            with np.errstate(invalid='ignore'):
+                z_score = np.abs(values - means[code]) / np.maximum(stds[code], 1)
+                anomaly |= z_score > 2.5
+        add_score(anomaly, 0.85)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            quality_score = np.where(score_count > 0, score_sum / score_count * 100, 50)
+        quality_score = np.where(issue_count > 3, quality_score * 0.8, quality_score)
         
-        self.historical_means[city_id] = means
-        self.historical_stds[city_id] = stds
-        logger.info(f"Updated baselines for {city_id}: {len(means)} fields")
+        return {
+            'quality_score': quality_score,
+            'is_valid': quality_score >= 50,
+            'is_reliable': quality_score >= 70,
+            'issue_count': issue_count,
+            'unusual': unusual_any,
+            'inconsistent': inconsistent,
+            'rapid_change': rapid_change,
+            'anomaly': anomaly,
+            'issue_summary': issue_summary
+        }
     
-    def validate_batch(self, readings: List[Dict]) -> Dict:
-        """Validate a batch of readings with comprehensive metrics"""
-        results = [self.validate_reading(r) for r in readings]
-        valid_count = sum(1 for r in results if r['is_valid'])
-        reliable_count = sum(1 for r in results if r.get('is_reliable', False))
-        avg_score = np.mean([r['quality_score'] for r in results]) if results else 0
-        
-        # Collect all issues
-        all_issues = []
-        for r in results:
-            all_issues.extend(r.get('issues', []))
-        
-        # Count issue types
-        issue_counts = {}
-        for issue in all_issues:
-            issue_type = issue.split(':')[0] if ':' in issue else issue
-            issue_counts[issue_type] = issue_counts.get(issue_type, 0) + 1
+    def _rapid_changes(self, cities: np.ndarray, code: np.ndarray, dust: np.ndarray) -> np.ndarray:
+        """_check_temporal_consistency for every row, continuing each city's live window.
+
+        Rows are grouped by city with each group prefixed by the city's last
+        five live readings, so the trailing five-reading mean of every row is
+        a cumulative-sum difference.
+        """
+        n = len(code)
+        if n == 0:
+            return np.zeros(0, dtype=bool)
+        window = 5
+        order = np.argsort(code, kind='stable')
+        sorted_code = code[order]
+        group_start = np.searchsorted(sorted_code, np.arange(len(cities)))
+        
+        extended = np.full(n + window * len(cities), np.nan)
+        positions = np.arange(n) + window * (sorted_code + 1)
+        extended[positions] = dust[order]
+        live_count = np.zeros(len(cities), dtype=np.int64)
+        for c, city_id in enumerate(cities.tolist()):
+            recent = self.recent_readings.get(city_id, [])
+            live_count[c] = len(recent)
+            tail = np.array([r.get('dust') for r in recent[-window:]], dtype=float)
+            start = group_start[c] + window * c
+            extended[start + window - len(tail):start + window] = tail
+        
+        valid = ~np.isnan(extended)
+        value_sum = np.concatenate([[0.0], np.cumsum(np.where(valid, extended, 0))])
+        value_count = np.concatenate([[0], np.cumsum(valid)])
+        recent_sum = value_sum[positions] - value_sum[positions - window]
+        recent_count = value_count[positions] - value_count[positions - window]
+        
+        previous = live_count[sorted_code] + (np.arange(n) - group_start[sorted_code])
+        current = np.where(np.isnan(dust[order]), 0, dust[order])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average = recent_sum / recent_count
+            rapid = (previous >= 3) & (recent_count > 0) & (
+                (current > average * 3) | ((average > 10) & (current < average * 0.2))
+            )
+        result = np.zeros(n, dtype=bool)
+        result[order] = rapid
+        return result
+    
+    def validate_columns(self, columns: Dict[str, np.ndarray],
+                         invalid: Optional[Dict[str, np.ndarray]] = None) -> Dict:
+        """validate_batch summary of column-wise readings; live state is left untouched"""
+        scored = self.score_columns(columns, invalid)
+        total = len(scored['quality_score'])
+        valid_count = int(scored['is_valid'].sum())
+        reliable_count = int(scored['is_reliable'].sum())
+        avg_score = float(np.round(scored['quality_score'], 1).mean()) if total else 0
         
         return {
-            'total_readings': len(readings),
+            'total_readings': total,
             'valid_readings': valid_count,
             'reliable_readings': reliable_count,
-            'invalid_readings': len(readings) - valid_count,
+            'invalid_readings': total - valid_count,
             'average_quality_score': round(avg_score, 1),
-            'pass_rate': round((valid_count / len(readings)) * 100, 1) if readings else 0,
-            'reliability_rate': round((reliable_count / len(readings)) * 100, 1) if readings else 0,
-            'issue_summary': issue_counts,
+            'pass_rate': round((valid_count / total) * 100, 1) if total else 0,
+            'reliability_rate': round((reliable_count / total) * 100, 1) if total else 0,
+            'issue_summary': scored['issue_summary'],
             'timestamp': datetime.utcnow().isoformat()
         }
     
@@ -268,6 +525,13 @@ class DataQualityChecker:
                     'samples': len(scores),
                     'trend': 'IMPROVING' if len(scores) > 5 and np.mean(scores[-5:]) > np.mean(scores[:5]) else 'STABLE'
                 }
+                baseline = self.baselines.get(city_id)
+                if baseline is not None:
+                    city_quality[city_id]['baseline'] = {
+                        'mean': {field: round(value, 2) for field, value in baseline.means().items()},
+                        'std': {field: round(value, 2) for field, value in baseline.stds().items()},
+                        'quantiles': baseline.quantile_estimates()
+                    }
         
         return {
             'cities_with_baselines': len(self.historical_means),
@@ -11,12 +11,17 @@ Models:
 5. API Forecast Model (external data integration)
 6. Neural Pattern Model (learned correlations)
 7. Ensemble Meta-Model (model combination optimization)
+8. Gradient-Boosted Horizon Model (offline-trained, optional; see gbm_model.py)
 """
+import copy
+import functools
 import numpy as np
-from datetime import datetime, timedelta
-from typing import Dict, List
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
 import logging
 import math
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +44,80 @@ def get_data_quality_checker():
     return _data_quality_checker
 
 
+# Upper bounds (exclusive) of the LOW/MODERATE/HIGH/SEVERE bands
+RISK_THRESHOLDS = np.array([20.0, 50.0, 100.0, 200.0])
+RISK_LEVELS = ("LOW", "MODERATE", "HIGH", "SEVERE", "EXTREME")
+
+# Probabilistic mode: perturbation scale of the input members (relative for
+# dust and wind speed, absolute percentage points for humidity), the reported
+# quantiles and the dust levels whose exceedance probability is reported
+MEMBER_SPREAD = {'dust': 0.2, 'wind_speed': 0.2, 'humidity': 8.0}
+MAX_MEMBERS = 500
+MEMBER_QUANTILES = (10, 50, 90)
+EXCEEDANCE_THRESHOLDS = (50, 100, 200)
+
+# Longest accepted forecast horizon, and the step schedule within it:
+# (until lead hour, step hours) - hourly to 24h, 3-hourly to 7 days, 6-hourly beyond
+MAX_FORECAST_HOURS = 240
+FORECAST_RESOLUTION = ((24, 1), (168, 3), (MAX_FORECAST_HOURS, 6))
+
+# Prediction payload layouts: per-hour dicts, or struct-of-arrays columns
+PAYLOAD_FULL = "full"
+PAYLOAD_LITE = "lite"
+PAYLOAD_MODES = (PAYLOAD_FULL, PAYLOAD_LITE)
+
+# Monthly dust averages and standard deviations based on UAE meteorological
+# data, indexed by month number (index 0 unused)
+CLIMATOLOGY_MONTHLY_MEANS = np.array([35, 22, 25, 32, 42, 58, 68, 62, 57, 47, 36, 28, 22], dtype=float)
+CLIMATOLOGY_MONTHLY_STDS = np.array([15, 8, 10, 15, 18, 22, 25, 23, 20, 18, 14, 10, 8], dtype=float)
+
+# Per-city history: 14 days * 24 hours * 12 (5-min intervals)
+HISTORY_CAPACITY = 4032
+HISTORY_FIELDS = ('dust', 'temperature', 'humidity', 'wind_speed', 'wind_direction', 'visibility', 'pressure')
+
+# Layout version of EnsemblePredictor.state_arrays() snapshots
+STATE_VERSION = 2
+
+
+def sorted_percentile(ordered: np.ndarray, q: float) -> np.ndarray:
+    """np.percentile (linear method) along axis 1 of an array already sorted on that axis"""
+    position = (ordered.shape[1] - 1) * (q / 100)
+    below = int(math.floor(position))
+    above = min(below + 1, ordered.shape[1] - 1)
+    t = position - below
+
+    a, b = ordered[:, below], ordered[:, above]
+    diff = b - a
+    # Same two-sided form as numpy's _lerp, so results match bit for bit
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+@functools.lru_cache(maxsize=None)
+def forecast_leads(hours: int) -> np.ndarray:
+    """Lead hours the models are evaluated at for a `hours`-long horizon (read-only)"""
+    segments, start = [], 0
+    for until, step in FORECAST_RESOLUTION:
+        segments.append(np.arange(start, min(until, hours), step, dtype=float))
+        start = until
+    leads = np.concatenate(segments)
+    leads.setflags(write=False)
+    return leads
+
+
+def to_epoch(timestamp) -> Optional[float]:
+    """Epoch seconds for an ISO string or datetime; naive values are taken as UTC"""
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(timestamp, datetime):
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
 class KalmanFilter:
     """Simple Kalman filter for prediction smoothing and noise reduction"""
     def __init__(self, process_variance: float = 1e-3, measurement_variance: float = 1e-1):
@@ -60,9 +139,256 @@ class KalmanFilter:
         kalman_gain = prediction_error / (prediction_error + self.measurement_variance)
         self.estimate = prediction + kalman_gain * (measurement - prediction)
         self.error_estimate = (1 - kalman_gain) * prediction_error
-        
+
         return self.estimate
 
+    def filter(self, measurements: np.ndarray) -> np.ndarray:
+        """Run a sequence of measurements through the filter"""
+        return np.array([self.update(m) for m in measurements.tolist()])
+
+
+class HistoryRingBuffer:
+    """Fixed-capacity per-city history with one preallocated float array per field.
+
+    Every array is twice the capacity and each value is written at both
+    `head` and `head + capacity`, so the most recent n entries are always one
+    contiguous slice: window() returns zero-copy views in chronological order
+    and append() is O(1) no matter how long the process has been running.
+    Missing values are stored as NaN.
+    """
+    def __init__(self, capacity: int = HISTORY_CAPACITY, fields=HISTORY_FIELDS):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.timestamps = np.full(2 * capacity, np.nan)
+        self.columns = {field: np.full(2 * capacity, np.nan, dtype=np.float32) for field in self.fields}
+        self.head = 0
+        self.size = 0
+        self.total_appended = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, timestamp: float, record: Dict):
+        """Store one reading, overwriting the oldest once the buffer is full"""
+        pos = self.head
+        mirror = pos + self.capacity
+        self.timestamps[pos] = self.timestamps[mirror] = timestamp
+        for field, column in self.columns.items():
+            value = record.get(field)
+            column[pos] = column[mirror] = value if isinstance(value, (int, float)) else np.nan
+
+        self.head = (pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total_appended += 1
+
+    def extend(self, timestamps: np.ndarray, columns: Dict[str, np.ndarray]):
+        """Bulk append in chronological order; only the last `capacity` entries are kept"""
+        n = len(timestamps)
+        keep = min(n, self.capacity)
+        positions = (self.head + (n - keep) + np.arange(keep)) % self.capacity
+        for target, values in [(self.timestamps, timestamps)] + [
+            (column, columns.get(field, np.full(n, np.nan))) for field, column in self.columns.items()
+        ]:
+            values = np.asarray(values, dtype=float)[n - keep:]
+            target[positions] = target[positions + self.capacity] = values
+
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        self.total_appended += n
+
+    def latest(self, field: str) -> float:
+        """Most recently appended value of a field"""
+        return self.window(field, 1)[0].item()
+
+    def oldest(self, field: str) -> float:
+        """Oldest stored value of a field, the next one append() overwrites when full"""
+        return self.window(field)[0].item()
+
+    def window(self, field: str, n: Optional[int] = None) -> np.ndarray:
+        """Zero-copy view of the last n values of a field (all stored values by default)"""
+        n = self.size if n is None else min(n, self.size)
+        end = self.head + self.capacity
+        source = self.timestamps if field == 'timestamp' else self.columns[field]
+        return source[end - n:end]
+
+
+class LearnedPatternStats:
+    """Online accumulators behind a city's learned_patterns.
+
+    Keeps per-hour dust sums and counts, the dust baseline and dust/wind
+    co-moment sums over exactly the readings held in the city's history
+    buffer: readings are added as they arrive and subtracted as the buffer
+    evicts them, so every update is O(1). The sums are re-derived from the
+    buffer once per full wrap to stop floating-point drift accumulating.
+    """
+    def __init__(self):
+        self.hour_sums = [0.0] * 24
+        self.hour_counts = [0] * 24
+        self.dust_count = 0
+        self.dust_sum = 0.0
+        self.pair_count = 0
+        self.pair_dust_sum = 0.0
+        self.pair_wind_sum = 0.0
+        self.pair_dust_sq = 0.0
+        self.pair_wind_sq = 0.0
+        self.pair_cross = 0.0
+
+    def add(self, timestamp: float, dust: float, wind_speed: float, sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) one reading's contribution"""
+        # Readings without dust are ignored, as are zero/missing wind values
+        if math.isnan(dust) or dust == 0:
+            return
+        hour = int(timestamp // 3600 % 24)
+        self.hour_sums[hour] += sign * dust
+        self.hour_counts[hour] += sign
+        self.dust_count += sign
+        self.dust_sum += sign * dust
+
+        if math.isnan(wind_speed) or wind_speed == 0:
+            return
+        self.pair_count += sign
+        self.pair_dust_sum += sign * dust
+        self.pair_wind_sum += sign * wind_speed
+        self.pair_dust_sq += sign * dust * dust
+        self.pair_wind_sq += sign * wind_speed * wind_speed
+        self.pair_cross += sign * dust * wind_speed
+
+    def rebuild(self, history: 'HistoryRingBuffer'):
+        """Recompute every accumulator exactly from the buffer contents"""
+        dust = history.window('dust').astype(float)
+        wind = history.window('wind_speed').astype(float)
+        has_dust = ~np.isnan(dust) & (dust != 0)
+        paired = has_dust & ~np.isnan(wind) & (wind != 0)
+
+        hours = (history.window('timestamp')[has_dust] // 3600 % 24).astype(np.intp)
+        self.hour_sums = np.bincount(hours, weights=dust[has_dust], minlength=24).tolist()
+        self.hour_counts = np.bincount(hours, minlength=24).tolist()
+        self.dust_count = int(has_dust.sum())
+        self.dust_sum = float(dust[has_dust].sum())
+
+        x, y = dust[paired], wind[paired]
+        self.pair_count = int(paired.sum())
+        self.pair_dust_sum = float(x.sum())
+        self.pair_wind_sum = float(y.sum())
+        self.pair_dust_sq = float(x @ x)
+        self.pair_wind_sq = float(y @ y)
+        self.pair_cross = float(x @ y)
+
+    def patterns(self) -> Dict:
+        """Current learned_patterns entry for the city"""
+        hourly_avgs = {
+            h: self.hour_sums[h] / self.hour_counts[h]
+            for h in range(24) if self.hour_counts[h] > 0
+        }
+
+        # Dust/wind correlation only once every dust reading has a wind speed
+        wind_corr = 0.3  # Default correlation
+        if self.dust_count > 50 and self.pair_count == self.dust_count:
+            n = self.pair_count
+            cov = self.pair_cross - self.pair_dust_sum * self.pair_wind_sum / n
+            var_dust = self.pair_dust_sq - self.pair_dust_sum ** 2 / n
+            var_wind = self.pair_wind_sq - self.pair_wind_sum ** 2 / n
+            if var_dust > 1e-9 and var_wind > 1e-9:
+                wind_corr = max(-1.0, min(1.0, cov / math.sqrt(var_dust * var_wind)))
+
+        return {
+            'hourly_averages': hourly_avgs,
+            'wind_correlation': wind_corr,
+            'baseline_dust': self.dust_sum / self.dust_count if self.dust_count else 30
+        }
+
+
+class CalendarFactorCache:
+    """Per-hour calendar factors over the forecast horizon, shared by all models and cities.
+
+    Every forecast hour's month, hour of day and weekday only depend on the
+    wall-clock hour the forecast starts in, so the arrays are built once per
+    hour and reused until the hour rolls over. Their gathers at the
+    multi-resolution forecast steps are memoized the same way.
+
+    The climatology curve comes from a (month, hour, weekday) lookup table,
+    and its variation is drawn in one call from a generator seeded with the
+    start hour. Identical inputs within the same hour therefore always give
+    identical forecasts.
+
+    Query threads read the cache while commits run, so one build is kept as
+    a single (hour_start, hours, arrays, schedules) tuple that is swapped as
+    a whole; a reader always gets arrays and schedules of the same build.
+    """
+    def __init__(self, seasonal_factors: Dict[int, float], diurnal_factors: Dict[int, float],
+                 weekly_factors: Dict[int, float], min_hours: int = 72):
+        self.seasonal_factors = seasonal_factors
+        self.diurnal_factors = diurnal_factors
+        self.weekly_factors = weekly_factors
+        self.min_hours = min_hours
+        self.state = (None, 0, {}, {})
+        self._build_lock = threading.Lock()
+
+        self.seasonal_table = np.array([seasonal_factors.get(m, 1.0) for m in range(13)])
+        self.diurnal_table = np.array([diurnal_factors.get(h, 1.0) for h in range(24)])
+        self.weekly_table = np.array([weekly_factors.get(d, 1.0) for d in range(7)])
+        self.climatology_table = (CLIMATOLOGY_MONTHLY_MEANS[:, None, None]
+                                  * self.diurnal_table[None, :, None]
+                                  * self.weekly_table[None, None, :])
+
+    def get(self, now: datetime, hours: int) -> Dict[str, np.ndarray]:
+        """Read-only calendar arrays for the next `hours` hours starting at `now`"""
+        _, built_hours, arrays, _ = self._current(now, hours)
+        if hours == built_hours:
+            return arrays
+        return {name: values[:hours] for name, values in arrays.items()}
+
+    def scheduled(self, now: datetime, hours: int) -> Dict[str, np.ndarray]:
+        """Read-only calendar arrays at the forecast_leads(hours) steps only"""
+        leads = forecast_leads(hours)
+        if len(leads) == hours:
+            return self.get(now, hours)
+
+        _, _, arrays, schedules = self._current(now, hours)
+        scheduled = schedules.get(hours)
+        if scheduled is None:
+            index = leads.astype(np.intp)
+            scheduled = {name: values[index] for name, values in arrays.items()}
+            for values in scheduled.values():
+                values.setflags(write=False)
+            schedules[hours] = scheduled
+        return scheduled
+
+    def _current(self, now: datetime, hours: int) -> tuple:
+        """The build covering `hours` hours from now's hour, rebuilt if it does not"""
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        state = self.state
+        if state[0] != hour_start or hours > state[1]:
+            with self._build_lock:
+                state = self.state
+                if state[0] != hour_start or hours > state[1]:
+                    state = self.state = self._build(hour_start, max(hours, self.min_hours))
+        return state
+
+    def _build(self, hour_start: datetime, hours: int) -> tuple:
+        futures = [hour_start + timedelta(hours=i) for i in range(hours)]
+        month = np.array([f.month for f in futures], dtype=np.intp)
+        hour = np.array([f.hour for f in futures], dtype=np.intp)
+        weekday = np.array([f.weekday() for f in futures], dtype=np.intp)
+
+        # Same seed for the same start hour; a longer horizon extends the same sequence
+        rng = np.random.default_rng(int(to_epoch(hour_start) // 3600))
+        climatology_std = CLIMATOLOGY_MONTHLY_STDS[month]
+
+        arrays = {
+            'month': month,
+            'hour': hour,
+            'seasonal': self.seasonal_table[month],
+            'diurnal': self.diurnal_table[hour],
+            'weekly': self.weekly_table[weekday],
+            'climatology': self.climatology_table[month, hour, weekday],
+            'climatology_std': climatology_std,
+            'climatology_noise': rng.standard_normal(hours) * climatology_std * 0.1
+        }
+        for values in arrays.values():
+            values.setflags(write=False)
+        return hour_start, hours, arrays, {}
+
 
 class AdaptiveWeightOptimizer:
     """Dynamically optimizes model weights based on recent performance"""
@@ -102,33 +428,137 @@ class AdaptiveWeightOptimizer:
         return {m: w / total for m, w in new_weights.items()}
 
 
-class EnsemblePredictor:
+class ModelSpec:
+    """One ensemble member.
+
+    `compute(context)` returns a (rows x hours) array from the shared
+    context (city_ids, inputs, api_values, lead, calendar). Combiners run
+    after the base models and also get `base`, the stacked base-model
+    predictions (rows x base models x hours).
+    """
+    def __init__(self, name: str, compute: Callable[[Dict], np.ndarray], default_weight: float,
+                 breakdown_key: Optional[str] = None, combiner: bool = False):
+        self.name = name
+        self.compute = compute
+        self.default_weight = default_weight
+        self.breakdown_key = breakdown_key or name
+        self.combiner = combiner
+
+
+class ModelRegistry:
+    """Ordered ensemble members with runtime toggles and per-model run statistics.
+
+    Disabled models are skipped entirely and the remaining weights are
+    renormalized. Every deterministic run records the model's wall time and
+    a summary of its output; ensemble-member passes are evaluated with
+    record=False so they leave these operator stats alone.
+    """
     def __init__(self):
-        # Dynamic model weights (7 models for maximum accuracy)
-        self.model_weights = {
-            'pattern': 0.22,
-            'weather': 0.20,
-            'persistence': 0.15,
-            'climatology': 0.12,
-            'api_forecast': 0.10,
-            'neural_pattern': 0.12,
-            'meta_ensemble': 0.09
+        self.specs: Dict[str, ModelSpec] = {}
+        self.disabled: set = set()
+        self.stats: Dict[str, Dict] = {}
+        # Query runs evaluate models concurrently with commits
+        self._stats_lock = threading.Lock()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.specs)
+
+    def register(self, name: str, compute: Callable[[Dict], np.ndarray], default_weight: float,
+                 breakdown_key: Optional[str] = None, combiner: bool = False):
+        self.specs[name] = ModelSpec(name, compute, default_weight, breakdown_key, combiner)
+        with self._stats_lock:
+            self.stats[name] = {'runs': 0, 'total_seconds': 0.0, 'last_ms': None, 'last_output': None}
+
+    def active(self) -> List[ModelSpec]:
+        """Enabled models in tensor row order: base models first, then combiners"""
+        enabled = [spec for name, spec in self.specs.items() if name not in self.disabled]
+        return [spec for spec in enabled if not spec.combiner] + [spec for spec in enabled if spec.combiner]
+
+    def set_enabled(self, name: str, enabled: bool):
+        if name not in self.specs:
+            raise KeyError(f"Unknown model '{name}'")
+        if enabled:
+            self.disabled.discard(name)
+            return
+        if not self.specs[name].combiner and not any(
+            not spec.combiner and spec.name != name for spec in self.active()
+        ):
+            raise ValueError("At least one base model must stay enabled")
+        self.disabled.add(name)
+
+    def weights(self, active: List[ModelSpec], model_weights: Dict[str, float]) -> np.ndarray:
+        """Weights of the active models, renormalized to sum to 1"""
+        weights = np.array([model_weights.get(spec.name, spec.default_weight) for spec in active])
+        return weights / weights.sum()
+
+    def evaluate(self, active: List[ModelSpec], context: Dict, record: bool = True) -> np.ndarray:
+        """Run the active models -> (rows x models x hours)"""
+        base = np.stack([self._run(spec, context, record) for spec in active if not spec.combiner], axis=1)
+        combined = [self._run(spec, dict(context, base=base), record) for spec in active if spec.combiner]
+        if not combined:
+            return base
+        return np.concatenate([base] + [values[:, np.newaxis, :] for values in combined], axis=1)
+
+    def report(self, model_weights: Dict[str, float]) -> List[Dict]:
+        active = self.active()
+        effective = dict(zip([spec.name for spec in active], self.weights(active, model_weights).tolist()))
+        with self._stats_lock:
+            stats = {name: dict(entry) for name, entry in self.stats.items()}
+        return [
+            {
+                'name': name,
+                'enabled': name not in self.disabled,
+                'weight': model_weights.get(name, spec.default_weight),
+                'effective_weight': round(effective.get(name, 0.0), 4),
+                'runs': stats[name]['runs'],
+                'total_seconds': round(stats[name]['total_seconds'], 6),
+                'avg_ms': round(stats[name]['total_seconds'] * 1000 / stats[name]['runs'], 3)
+                          if stats[name]['runs'] else None,
+                'last_ms': stats[name]['last_ms'],
+                'last_output': stats[name]['last_output']
+            }
+            for name, spec in self.specs.items()
+        ]
+
+    def _run(self, spec: ModelSpec, context: Dict, record: bool = True) -> np.ndarray:
+        started = time.perf_counter()
+        values = spec.compute(context)
+        elapsed = time.perf_counter() - started
+        if not record:
+            return values
+
+        last_output = {
+            'mean': round(float(values.mean()), 2),
+            'std': round(float(values.std()), 2),
+            'min': round(float(values.min()), 2),
+            'max': round(float(values.max()), 2)
         }
+        with self._stats_lock:
+            stats = self.stats[spec.name]
+            stats['runs'] += 1
+            stats['total_seconds'] += elapsed
+            stats['last_ms'] = round(elapsed * 1000, 3)
+            stats['last_output'] = last_output
+        return values
+
+
+class EnsemblePredictor:
+    def __init__(self):
+        # Ensemble members (7 models for maximum accuracy) and their dynamic weights
+        self.models = ModelRegistry()
+        self._register_models()
+        self.model_weights = {name: spec.default_weight for name, spec in self.models.specs.items()}
         
         # Performance tracking per model
-        self.model_performance: Dict[str, List[float]] = {
-            'pattern': [],
-            'weather': [],
-            'persistence': [],
-            'climatology': [],
-            'api_forecast': [],
-            'neural_pattern': [],
-            'meta_ensemble': []
-        }
+        self.model_performance: Dict[str, List[float]] = {name: [] for name in self.models.names}
+        
+        # Offline-trained tree model, registered once artifacts are loaded (load_gbm)
+        self.gbm = None
         
         # Advanced components
         self.kalman_filters: Dict[str, KalmanFilter] = {}
-        self.weight_optimizer = AdaptiveWeightOptimizer(num_models=7)
+        self.weight_optimizer = AdaptiveWeightOptimizer(num_models=len(self.models.names))
         
         # UAE seasonal dust patterns (monthly multipliers) - refined with research data
         self.seasonal_factors = {
@@ -140,10 +570,46 @@ class EnsemblePredictor:
         self.diurnal_factors = self._init_diurnal_factors()
         self.wind_direction_factors = self._init_wind_factors()
         self.weekly_factors = self._init_weekly_factors()
-        self.history: Dict[str, List[Dict]] = {}
+        self.calendar_cache = CalendarFactorCache(
+            self.seasonal_factors, self.diurnal_factors, self.weekly_factors
+        )
+        self.history: Dict[str, HistoryRingBuffer] = {}
+        self.pattern_stats: Dict[str, LearnedPatternStats] = {}
         self.learned_patterns: Dict[str, Dict] = {}
         self.model_version = "6.0.0-ultra-accuracy"
 
+    def _register_models(self):
+        """Declare the ensemble members with their default weights"""
+        register = self.models.register
+        register('pattern', lambda ctx: self._pattern_model(ctx['inputs'], ctx['lead'], ctx['calendar']), 0.22)
+        register('weather', lambda ctx: self._weather_model(ctx['inputs'], ctx['lead']), 0.20)
+        register('persistence', lambda ctx: self._persistence_model(ctx['city_ids'], ctx['inputs'], ctx['lead']), 0.15)
+        register('climatology', lambda ctx: self._climatology_model(len(ctx['city_ids']), ctx['lead'], ctx['calendar']), 0.12)
+        register('api_forecast', lambda ctx: self._api_forecast_model(ctx['api_values'], ctx['inputs'], ctx['lead']),
+                 0.10, breakdown_key='api')
+        register('neural_pattern', lambda ctx: self._neural_pattern_model(ctx['city_ids'], ctx['inputs'], ctx['lead'], ctx['calendar']),
+                 0.12, breakdown_key='neural')
+        register('meta_ensemble', lambda ctx: self._meta_ensemble_model(ctx['base']),
+                 0.09, breakdown_key='meta', combiner=True)
+
+    def load_gbm(self, model_dir: Optional[str] = None) -> Optional[str]:
+        """Load (or hot-swap) the latest gradient-boosted artifacts as the eighth member.
+
+        Returns the loaded version, or None if nothing has been trained yet.
+        """
+        from app.ml.gbm_model import GBM_MODEL_DIR, GBMHorizonModel
+
+        gbm = GBMHorizonModel.load_latest(model_dir or GBM_MODEL_DIR)
+        if gbm is None:
+            return None
+
+        self.gbm = gbm
+        if 'gbm' not in self.models.specs:
+            self.models.register('gbm', lambda ctx: self.gbm.predict(ctx['inputs'], ctx['lead'], ctx['calendar']), 0.10)
+            self.model_weights.setdefault('gbm', 0.10)
+            self.model_performance.setdefault('gbm', [])
+        return gbm.version
+
     def _init_diurnal_factors(self) -> Dict[int, float]:
         """Hourly dust variation - refined with UAE meteorological data"""
         factors = {}
@@ -195,218 +661,433 @@ class EnsemblePredictor:
     def add_historical_data(self, city_id: str, data: Dict):
         """Add data point to history for learning"""
         if city_id not in self.history:
-            self.history[city_id] = []
-
-        self.history[city_id].append({
-            'timestamp': data.get('timestamp'),
-            'dust': data.get('dust', 0),
-            'temperature': data.get('temperature'),
-            'humidity': data.get('humidity'),
-            'wind_speed': data.get('wind_speed'),
-            'wind_direction': data.get('wind_direction'),
-            'visibility': data.get('visibility'),
-            'pressure': data.get('pressure')
-        })
-
-        # Keep last 14 days for better pattern learning
-        if len(self.history[city_id]) > 4032:  # 14 days * 24 hours * 12 (5-min intervals)
-            self.history[city_id] = self.history[city_id][-4032:]
-        
-        # Update learned patterns periodically
-        if len(self.history[city_id]) % 100 == 0:
-            self._update_learned_patterns(city_id)
+            self.history[city_id] = HistoryRingBuffer()
+            self.pattern_stats[city_id] = LearnedPatternStats()
+        history = self.history[city_id]
+        stats = self.pattern_stats[city_id]
 
-    def _update_learned_patterns(self, city_id: str):
-        """Learn city-specific patterns from historical data"""
-        history = self.history.get(city_id, [])
-        if len(history) < 200:
-            return
-        
-        # Calculate city-specific hourly averages
-        hourly_avgs = {}
-        for h in range(24):
-            values = [d['dust'] for d in history if d.get('dust') and 
-                     datetime.fromisoformat(d['timestamp']).hour == h if d.get('timestamp')]
-            if values:
-                hourly_avgs[h] = np.mean(values)
-        
-        # Calculate correlation coefficients
-        dust_values = [d['dust'] for d in history if d.get('dust')]
-        wind_values = [d['wind_speed'] for d in history if d.get('wind_speed') and d.get('dust')]
-        
-        if len(dust_values) > 50 and len(wind_values) == len(dust_values):
-            wind_corr = np.corrcoef(dust_values[:len(wind_values)], wind_values)[0, 1]
+        # Drop the reading about to be overwritten from the running statistics
+        if len(history) == history.capacity:
+            stats.add(history.oldest('timestamp'), history.oldest('dust'),
+                      history.oldest('wind_speed'), sign=-1)
+
+        # Fused collector data carries no timestamp; fall back to ingestion time
+        timestamp = to_epoch(data.get('timestamp'))
+        record = {field: data.get(field) for field in HISTORY_FIELDS}
+        record['dust'] = data.get('dust', 0)
+        history.append(time.time() if timestamp is None else timestamp, record)
+
+        # Add the stored (float32) values so additions and removals cancel exactly
+        if history.total_appended % history.capacity == 0:
+            stats.rebuild(history)
         else:
-            wind_corr = 0.3  # Default correlation
-        
-        self.learned_patterns[city_id] = {
-            'hourly_averages': hourly_avgs,
-            'wind_correlation': wind_corr,
-            'baseline_dust': np.mean(dust_values) if dust_values else 30
+            stats.add(history.latest('timestamp'), history.latest('dust'), history.latest('wind_speed'))
+
+        self._update_learned_patterns(city_id)
+
+    def load_history(self, city_id: str, timestamps: np.ndarray, columns: Dict[str, np.ndarray]):
+        """Replace a city's history with bulk data and re-derive its learned patterns"""
+        history = HistoryRingBuffer()
+        history.extend(timestamps, columns)
+        stats = LearnedPatternStats()
+        stats.rebuild(history)
+
+        self.history[city_id] = history
+        self.pattern_stats[city_id] = stats
+        self.learned_patterns.pop(city_id, None)
+        self._update_learned_patterns(city_id)
+
+    def load_readings(self, readings: List[Dict], keep: Optional[Callable[[str], bool]] = None) -> int:
+        """Rebuild histories from stored readings (oldest first); returns the number of cities loaded"""
+        by_city: Dict[str, List[Dict]] = {}
+        for reading in readings:
+            if keep is None or keep(reading['city_id']):
+                by_city.setdefault(reading['city_id'], []).append(reading)
+
+        for city_id, rows in by_city.items():
+            timestamps = np.array([to_epoch(row.get('timestamp')) for row in rows], dtype=float)
+            valid = ~np.isnan(timestamps)
+            columns = {
+                field: np.array([row.get(field) for row in rows], dtype=float)[valid]
+                for field in HISTORY_FIELDS
+            }
+            self.load_history(city_id, timestamps[valid], columns)
+        return len(by_city)
+
+    def state_arrays(self) -> Dict[str, np.ndarray]:
+        """Learned state as flat named arrays, e.g. for np.savez (see restore_state)"""
+        arrays = {
+            'version': np.array([STATE_VERSION]),
+            'model_names': np.array(self.models.names),
+            'model_weights': np.array([self.model_weights[model] for model in self.models.names])
         }
+        for city_id, kalman in self.kalman_filters.items():
+            estimate = np.nan if kalman.estimate is None else kalman.estimate
+            arrays[f'kalman/{city_id}'] = np.array([estimate, kalman.error_estimate])
+        for city_id, history in self.history.items():
+            arrays[f'history/{city_id}/timestamp'] = history.window('timestamp').copy()
+            for field in history.fields:
+                arrays[f'history/{city_id}/{field}'] = history.window(field).copy()
+        return arrays
+
+    def restore_state(self, arrays, keep: Optional[Callable[[str], bool]] = None) -> int:
+        """Load a state_arrays() snapshot (or an open .npz of one); returns the number of cities restored"""
+        if int(arrays['version'][0]) != STATE_VERSION:
+            raise ValueError(f"Unsupported predictor state version {int(arrays['version'][0])}")
+        for name, weight in zip(arrays['model_names'].tolist(), arrays['model_weights'].tolist()):
+            if name in self.model_weights:
+                self.model_weights[name] = weight
+
+        cities = set()
+        for key in arrays.keys():
+            if '/' not in key:
+                continue
+            kind, city_id, *field = key.split('/')
+            if keep is not None and not keep(city_id):
+                continue
+            if kind == 'kalman':
+                estimate, error_estimate = arrays[key].tolist()
+                kalman = KalmanFilter()
+                kalman.estimate = None if math.isnan(estimate) else estimate
+                kalman.error_estimate = error_estimate
+                self.kalman_filters[city_id] = kalman
+            elif kind == 'history' and field == ['timestamp']:
+                columns = {f: arrays[f'history/{city_id}/{f}'] for f in HISTORY_FIELDS
+                           if f'history/{city_id}/{f}' in arrays}
+                self.load_history(city_id, arrays[key], columns)
+                cities.add(city_id)
+        return len(cities)
+
+    def _update_learned_patterns(self, city_id: str):
+        """Publish city-specific patterns from the running statistics"""
+        history = self.history.get(city_id)
+        if history is None or len(history) < 200:
+            return
 
-    def predict(self, city_id: str, current_data: Dict, hours_ahead: int = 72) -> Dict:
+        self.learned_patterns[city_id] = self.pattern_stats[city_id].patterns()
+
+    def predict(self, city_id: str, current_data: Dict, hours_ahead: int = 72,
+                verbosity: str = PAYLOAD_FULL, include_breakdown: bool = False,
+                commit: bool = True, members: int = 0) -> Dict:
         """Generate ultra-accurate ensemble prediction with 7 models and Kalman filtering"""
+        return self.predict_batch(
+            [city_id], [current_data], hours_ahead, verbosity, include_breakdown, commit, members
+        )[0]
+
+    def predict_batch(self, city_ids: List[str], fused_inputs: List[Dict], hours_ahead: int = 72,
+                      verbosity: str = PAYLOAD_FULL, include_breakdown: bool = False,
+                      commit: bool = True, members: int = 0) -> List[Dict]:
+        """Predict several cities in one pass over a (cities x models x hours) tensor.
+
+        With verbosity="full" each city gets the per-hour forecast_24h/forecast_72h
+        dicts. With verbosity="lite" it gets one columnar `forecast` object
+        (times[], dust[], confidence[], lower[], upper[] and, if
+        include_breakdown is set, breakdown[model][]).
+
+        commit=True is the collection-cycle prediction: it advances each city's
+        Kalman filter and records the forecast for accuracy tracking.
+        commit=False is a read-only query: it smooths with a throwaway copy of
+        the filter and writes nothing back, so API reads leave no trace.
+
+        hours_ahead (1..MAX_FORECAST_HOURS) sets the horizon; the models are
+        only evaluated at the forecast_leads() steps within it, so every
+        per-step column holds one entry per step rather than per hour.
+
+        members > 0 adds a `probabilistic` block per city: p10/p50/p90 and the
+        probability of exceeding each EXCEEDANCE_THRESHOLDS level per hour,
+        from that many perturbed input members (see _member_forecast).
+        """
+        if verbosity not in PAYLOAD_MODES:
+            raise ValueError(f"Unknown verbosity '{verbosity}', expected one of {PAYLOAD_MODES}")
+        if not 0 <= members <= MAX_MEMBERS:
+            raise ValueError(f"members must be between 0 and {MAX_MEMBERS}")
+        if not 1 <= hours_ahead <= MAX_FORECAST_HOURS:
+            raise ValueError(f"hours_ahead must be between 1 and {MAX_FORECAST_HOURS}")
+
         now = datetime.utcnow()
         
         # Get lazy-loaded modules
         accuracy_tracker = get_accuracy_tracker()
         data_quality_checker = get_data_quality_checker()
         
-        # Initialize Kalman filter for this city if needed
-        if city_id not in self.kalman_filters:
-            self.kalman_filters[city_id] = KalmanFilter()
-        
-        # Validate input data quality
-        quality = data_quality_checker.validate_reading(current_data)
-        if not quality['is_valid']:
-            logger.warning(f"Low quality input data for {city_id}: {quality['issues']}")
-
-        # Get predictions from all 7 models
-        pattern_pred = self._pattern_model(current_data, hours_ahead)
-        weather_pred = self._weather_model(current_data, hours_ahead)
-        persistence_pred = self._persistence_model(city_id, current_data, hours_ahead)
-        climatology_pred = self._climatology_model(hours_ahead)
-        api_pred = self._api_forecast_model(current_data, hours_ahead)
-        neural_pred = self._neural_pattern_model(city_id, current_data, hours_ahead)
-        meta_pred = self._meta_ensemble_model(
-            [pattern_pred, weather_pred, persistence_pred, climatology_pred, api_pred, neural_pred],
-            hours_ahead
-        )
-
-        predictions = []
-        # model_errors_tracking = {m: [] for m in self.model_weights.keys()}
-        
-        for i in range(hours_ahead):
-            # Collect all model predictions for this hour
-            model_preds = {
-                'pattern': pattern_pred[i],
-                'weather': weather_pred[i],
-                'persistence': persistence_pred[i],
-                'climatology': climatology_pred[i],
-                'api_forecast': api_pred[i],
-                'neural_pattern': neural_pred[i],
-                'meta_ensemble': meta_pred[i]
-            }
-            
-            # Weighted ensemble average
-            ensemble_dust = sum(
-                model_preds[model] * self.model_weights[model]
-                for model in self.model_weights
-            )
+        qualities = []
+        kalman_filters = []
+        for city_id, current_data in zip(city_ids, fused_inputs):
+            # Initialize Kalman filter for this city if needed
+            if commit:
+                if city_id not in self.kalman_filters:
+                    self.kalman_filters[city_id] = KalmanFilter()
+                kalman_filters.append(self.kalman_filters[city_id])
+            else:
+                kalman = self.kalman_filters.get(city_id)
+                kalman_filters.append(copy.copy(kalman) if kalman else KalmanFilter())
             
+            # Validate input data quality
+            quality = data_quality_checker.validate_reading(current_data, track=commit, city_id=city_id)
+            if not quality['is_valid']:
+                logger.warning(f"Low quality input data for {city_id}: {quality['issues']}")
+            qualities.append(quality)
+
+        # Evaluate every enabled model over every city and the whole horizon at once
+        active = self.models.active()
+        inputs = self._input_columns(fused_inputs)
+        lead = forecast_leads(hours_ahead)
+        calendar = self.calendar_cache.scheduled(now, hours_ahead)
+        api_values = self._api_forecast_values(fused_inputs, lead)
+        model_tensor = self._model_tensor(active, city_ids, inputs, api_values, lead, calendar)
+
+        # Weighted ensemble average -> (cities x hours)
+        weights = self.models.weights(active, self.model_weights)
+        active_weights = dict(zip([spec.name for spec in active], weights.tolist()))
+        breakdown_keys = [spec.breakdown_key for spec in active]
+        ensemble = weights @ model_tensor
+        raw_ensemble = ensemble.copy() if members else None
+
+        near_term = lead < 24
+        for row, city_id in enumerate(city_ids):
             # Apply Kalman filtering for noise reduction (only for near-term predictions)
-            if i < 24:
-                ensemble_dust = self.kalman_filters[city_id].update(ensemble_dust)
+            ensemble[row, near_term] = kalman_filters[row].filter(ensemble[row, near_term])
             
             # Apply calibration from accuracy tracker
-            ensemble_dust = accuracy_tracker.apply_calibration(city_id, ensemble_dust)
+            ensemble[row] = accuracy_tracker.apply_calibration_array(city_id, ensemble[row])
 
-            # Calculate advanced confidence with multiple factors
-            model_values = list(model_preds.values())
-            confidence = self._calculate_advanced_confidence(
-                model_values, i, quality['quality_score'], city_id
+        # Model spread drives both the confidence and the confidence interval
+        std_dev = model_tensor.std(axis=1)
+        mean_val = model_tensor.mean(axis=1)
+        quality_scores = np.array([[q['quality_score']] for q in qualities], dtype=float)
+        confidence = self._calculate_advanced_confidence(
+            std_dev, mean_val, lead, quality_scores, city_ids
+        )
+
+        # Adaptive confidence interval based on prediction horizon
+        ci_multiplier = 1.96 + lead * 0.02  # Wider intervals for longer horizons
+        lower_bound = np.maximum(0, ensemble - ci_multiplier * std_dev)
+        upper_bound = ensemble + ci_multiplier * std_dev
+        ensemble = np.maximum(0, ensemble)
+
+        probabilistic = None
+        if members:
+            probabilistic = self._member_forecast(
+                active, city_ids, inputs, api_values, lead, calendar, now, weights,
+                ensemble - raw_ensemble, members
             )
-            
-            # Calculate confidence interval using bootstrap-like estimation
-            std_dev = np.std(model_values)
-            mean_val = np.mean(model_values)
-            
-            # Adaptive confidence interval based on prediction horizon
-            ci_multiplier = 1.96 + (i * 0.02)  # Wider intervals for longer horizons
-            lower_bound = max(0, ensemble_dust - ci_multiplier * std_dev)
-            upper_bound = ensemble_dust + ci_multiplier * std_dev
-
-            ensemble_dust = max(0, ensemble_dust)
-            future_time = now + timedelta(hours=i)
-
-            prediction = {
-                'hour': i,
-                'time': future_time.isoformat(),
-                'dust': round(ensemble_dust, 2),
-                'confidence': round(confidence, 1),
-                'confidence_interval': {
-                    'lower': round(lower_bound, 2),
-                    'upper': round(upper_bound, 2)
-                },
-                'risk_level': self._get_risk_level(ensemble_dust),
-                'data_quality': quality['quality_level'],
-                'model_breakdown': {
-                    'pattern': round(pattern_pred[i], 2),
-                    'weather': round(weather_pred[i], 2),
-                    'persistence': round(persistence_pred[i], 2),
-                    'climatology': round(climatology_pred[i], 2),
-                    'api': round(api_pred[i], 2),
-                    'neural': round(neural_pred[i], 2),
-                    'meta': round(meta_pred[i], 2)
-                },
-                'model_agreement': round(100 - (std_dev / (mean_val + 1) * 100), 1)
-            }
-            predictions.append(prediction)
-            
-            # Record prediction for accuracy tracking
-            accuracy_tracker.record_prediction(city_id, future_time, ensemble_dust, confidence)
 
-        risk_periods = self._find_risk_periods(predictions)
-        dust_values = [p['dust'] for p in predictions]
-        
+        leads = lead.astype(int).tolist()
+        step_hours = np.diff(lead, append=hours_ahead)
+        times = [now + timedelta(hours=h) for h in leads]
+
+        # Round the whole batch once; every city's columns are row slices of these
+        time_strings = [t.isoformat() for t in times]
+        dust = np.round(ensemble, 2).tolist()
+        conf = np.round(confidence, 1).tolist()
+        lower = np.round(lower_bound, 2).tolist()
+        upper = np.round(upper_bound, 2).tolist()
+        breakdown = None
+        if verbosity == PAYLOAD_FULL or include_breakdown:
+            breakdown = np.round(model_tensor, 2)
+            breakdown = (breakdown.transpose(0, 2, 1) if verbosity == PAYLOAD_FULL else breakdown).tolist()
+
         # Get accuracy info with fallback for new systems
         accuracy_info = accuracy_tracker.get_overall_accuracy()
 
+        results = []
+        for row, city_id in enumerate(city_ids):
+            # Record predictions for accuracy tracking
+            if commit:
+                accuracy_tracker.record_forecast(city_id, now, lead, ensemble[row], confidence[row], self.model_version)
+
+            forecast = {
+                'lead_hours': leads,
+                'times': time_strings,
+                'dust': dust[row],
+                'confidence': conf[row],
+                'lower': lower[row],
+                'upper': upper[row]
+            }
+
+            result = self._build_result(
+                city_id, fused_inputs[row], now, qualities[row], forecast, leads, step_hours,
+                accuracy_info, active_weights
+            )
+            if verbosity == PAYLOAD_FULL:
+                agreement = 100 - (std_dev[row] / (mean_val[row] + 1) * 100)
+                predictions = self._serialize_forecast(
+                    forecast, leads, breakdown_keys, breakdown[row], self._get_risk_levels(ensemble[row]),
+                    np.round(agreement, 1).tolist(), qualities[row]['quality_level']
+                )
+                result['forecast_24h'] = predictions[:24]
+                result['forecast_72h'] = predictions
+            else:
+                if breakdown is not None:
+                    forecast['breakdown'] = dict(zip(breakdown_keys, breakdown[row]))
+                result['forecast'] = forecast
+            if probabilistic is not None:
+                result['probabilistic'] = {
+                    'members': members,
+                    **{name: values[row] for name, values in probabilistic.items() if name != 'exceedance'},
+                    'exceedance': {threshold: values[row] for threshold, values in probabilistic['exceedance'].items()}
+                }
+            results.append(result)
+
+        return results
+
+    def _model_tensor(self, active: List[ModelSpec], city_ids: List[str], inputs: Dict[str, np.ndarray],
+                      api_values: np.ndarray, lead: np.ndarray, calendar: Dict[str, np.ndarray],
+                      record: bool = True) -> np.ndarray:
+        """Evaluate the active models -> (rows x models x hours)"""
+        return self.models.evaluate(active, {
+            'city_ids': city_ids,
+            'inputs': inputs,
+            'api_values': api_values,
+            'lead': lead,
+            'calendar': calendar
+        }, record)
+
+    def _member_forecast(self, active: List[ModelSpec], city_ids: List[str], inputs: Dict[str, np.ndarray], api_values: np.ndarray,
+                         lead: np.ndarray, calendar: Dict[str, np.ndarray], now: datetime,
+                         weights: np.ndarray, correction: np.ndarray, members: int) -> Dict:
+        """Quantiles and exceedance probabilities from perturbed input members.
+
+        Every city is repeated `members` times with dust, wind speed and
+        humidity perturbed, and all rows go through the models in one
+        (cities*members x models x hours) pass. The perturbations come from a
+        generator seeded with the forecast hour and are shared by all cities,
+        so results stay reproducible. Members take the same Kalman and
+        calibration correction as the deterministic forecast.
+        """
+        n_cities = len(city_ids)
+        rng = np.random.default_rng(int(to_epoch(now) // 3600))
+        noise = np.tile(rng.standard_normal((3, members)), n_cities)[:, :, np.newaxis]
+
+        member_inputs = {name: np.repeat(column, members, axis=0) for name, column in inputs.items()}
+        member_inputs['dust'] = member_inputs['dust'] * np.exp(MEMBER_SPREAD['dust'] * noise[0])
+        member_inputs['wind_speed'] = np.maximum(
+            0, member_inputs['wind_speed'] * (1 + MEMBER_SPREAD['wind_speed'] * noise[1])
+        )
+        member_inputs['humidity'] = np.clip(
+            member_inputs['humidity'] + MEMBER_SPREAD['humidity'] * noise[2], 0, 100
+        )
+
+        member_ids = [city_id for city_id in city_ids for _ in range(members)]
+        # Member passes are not deterministic runs: keep them out of the model stats
+        model_tensor = self._model_tensor(
+            active, member_ids, member_inputs, np.repeat(api_values, members, axis=0), lead, calendar,
+            record=False
+        )
+        trajectories = (weights @ model_tensor).reshape(n_cities, members, len(lead))
+        trajectories = np.maximum(0, trajectories + correction[:, np.newaxis, :])
+
+        ordered = np.sort(trajectories, axis=1)
+        forecast = {
+            f'p{q}': np.round(sorted_percentile(ordered, q), 2).tolist() for q in MEMBER_QUANTILES
+        }
+        forecast['exceedance'] = {
+            str(threshold): np.round((trajectories >= threshold).mean(axis=1), 3).tolist()
+            for threshold in EXCEEDANCE_THRESHOLDS
+        }
+        return forecast
+
+    def _build_result(self, city_id: str, current_data: Dict, now: datetime, quality: Dict,
+                      forecast: Dict[str, List], leads: List[int], step_hours: np.ndarray,
+                      accuracy_info: Dict, model_weights: Dict[str, float]) -> Dict:
+        """Assemble the prediction response for one city from its forecast columns.
+
+        Each step stands for the step_hours hours up to the next one, so hour
+        counts and risk-period durations weight the steps by their length.
+        """
+        risk_periods = self._find_risk_periods(forecast['dust'], forecast['times'], leads, step_hours)
+        dust_values = np.array(forecast['dust'])
+        peak_idx = int(np.argmax(dust_values))
+        near_term_values = dust_values[:24]  # Hourly steps
+
         return {
             'city_id': city_id,
             'generated_at': now.isoformat(),
             'model_version': self.model_version,
             'data_quality': quality,
-            'forecast_24h': predictions[:24],
-            'forecast_72h': predictions,
             'risk_periods': risk_periods,
             'next_risk_period': risk_periods[0] if risk_periods else None,
             'summary': {
-                'peak_dust': round(max(dust_values), 2),
-                'peak_hour': dust_values.index(max(dust_values)),
-                'peak_time': predictions[dust_values.index(max(dust_values))]['time'],
-                'min_dust': round(min(dust_values), 2),
-                'avg_dust': round(np.mean(dust_values), 2),
-                'hours_above_moderate': sum(1 for d in dust_values if d >= 20),
-                'hours_above_high': sum(1 for d in dust_values if d >= 50),
-                'hours_above_severe': sum(1 for d in dust_values if d >= 100)
+                'peak_dust': round(float(dust_values[peak_idx]), 2),
+                'peak_hour': leads[peak_idx],
+                'peak_time': forecast['times'][peak_idx],
+                'min_dust': round(float(dust_values.min()), 2),
+                'avg_dust': round(float(dust_values.mean()), 2),
+                'hours_above_moderate': int(step_hours[dust_values >= 20].sum()),
+                'hours_above_high': int(step_hours[dust_values >= 50].sum()),
+                'hours_above_severe': int(step_hours[dust_values >= 100].sum())
             },
             'accuracy_info': {
                 'overall_accuracy': accuracy_info.get('overall_accuracy', 92.5),
                 'status': accuracy_info.get('status', 'INITIALIZING'),
                 'validation_pending': accuracy_info.get('validation_pending', True),
-                'models_active': 7
+                'models_active': len(model_weights)
             },
-            'model_weights': self.model_weights,
+            'model_weights': model_weights,
             'accuracy_metrics': {
-                'model_agreement': round(100 - np.std(dust_values[:24]) / (np.mean(dust_values[:24]) + 0.001) * 100, 1),
+                'model_agreement': round(float(100 - near_term_values.std() / (near_term_values.mean() + 0.001) * 100), 1),
                 'data_quality': quality['quality_score'],
                 'sources_used': current_data.get('sources_used', 1),
-                'ensemble_models': 7,
+                'ensemble_models': len(model_weights),
                 'kalman_filtered': True
             }
         }
-    
-    def _calculate_advanced_confidence(self, model_values: List[float], hours_ahead: int, 
-                                       data_quality: float, city_id: str) -> float:
+
+    def _serialize_forecast(self, forecast: Dict[str, List], leads: List[int], breakdown_keys: List[str],
+                            breakdown: List[List[float]],
+                            risk_levels: List[str], agreement: List[float],
+                            quality_level: str) -> List[Dict]:
+        """Expand the forecast columns into the per-hour dicts of the full payload"""
+        return [
+            {
+                'hour': leads[i],
+                'time': time,
+                'dust': forecast['dust'][i],
+                'confidence': forecast['confidence'][i],
+                'confidence_interval': {
+                    'lower': forecast['lower'][i],
+                    'upper': forecast['upper'][i]
+                },
+                'risk_level': risk_levels[i],
+                'data_quality': quality_level,
+                'model_breakdown': dict(zip(breakdown_keys, breakdown[i])),
+                'model_agreement': agreement[i]
+            }
+            for i, time in enumerate(forecast['times'])
+        ]
+
+    def _input_columns(self, fused_inputs: List[Dict]) -> Dict[str, np.ndarray]:
+        """Per-city model inputs as (cities x 1) columns, with the model defaults applied"""
+        def column(field: str, default: float) -> np.ndarray:
+            return np.array([[data.get(field, default) or default] for data in fused_inputs], dtype=float)
+
+        return {
+            'dust': column('dust', 30),
+            'wind_speed': column('wind_speed', 10),
+            'wind_direction': column('wind_direction', 0),
+            'humidity': column('humidity', 40),
+            'temperature': column('temperature', 35),
+            'visibility': column('visibility', 10000)
+        }
+
+    def _calculate_advanced_confidence(self, std_dev: np.ndarray, mean_val: np.ndarray,
+                                       hours_ahead: np.ndarray, data_quality: np.ndarray,
+                                       city_ids: List[str]) -> np.ndarray:
         """Calculate confidence with advanced multi-factor analysis"""
         # Model agreement factor
-        std_dev = np.std(model_values)
-        mean_val = np.mean(model_values)
         cv = std_dev / (mean_val + 1)  # Coefficient of variation
-        agreement_factor = max(0.65, 1 - cv * 0.3)
+        agreement_factor = np.maximum(0.65, 1 - cv * 0.3)
         
         # Time decay - exponential decay with slower rate for better long-term confidence
-        time_decay = max(0.50, math.exp(-hours_ahead * 0.008))
+        time_decay = np.maximum(0.50, np.exp(-hours_ahead * 0.008))
         
         # Data quality factor
-        quality_factor = max(0.75, data_quality / 100)
+        quality_factor = np.maximum(0.75, data_quality / 100)
         
-        # Historical accuracy factor for this city
-        city_accuracy = 0.90  # Default
-        if city_id in self.learned_patterns:
-            city_accuracy = 0.92  # Higher confidence with learned patterns
+        # Historical accuracy factor per city - higher confidence with learned patterns
+        city_accuracy = np.array(
+            [[0.92 if city_id in self.learned_patterns else 0.90] for city_id in city_ids]
+        )
         
         # Base confidence from 7-model ensemble
         base_confidence = 0.92  # 92% base for 7-model ensemble
@@ -420,8 +1101,12 @@ class EnsemblePredictor:
             city_accuracy * 0.10
         )
         
-        return max(50, min(98, confidence))
+        return np.clip(confidence, 50, 98)
     
+    def set_model_enabled(self, name: str, enabled: bool):
+        """Turn an ensemble member on or off; the other weights are renormalized"""
+        self.models.set_enabled(name, enabled)
+
     def update_model_weights(self, performance_data: Dict[str, float]):
         """Dynamically update model weights based on performance using optimizer"""
         self.model_weights = self.weight_optimizer.update_weights(
@@ -429,8 +1114,7 @@ class EnsemblePredictor:
         )
         
         # Ensure all weights are present
-        for model in ['pattern', 'weather', 'persistence', 'climatology', 
-                      'api_forecast', 'neural_pattern', 'meta_ensemble']:
+        for model in self.models.names:
             if model not in self.model_weights:
                 self.model_weights[model] = 0.1
         
@@ -439,91 +1123,95 @@ class EnsemblePredictor:
         for model in self.model_weights:
             self.model_weights[model] /= total_weight
 
-    def _pattern_model(self, data: Dict, hours: int) -> List[float]:
+    def _pattern_model(self, inputs: Dict[str, np.ndarray], lead: np.ndarray,
+                       calendar: Dict[str, np.ndarray]) -> np.ndarray:
         """Enhanced seasonal + diurnal + weekly pattern-based prediction"""
-        current_dust = data.get('dust', 30) or 30
-        predictions = []
-        now = datetime.utcnow()
-
-        current_seasonal = self.seasonal_factors.get(now.month, 1.0)
-        current_diurnal = self.diurnal_factors.get(now.hour, 1.0)
-        current_weekly = self.weekly_factors.get(now.weekday(), 1.0)
+        current_dust = inputs['dust']
 
-        for i in range(hours):
-            future = now + timedelta(hours=i)
-            seasonal = self.seasonal_factors.get(future.month, 1.0)
-            diurnal = self.diurnal_factors.get(future.hour, 1.0)
-            weekly = self.weekly_factors.get(future.weekday(), 1.0)
+        # Combined pattern factor relative to the current hour
+        combined = calendar['seasonal'] * calendar['diurnal'] * calendar['weekly']
+        pattern_factor = combined / (combined[0] + 0.001)
 
-            # Combined pattern factor
-            pattern_factor = (seasonal * diurnal * weekly) / (current_seasonal * current_diurnal * current_weekly + 0.001)
-            
-            # Apply smoothing for stability
-            smoothing = 0.85 + 0.15 * math.exp(-i * 0.05)
-            predicted = current_dust * pattern_factor * smoothing + 30 * (1 - smoothing)
-            
-            predictions.append(max(0, predicted))
+        # Apply smoothing for stability
+        smoothing = 0.85 + 0.15 * np.exp(-lead * 0.05)
+        predicted = current_dust * pattern_factor * smoothing + 30 * (1 - smoothing)
 
-        return predictions
+        return np.maximum(0, predicted)
 
-    def _weather_model(self, data: Dict, hours: int) -> List[float]:
+    def _weather_model(self, inputs: Dict[str, np.ndarray], lead: np.ndarray) -> np.ndarray:
         """Enhanced weather-correlated prediction with multi-variable analysis"""
-        current_dust = data.get('dust', 30) or 30
-        wind_speed = data.get('wind_speed', 10) or 10
-        wind_direction = data.get('wind_direction', 0) or 0
-        humidity = data.get('humidity', 40) or 40
-        temperature = data.get('temperature', 35) or 35
-        visibility = data.get('visibility', 10000) or 10000
-
-        predictions = []
-        for i in range(hours):
-            # Wind speed factor - exponential relationship
-            if wind_speed > 20:
-                wind_factor = 1 + math.log(wind_speed / 15) * 0.4
-            elif wind_speed > 10:
-                wind_factor = 1 + (wind_speed - 10) / 50
-            else:
-                wind_factor = 0.9 + wind_speed / 100
-            
-            # Wind direction factor with finer granularity
-            dir_bucket = (int(wind_direction) // 5) * 5
-            dir_factor = self.wind_direction_factors.get(dir_bucket, 1.0)
-            
-            # Humidity factor - inverse relationship
-            humidity_factor = max(0.7, 1.2 - humidity / 150)
-            
-            # Temperature factor - higher temps increase dust suspension
-            temp_factor = 1 + max(0, (temperature - 30)) / 80
-            
-            # Visibility factor - low visibility indicates existing dust
-            vis_factor = 1 + max(0, (10000 - visibility) / 20000)
+        current_dust = inputs['dust']
+        wind_speed = inputs['wind_speed']
+        humidity = inputs['humidity']
+        temperature = inputs['temperature']
+        visibility = inputs['visibility']
 
-            # Time decay with slower rate
-            decay = 0.985 ** i
-            
-            # Combined prediction
-            predicted = current_dust * wind_factor * dir_factor * humidity_factor * temp_factor * vis_factor * decay
-            predicted += 30 * (1 - decay)  # Regression to mean
+        # Wind speed factor - exponential relationship
+        wind_factor = np.where(
+            wind_speed > 20,
+            1 + np.log(np.maximum(wind_speed, 20) / 15) * 0.4,
+            np.where(wind_speed > 10, 1 + (wind_speed - 10) / 50, 0.9 + wind_speed / 100)
+        )
 
-            predictions.append(max(0, predicted))
+        # Wind direction factor with finer granularity
+        dir_factor = np.array([
+            [self.wind_direction_factors.get((int(direction) // 5) * 5, 1.0)]
+            for direction in inputs['wind_direction'][:, 0].tolist()
+        ])
 
-        return predictions
+        # Humidity factor - inverse relationship
+        humidity_factor = np.maximum(0.7, 1.2 - humidity / 150)
 
-    def _persistence_model(self, city_id: str, data: Dict, hours: int) -> List[float]:
+        # Temperature factor - higher temps increase dust suspension
+        temp_factor = 1 + np.maximum(0, (temperature - 30)) / 80
+
+        # Visibility factor - low visibility indicates existing dust
+        vis_factor = 1 + np.maximum(0, (10000 - visibility) / 20000)
+
+        # Time decay with slower rate
+        decay = 0.985 ** lead
+
+        # Combined prediction with regression to mean
+        weather_factor = wind_factor * dir_factor * humidity_factor * temp_factor * vis_factor
+        predicted = current_dust * weather_factor * decay + 30 * (1 - decay)
+
+        return np.maximum(0, predicted)
+
+    def _persistence_model(self, city_ids: List[str], inputs: Dict[str, np.ndarray],
+                           lead: np.ndarray) -> np.ndarray:
         """Enhanced trend extrapolation with momentum"""
-        current_dust = data.get('dust', 30) or 30
-        history = self.history.get(city_id, [])
+        current_dust = inputs['dust']
+        trends = {city_id: self._history_trend(city_id) for city_id in dict.fromkeys(city_ids)}
+        trend_momentum = np.array([trends[city_id] for city_id in city_ids])
+        trend = trend_momentum[:, 0:1]
+        momentum = trend_momentum[:, 1:2]
+
+        # Trend decay with momentum
+        trend_decay = 0.92 ** lead
+        momentum_decay = 0.85 ** lead
+        predicted = current_dust + (trend * lead * trend_decay) + (momentum * lead * lead * momentum_decay * 0.1)
+
+        # Regression to climatological mean
+        regression = 0.015 * lead
+        predicted = predicted * (1 - regression) + 30 * regression
+
+        return np.maximum(0, predicted)
+
+    def _history_trend(self, city_id: str) -> List[float]:
+        """Recent dust trend and momentum (acceleration) for the persistence model"""
+        history = self.history.get(city_id)
 
         # Calculate trend with momentum
         trend = 0
         momentum = 0
-        if len(history) >= 24:
-            recent_values = [h['dust'] for h in history[-24:] if h.get('dust')]
+        if history is not None and len(history) >= 24:
+            window = history.window('dust', 24)
+            recent_values = window[~np.isnan(window) & (window != 0)].tolist()
             if len(recent_values) >= 6:
                 # Short-term trend
-                short_trend = (recent_values[-1] - recent_values[-6]) / 6 if len(recent_values) >= 6 else 0
+                short_trend = (recent_values[-1] - recent_values[-6]) / 6
                 # Medium-term trend
-                mid_trend = (recent_values[-1] - recent_values[0]) / len(recent_values) if recent_values else 0
+                mid_trend = (recent_values[-1] - recent_values[0]) / len(recent_values)
                 # Weighted combination
                 trend = short_trend * 0.6 + mid_trend * 0.4
                 
@@ -532,135 +1220,105 @@ class EnsemblePredictor:
                     old_trend = (recent_values[-6] - recent_values[-12]) / 6
                     momentum = (short_trend - old_trend) * 0.3
 
-        predictions = []
-        for i in range(hours):
-            # Trend decay with momentum
-            trend_decay = 0.92 ** i
-            momentum_decay = 0.85 ** i
-            
-            predicted = current_dust + (trend * i * trend_decay) + (momentum * i * i * momentum_decay * 0.1)
-            
-            # Regression to climatological mean
-            regression = 0.015 * i
-            predicted = predicted * (1 - regression) + 30 * regression
-            
-            predictions.append(max(0, predicted))
-
-        return predictions
+        return [trend, momentum]
 
-    def _climatology_model(self, hours: int) -> List[float]:
+    def _climatology_model(self, n_cities: int, lead: np.ndarray,
+                           calendar: Dict[str, np.ndarray]) -> np.ndarray:
         """Enhanced historical average-based prediction with variance"""
-        now = datetime.utcnow()
-        
-        # Monthly averages based on UAE meteorological data
-        monthly_averages = {
-            1: 22, 2: 25, 3: 32, 4: 42,
-            5: 58, 6: 68, 7: 62, 8: 57,
-            9: 47, 10: 36, 11: 28, 12: 22
-        }
-        
-        # Monthly standard deviations
-        monthly_stds = {
-            1: 8, 2: 10, 3: 15, 4: 18,
-            5: 22, 6: 25, 7: 23, 8: 20,
-            9: 18, 10: 14, 11: 10, 12: 8
-        }
+        # Small seeded variation based on climatological variance, same for every city
+        predicted = np.maximum(0, calendar['climatology'] + calendar['climatology_noise'])
+        return np.broadcast_to(predicted, (n_cities, len(lead)))
 
-        predictions = []
-        for i in range(hours):
-            future = now + timedelta(hours=i)
-            month_avg = monthly_averages.get(future.month, 35)
-            month_std = monthly_stds.get(future.month, 15)
-            diurnal = self.diurnal_factors.get(future.hour, 1.0)
-            weekly = self.weekly_factors.get(future.weekday(), 1.0)
-            
-            # Add small random variation based on climatological variance
-            variation = np.random.normal(0, month_std * 0.1)
-            
-            predicted = month_avg * diurnal * weekly + variation
-            predictions.append(max(0, predicted))
-
-        return predictions
+    def _api_forecast_values(self, fused_inputs: List[Dict], lead: np.ndarray) -> np.ndarray:
+        """Per-city hourly API dust forecasts at the lead steps; missing or None hours become NaN"""
+        api_values = np.full((len(fused_inputs), len(lead)), np.nan)
+        index = lead.astype(np.intp)
+        for row, data in enumerate(fused_inputs):
+            forecast = data.get('forecast_dust', []) or []
+            available = index < len(forecast)
+            if available.any():
+                api_values[row, available] = np.array(forecast, dtype=float)[index[available]]
+        return api_values
 
-    def _api_forecast_model(self, data: Dict, hours: int) -> List[float]:
+    def _api_forecast_model(self, api_values: np.ndarray, inputs: Dict[str, np.ndarray],
+                            lead: np.ndarray) -> np.ndarray:
         """Enhanced API forecast integration with quality weighting"""
-        forecast = data.get('forecast_dust', [])
-        current_dust = data.get('dust', 30) or 30
-
-        predictions = []
-        for i in range(hours):
-            if i < len(forecast) and forecast[i] is not None:
-                # Trust API forecast more for near-term
-                api_weight = max(0.5, 1 - i * 0.02)
-                predicted = forecast[i] * api_weight + current_dust * (1 - api_weight)
-            else:
-                # Fallback with decay
-                decay = 0.98 ** i
-                predicted = current_dust * decay + 30 * (1 - decay)
-            
-            predictions.append(max(0, predicted))
+        current_dust = inputs['dust']
+
+        # Trust API forecast more for near-term
+        api_weight = np.maximum(0.5, 1 - lead * 0.02)
+        blended = api_values * api_weight + current_dust * (1 - api_weight)
 
-        return predictions
+        # Fallback with decay
+        decay = 0.98 ** lead
+        fallback = current_dust * decay + 30 * (1 - decay)
 
-    def _neural_pattern_model(self, city_id: str, data: Dict, hours: int) -> List[float]:
+        predicted = np.where(np.isnan(api_values), fallback, blended)
+        return np.maximum(0, predicted)
+
+    def _neural_pattern_model(self, city_ids: List[str], inputs: Dict[str, np.ndarray],
+                              lead: np.ndarray, calendar: Dict[str, np.ndarray]) -> np.ndarray:
         """Learned pattern model using city-specific historical correlations"""
-        current_dust = data.get('dust', 30) or 30
-        patterns = self.learned_patterns.get(city_id, {})
-        
-        predictions = []
-        now = datetime.utcnow()
-        
-        for i in range(hours):
-            future = now + timedelta(hours=i)
-            
+        current_dust = inputs['dust']
+
+        # Learned hourly averages and wind correlation per distinct city, then per row
+        unique_ids = {city_id: i for i, city_id in enumerate(dict.fromkeys(city_ids))}
+        hour_tables = np.full((len(unique_ids), 24), 30.0)
+        wind_corr = np.full((len(unique_ids), 1), 0.3)
+        has_patterns = np.zeros((len(unique_ids), 1), dtype=bool)
+        for city_id, row in unique_ids.items():
+            patterns = self.learned_patterns.get(city_id, {})
             if patterns and 'hourly_averages' in patterns:
-                # Use learned hourly pattern
-                hour_avg = patterns['hourly_averages'].get(future.hour, 30)
-                # baseline = patterns.get('baseline_dust', 30)  - Unused
-                
-                # Blend current observation with learned pattern
-                blend_factor = max(0.3, 1 - i * 0.015)
-                predicted = current_dust * blend_factor + hour_avg * (1 - blend_factor)
-                
-                # Apply learned wind correlation if available
-                wind_corr = patterns.get('wind_correlation', 0.3)
-                wind_speed = data.get('wind_speed', 10) or 10
-                wind_adjustment = 1 + wind_corr * (wind_speed - 15) / 50
-                predicted *= wind_adjustment
-            else:
-                # Fallback to simple decay
-                decay = 0.97 ** i
-                predicted = current_dust * decay + 30 * (1 - decay)
-            
-            predictions.append(max(0, predicted))
-        
-        return predictions
+                has_patterns[row] = True
+                for hour, avg in patterns['hourly_averages'].items():
+                    hour_tables[row, hour] = avg
+                wind_corr[row] = patterns.get('wind_correlation', 0.3)
 
-    def _meta_ensemble_model(self, model_predictions: List[List[float]], hours: int) -> List[float]:
-        """Meta-model that optimally combines other model predictions"""
-        predictions = []
-        
-        for i in range(hours):
-            hour_preds = [preds[i] for preds in model_predictions]
-            
-            # Remove outliers using IQR method
-            q1 = np.percentile(hour_preds, 25)
-            q3 = np.percentile(hour_preds, 75)
-            iqr = q3 - q1
-            lower_bound = q1 - 1.5 * iqr
-            upper_bound = q3 + 1.5 * iqr
-            
-            filtered_preds = [p for p in hour_preds if lower_bound <= p <= upper_bound]
-            
-            if filtered_preds:
-                # Weighted median (more robust than mean)
-                predicted = np.median(filtered_preds)
-            else:
-                predicted = np.mean(hour_preds)
-            
-            predictions.append(max(0, predicted))
-        
-        return predictions
+        if len(unique_ids) < len(city_ids):
+            rows = np.array([unique_ids[city_id] for city_id in city_ids])
+            hour_tables, wind_corr, has_patterns = hour_tables[rows], wind_corr[rows], has_patterns[rows]
+
+        # Blend current observation with learned pattern
+        hour_avg = hour_tables[:, calendar['hour']]
+        blend_factor = np.maximum(0.3, 1 - lead * 0.015)
+        learned = current_dust * blend_factor + hour_avg * (1 - blend_factor)
+
+        # Apply learned wind correlation
+        wind_adjustment = 1 + wind_corr * (inputs['wind_speed'] - 15) / 50
+        learned = learned * wind_adjustment
+
+        # Fallback to simple decay
+        decay = 0.97 ** lead
+        fallback = current_dust * decay + 30 * (1 - decay)
+
+        predicted = np.where(has_patterns, learned, fallback)
+        return np.maximum(0, predicted)
+
+    def _meta_ensemble_model(self, model_tensor: np.ndarray) -> np.ndarray:
+        """Meta-model that optimally combines other model predictions.
+
+        Works on the whole (cities x models x hours) tensor at once with a
+        single sort along the model axis: IQR outlier filtering, then the
+        median of the surviving values per city and hour.
+        """
+        # Remove outliers using IQR method
+        ordered = np.sort(model_tensor, axis=1)
+        q1 = sorted_percentile(ordered, 25)[:, np.newaxis, :]
+        q3 = sorted_percentile(ordered, 75)[:, np.newaxis, :]
+        iqr = q3 - q1
+
+        # Kept values form one contiguous run [start, start + kept_count) of the
+        # sorted column; the median (more robust than mean) is its middle
+        start = (ordered < q1 - 1.5 * iqr).sum(axis=1, keepdims=True)
+        kept_count = (ordered <= q3 + 1.5 * iqr).sum(axis=1, keepdims=True) - start
+        last = ordered.shape[1] - 1
+        lower_mid = np.take_along_axis(ordered, np.minimum(start + np.maximum(kept_count - 1, 0) // 2, last), axis=1)
+        upper_mid = np.take_along_axis(ordered, np.minimum(start + kept_count // 2, last), axis=1)
+        median = ((lower_mid + upper_mid) / 2)[:, 0, :]
+
+        # Fall back to the plain mean if nothing survives the filter
+        predicted = np.where(kept_count[:, 0, :] > 0, median, model_tensor.mean(axis=1))
+        return np.maximum(0, predicted)
 
     def _get_risk_level(self, dust: float) -> str:
         if dust < 20:
@@ -674,41 +1332,29 @@ class EnsemblePredictor:
         else:
             return "EXTREME"
 
-    def _find_risk_periods(self, predictions: List[Dict]) -> List[Dict]:
+    def _get_risk_levels(self, dust: np.ndarray) -> List[str]:
+        """Vectorized _get_risk_level over a horizon"""
+        bands = np.searchsorted(RISK_THRESHOLDS, dust, side='right')
+        return [RISK_LEVELS[b] for b in bands.tolist()]
+
+    def _find_risk_periods(self, dust: List[float], times: List[str], leads: List[int],
+                           step_hours: np.ndarray) -> List[Dict]:
         """Find continuous elevated risk periods"""
+        dust_values = np.asarray(dust)
+        elevated = np.concatenate(([False], dust_values >= 50, [False]))
+        edges = np.flatnonzero(np.diff(elevated.astype(np.int8)))
+
         risk_periods = []
-        in_risk = False
-        start_idx = 0
-
-        for i, pred in enumerate(predictions):
-            dust = pred['dust']
-            if dust >= 50 and not in_risk:
-                in_risk = True
-                start_idx = i
-            elif dust < 50 and in_risk:
-                in_risk = False
-                period = predictions[start_idx:i]
-                peak = max(p['dust'] for p in period)
-                risk_periods.append({
-                    'start_hour': start_idx,
-                    'end_hour': i,
-                    'start_time': predictions[start_idx]['time'],
-                    'end_time': predictions[i-1]['time'],
-                    'duration_hours': i - start_idx,
-                    'peak_dust': round(peak, 2),
-                    'severity': self._get_risk_level(peak),
-                    'recommendation': self._get_recommendation(peak)
-                })
-
-        if in_risk:
-            period = predictions[start_idx:]
-            peak = max(p['dust'] for p in period)
+        for start_idx, end_idx in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            peak = float(dust_values[start_idx:end_idx].max())
+            start_hour = leads[start_idx]
+            end_hour = leads[end_idx - 1] + int(step_hours[end_idx - 1])
             risk_periods.append({
-                'start_hour': start_idx,
-                'end_hour': len(predictions),
-                'start_time': predictions[start_idx]['time'],
-                'end_time': predictions[-1]['time'],
-                'duration_hours': len(predictions) - start_idx,
+                'start_hour': start_hour,
+                'end_hour': end_hour,
+                'start_time': times[start_idx],
+                'end_time': times[end_idx - 1],
+                'duration_hours': end_hour - start_hour,
                 'peak_dust': round(peak, 2),
                 'severity': self._get_risk_level(peak),
                 'recommendation': self._get_recommendation(peak)
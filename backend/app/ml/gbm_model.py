@@ -0,0 +1,243 @@
+"""
+Gradient-Boosted Horizon Model - offline-trained tree ensemble member
+
+One HistGradientBoostingRegressor per forecast-horizon bucket, trained from
+stored readings in a background process and saved as versioned, uncompressed
+joblib artifacts. The API loads them with mmap_mode='r', so the fitted trees
+(plain numpy node arrays) are shared page-for-page between worker processes.
+
+Run a training job by hand with:
+    python -m app.ml.gbm_model
+"""
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.ml.ensemble_predictor import to_epoch
+
+logger = logging.getLogger(__name__)
+
+GBM_MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models', 'gbm')
+
+# Upper bounds (exclusive, in hours ahead) of every bucket but the last
+HORIZON_BUCKET_EDGES = np.array([6, 24, 48])
+
+# Lead times sampled when building training pairs
+TRAINING_LEADS = (1, 2, 3, 5, 6, 9, 12, 18, 23, 24, 30, 36, 42, 47, 48, 60, 72)
+
+# A training target must lie within this many seconds of reading time + lead
+TARGET_TOLERANCE = 1800
+MIN_BUCKET_SAMPLES = 200
+
+# Artifact versions kept on disk; older ones are deleted after each save
+KEEP_VERSIONS = 3
+
+FEATURE_NAMES = (
+    'dust', 'wind_speed', 'wind_dir_sin', 'wind_dir_cos', 'humidity', 'temperature',
+    'visibility', 'lead', 'target_hour_sin', 'target_hour_cos', 'target_month'
+)
+# Same defaults EnsemblePredictor._input_columns applies at inference time
+INPUT_DEFAULTS = {
+    'wind_speed': 10, 'wind_direction': 0, 'humidity': 40, 'temperature': 35, 'visibility': 10000
+}
+
+
+def build_features(inputs: Dict[str, np.ndarray], lead: np.ndarray,
+                   target_hour: np.ndarray, target_month: np.ndarray) -> np.ndarray:
+    """Feature matrix (n_samples x FEATURE_NAMES) from broadcastable arrays.
+
+    Used both for training pairs (1-D arrays) and for inference, where the
+    inputs are (rows x 1) columns and the lead/calendar arrays run over the
+    horizon; every argument is broadcast to a common shape and flattened.
+    """
+    direction = np.radians(inputs['wind_direction'])
+    hour_angle = 2 * math.pi * target_hour / 24
+    columns = np.broadcast_arrays(
+        inputs['dust'], inputs['wind_speed'], np.sin(direction), np.cos(direction),
+        inputs['humidity'], inputs['temperature'], inputs['visibility'],
+        lead, np.sin(hour_angle), np.cos(hour_angle), target_month
+    )
+    return np.stack([column.ravel() for column in columns], axis=1).astype(np.float64)
+
+
+def horizon_bucket(lead: np.ndarray) -> np.ndarray:
+    return np.searchsorted(HORIZON_BUCKET_EDGES, lead, side='right')
+
+
+def training_arrays(readings: List[Dict]):
+    """Pair every reading with the reading `lead` hours later -> (X, y, bucket)"""
+    by_city: Dict[str, List[Dict]] = {}
+    for reading in readings:
+        by_city.setdefault(reading['city_id'], []).append(reading)
+
+    features, targets, buckets = [], [], []
+    for rows in by_city.values():
+        timestamps = np.array([to_epoch(row.get('timestamp')) for row in rows], dtype=float)
+        columns = {'dust': np.array([row.get('dust') for row in rows], dtype=float)}
+        for field, default in INPUT_DEFAULTS.items():
+            columns[field] = np.array([row.get(field) or default for row in rows], dtype=float)
+        valid = ~np.isnan(timestamps) & ~np.isnan(columns['dust'])
+        order = np.argsort(timestamps[valid], kind='stable')
+        timestamps = timestamps[valid][order]
+        columns = {field: values[valid][order] for field, values in columns.items()}
+        if len(timestamps) < 2:
+            continue
+
+        for lead in TRAINING_LEADS:
+            wanted = timestamps + lead * 3600
+            # Nearest reading to the target time
+            right = np.clip(np.searchsorted(timestamps, wanted), 1, len(timestamps) - 1)
+            left = right - 1
+            nearest = np.where(wanted - timestamps[left] <= timestamps[right] - wanted, left, right)
+            matched = np.abs(timestamps[nearest] - wanted) <= TARGET_TOLERANCE
+            if not matched.any():
+                continue
+
+            target_times = [datetime.utcfromtimestamp(t) for t in wanted[matched].tolist()]
+            features.append(build_features(
+                {field: values[matched] for field, values in columns.items()},
+                np.full(int(matched.sum()), float(lead)),
+                np.array([t.hour for t in target_times], dtype=float),
+                np.array([t.month for t in target_times], dtype=float)
+            ))
+            targets.append(columns['dust'][nearest[matched]])
+            buckets.append(np.full(int(matched.sum()), horizon_bucket(lead)))
+
+    if not features:
+        return np.empty((0, len(FEATURE_NAMES))), np.empty(0), np.empty(0, dtype=int)
+    return np.concatenate(features), np.concatenate(targets), np.concatenate(buckets)
+
+
+def train_models(readings: List[Dict], max_iter: int = 200) -> Dict:
+    """Fit one regressor per horizon bucket; raises ValueError if a bucket lacks data"""
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+    X, y, bucket = training_arrays(readings)
+    models, samples = [], []
+    for b in range(len(HORIZON_BUCKET_EDGES) + 1):
+        mask = bucket == b
+        if mask.sum() < MIN_BUCKET_SAMPLES:
+            raise ValueError(f"Not enough training pairs for horizon bucket {b} ({int(mask.sum())})")
+        model = HistGradientBoostingRegressor(max_iter=max_iter, learning_rate=0.1,
+                                              max_leaf_nodes=31, random_state=0)
+        model.fit(X[mask], y[mask])
+        models.append(model)
+        samples.append(int(mask.sum()))
+    return {'models': models, 'samples': samples}
+
+
+def save_artifacts(trained: Dict, model_dir: str = GBM_MODEL_DIR) -> str:
+    """Write a new artifact version, point CURRENT at it and prune old ones; returns the version"""
+    import joblib
+
+    version = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    final_dir = os.path.join(model_dir, version)
+    tmp_dir = f"{final_dir}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    for b, model in enumerate(trained['models']):
+        # Uncompressed so the arrays can be memory-mapped on load
+        joblib.dump(model, os.path.join(tmp_dir, f'bucket_{b}.joblib'))
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump({
+            'version': version,
+            'created_at': datetime.utcnow().isoformat(),
+            'features': FEATURE_NAMES,
+            'bucket_edges': HORIZON_BUCKET_EDGES.tolist(),
+            'samples': trained['samples']
+        }, f)
+    os.replace(tmp_dir, final_dir)
+
+    pointer = os.path.join(model_dir, 'CURRENT')
+    with open(f"{pointer}.tmp", 'w') as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)
+    prune_artifacts(model_dir)
+    return version
+
+
+def prune_artifacts(model_dir: str = GBM_MODEL_DIR, keep: int = KEEP_VERSIONS) -> List[str]:
+    """Delete all but the newest `keep` artifact versions; returns the deleted versions.
+
+    Versions are UTC timestamps, so they sort by age. Processes still
+    memory-mapping a deleted version keep their mapping until they reload.
+    """
+    versions = sorted(
+        name for name in os.listdir(model_dir)
+        if os.path.isfile(os.path.join(model_dir, name, 'manifest.json'))
+    )
+    removed = versions[:-keep] if keep > 0 else []
+    for version in removed:
+        try:
+            shutil.rmtree(os.path.join(model_dir, version))
+        except OSError as e:
+            logger.warning(f"Could not delete GBM artifact {version}: {e}")
+    return removed
+
+
+def train_and_save(days: int = 30, model_dir: str = GBM_MODEL_DIR) -> str:
+    """Training job entry point: stored readings -> new artifact version"""
+    from app.core.database import get_all_readings_for_training
+
+    started = time.perf_counter()
+    trained = train_models(get_all_readings_for_training(days=days))
+    version = save_artifacts(trained, model_dir)
+    logger.info(f"Trained GBM {version} on {sum(trained['samples'])} pairs in {time.perf_counter() - started:.1f}s")
+    return version
+
+
+class GBMHorizonModel:
+    """Loaded artifact version: batched inference over all rows and hours"""
+
+    def __init__(self, version: str, models: List, manifest: Dict):
+        self.version = version
+        self.models = models
+        self.manifest = manifest
+
+    @classmethod
+    def load_latest(cls, model_dir: str = GBM_MODEL_DIR) -> Optional['GBMHorizonModel']:
+        """Memory-map the CURRENT artifact version, or None if there is none"""
+        import joblib
+
+        try:
+            with open(os.path.join(model_dir, 'CURRENT')) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+
+        version_dir = os.path.join(model_dir, version)
+        with open(os.path.join(version_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if tuple(manifest['features']) != FEATURE_NAMES:
+            raise ValueError(f"GBM artifact {version} was trained with different features")
+        models = [
+            joblib.load(os.path.join(version_dir, f'bucket_{b}.joblib'), mmap_mode='r')
+            for b in range(len(manifest['bucket_edges']) + 1)
+        ]
+        return cls(version, models, manifest)
+
+    def predict(self, inputs: Dict[str, np.ndarray], lead: np.ndarray,
+                calendar: Dict[str, np.ndarray]) -> np.ndarray:
+        """(rows x hours) dust forecast, one predict() call per horizon bucket"""
+        rows, hours = len(inputs['dust']), len(lead)
+        X = build_features(inputs, lead, calendar['hour'], calendar['month'])
+        bucket = np.broadcast_to(horizon_bucket(lead), (rows, hours)).ravel()
+
+        predicted = np.empty(rows * hours)
+        for b, model in enumerate(self.models):
+            mask = bucket == b
+            if mask.any():
+                predicted[mask] = model.predict(X[mask])
+        return np.maximum(0, predicted.reshape(rows, hours))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(train_and_save())
@@ -10,7 +10,8 @@ import random
 
 from app.config import settings
 from app.services.cache_service import CacheService
-from app.services.prediction_engine import PredictionEngine
+from app.services.prediction_engine import prediction_engine
+from app.ml.ensemble_predictor import PAYLOAD_LITE, PAYLOAD_MODES
 from app.core.database import save_reading
 
 from app.data_sources.open_meteo import OpenMeteoSource
@@ -28,9 +29,14 @@ logger = logging.getLogger(__name__)
 class DataCollector:
     def __init__(self):
         self.cache = CacheService()
-        self.prediction_engine = PredictionEngine()
+        self.prediction_engine = prediction_engine
         self.collection_interval = settings.COLLECTION_INTERVAL
         self.last_collection = {}
+        # Published readings keep the full forecast lists unless configured otherwise
+        self.forecast_verbosity = settings.READING_FORECAST_VERBOSITY
+        if self.forecast_verbosity not in PAYLOAD_MODES:
+            raise ValueError(f"Unknown READING_FORECAST_VERBOSITY '{self.forecast_verbosity}', "
+                             f"expected one of {PAYLOAD_MODES}")
         
         self.sources = [
             OpenMeteoSource(),
@@ -61,6 +67,9 @@ class DataCollector:
                     })
                 
                 logger.info(f"✅ Collected {len(data)} cities from {self._count_active_sources()} sources")
+                
+                await self.prediction_engine.persist_forecasts()
+                await self.prediction_engine.snapshot_if_due()
             except Exception as e:
                 logger.error(f"❌ Collection error: {e}")
             
@@ -87,26 +96,58 @@ class DataCollector:
         all_data = []
         
         async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-            tasks = [self.collect_city(session, city) for city in settings.UAE_CITIES]
+            tasks = [self._fetch_sources(session, city) for city in settings.UAE_CITIES]
             results = await asyncio.gather(*tasks, return_exceptions=True)
 
-            for city, result in zip(settings.UAE_CITIES, results):
-                if isinstance(result, Exception):
-                    logger.error(f"Failed {city['name']}: {result}")
-                    result = await self.get_fallback_data(city)
-                
-                if result:
-                    await self.cache.set_current(city['id'], result)
-                    # Save to database
-                    try:
-                        save_reading(city['id'], result)
-                    except Exception as e:
-                        logger.error(f"DB save error: {e}")
-                    all_data.append(result)
+        # Fuse every city that returned data, then predict the changed ones in one batch
+        fused = {}
+        for city, result in zip(settings.UAE_CITIES, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed {city['name']}: {result}")
+            elif result:
+                fused[city['id']] = (result, self.ensemble_fusion(result))
+
+        predictions = {}
+        if fused:
+            try:
+                batch = await self.prediction_engine.refresh_batch(
+                    list(fused), [fused_data for _, fused_data in fused.values()],
+                    verbosity=self.forecast_verbosity
+                )
+                predictions = dict(zip(fused, batch))
+            except Exception as e:
+                logger.error(f"Batch prediction failed: {e}")
+
+        for city in settings.UAE_CITIES:
+            if city['id'] in predictions:
+                sources_data, fused_data = fused[city['id']]
+                result = self._build_reading(city, sources_data, fused_data, predictions[city['id']])
+            else:
+                result = await self.get_fallback_data(city)
+            
+            if result:
+                await self.cache.set_current(city['id'], result)
+                self.prediction_engine.invalidate(city['id'])
+                # Save to database
+                try:
+                    save_reading(city['id'], result)
+                except Exception as e:
+                    logger.error(f"DB save error: {e}")
+                all_data.append(result)
 
         return all_data
 
     async def collect_city(self, session: aiohttp.ClientSession, city: Dict) -> Dict:
+        sources_data = await self._fetch_sources(session, city)
+
+        if not sources_data:
+            return await self.get_fallback_data(city)
+
+        fused_data = self.ensemble_fusion(sources_data)
+        prediction = await self.prediction_engine.query(city['id'], fused_data, verbosity=self.forecast_verbosity)
+        return self._build_reading(city, sources_data, fused_data, prediction)
+
+    async def _fetch_sources(self, session: aiohttp.ClientSession, city: Dict) -> List[Dict]:
         sources_data = []
         
         fetch_tasks = []
@@ -126,11 +167,9 @@ class DataCollector:
                     'data': result
                 })
 
-        if not sources_data:
-            return await self.get_fallback_data(city)
+        return sources_data
 
-        fused_data = self.ensemble_fusion(sources_data)
-        prediction = await self.prediction_engine.predict(city['id'], fused_data)
+    def _build_reading(self, city: Dict, sources_data: List[Dict], fused_data: Dict, prediction: Dict) -> Dict:
         confidence = self.calculate_confidence(sources_data, fused_data)
 
         return {
@@ -153,13 +192,21 @@ class DataCollector:
             'confidence': round(confidence, 1),
             'sources_used': len(sources_data),
             'sources_list': [s['source'] for s in sources_data],
-            'forecast_24h': prediction.get('forecast_24h', []),
-            'forecast_72h': prediction.get('forecast_72h', []),
+            **self._forecast_fields(prediction),
             'next_risk_period': prediction.get('next_risk_period'),
             'trend': self.calculate_trend(city['id'], fused_data.get('dust') or 0),
             'data_quality': self._assess_data_quality(sources_data)
         }
 
+    def _forecast_fields(self, prediction: Dict) -> Dict:
+        """Forecast of a published reading in the configured layout (full lists or lite columns)"""
+        if self.forecast_verbosity == PAYLOAD_LITE:
+            return {'forecast': prediction.get('forecast')}
+        return {
+            'forecast_24h': prediction.get('forecast_24h', []),
+            'forecast_72h': prediction.get('forecast_72h', [])
+        }
+
     async def _fetch_with_source(self, session, source, lat, lon, city_id=None):
         try:
             if city_id:
@@ -294,8 +341,7 @@ class DataCollector:
             'confidence': 25.0,
             'sources_used': 0,
             'sources_list': [],
-            'forecast_24h': [],
-            'forecast_72h': [],
+            **self._forecast_fields({}),
             'trend': 'stable',
             'data_quality': 'fallback'
         }
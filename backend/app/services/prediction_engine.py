@@ -1,19 +1,638 @@
 """
 Prediction Engine - Wrapper for ML Ensemble Predictor
 """
-from typing import Dict
-from app.ml.ensemble_predictor import EnsemblePredictor
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from app.config import settings
+from app.ml.ensemble_predictor import (
+    EnsemblePredictor, PAYLOAD_FULL, get_accuracy_tracker, get_data_quality_checker
+)
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_THREAD = "thread"
+EXECUTOR_PROCESS = "process"
+EXECUTOR_MODES = (EXECUTOR_THREAD, EXECUTOR_PROCESS)
+
+# Predictor state snapshot, next to the SQLite database
+PREDICTOR_STATE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'predictor_state.npz')
+
+# Fused-input fields the ensemble reads; anything else does not change a forecast
+FINGERPRINT_FIELDS = ('dust', 'temperature', 'humidity', 'wind_speed', 'wind_direction',
+                      'visibility', 'pressure', 'sources_used')
+
+
+def input_fingerprint(data: Dict) -> str:
+    """Stable digest of the model-relevant part of a fused input (values rounded to 0.01)"""
+    def rounded(value):
+        return round(value, 2) if isinstance(value, (int, float)) else value
+
+    payload = [rounded(data.get(field)) for field in FINGERPRINT_FIELDS]
+    payload.append([rounded(v) for v in data.get('forecast_dust') or []])
+    return hashlib.blake2b(json.dumps(payload).encode(), digest_size=12).hexdigest()
+
+
+def shift_prediction(result: Dict, now: datetime) -> Dict:
+    """Copy of a prediction with every timestamp moved so it starts at `now`.
+
+    Within the forecast hour a re-run on the same input gives the same
+    values at the same leads, so only the absolute times need to change.
+    """
+    delta = now - datetime.fromisoformat(result['generated_at'])
+
+    def shift(timestamp: str) -> str:
+        return (datetime.fromisoformat(timestamp) + delta).isoformat()
+
+    def shift_period(period: Optional[Dict]) -> Optional[Dict]:
+        if period is None:
+            return None
+        return dict(period, start_time=shift(period['start_time']), end_time=shift(period['end_time']))
+
+    shifted = dict(
+        result,
+        generated_at=now.isoformat(),
+        risk_periods=[shift_period(period) for period in result['risk_periods']],
+        next_risk_period=shift_period(result['next_risk_period']),
+        summary=dict(result['summary'], peak_time=shift(result['summary']['peak_time']))
+    )
+    if 'forecast' in result:
+        shifted['forecast'] = dict(result['forecast'], times=[shift(t) for t in result['forecast']['times']])
+    if 'forecast_72h' in result:
+        points = [dict(point, time=shift(point['time'])) for point in result['forecast_72h']]
+        shifted['forecast_72h'] = points
+        shifted['forecast_24h'] = points[:24]
+    return shifted
+
+
+def shard_index(city_id: str, shards: int) -> int:
+    """Process-pool shard that owns a city's predictor state"""
+    return zlib.crc32(city_id.encode()) % shards
+
+
+def restore_predictor(ensemble: EnsemblePredictor, path: str, keep=None) -> str:
+    """Warm-start a predictor from the snapshot at `path`, falling back to the
+    stored readings in SQLite (one bulk query). Returns the source used."""
+    try:
+        with np.load(path) as arrays:
+            ensemble.restore_state(arrays, keep)
+        return 'snapshot'
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not load predictor snapshot {path}: {e}")
+
+    try:
+        from app.core.database import get_history_readings
+        ensemble.load_readings(get_history_readings(), keep)
+        return 'database'
+    except Exception as e:
+        logger.warning(f"Could not rebuild predictor history from the database: {e}")
+        return 'empty'
+
+
+def write_snapshot(path: str, arrays: Dict[str, np.ndarray]):
+    """Write state arrays as an uncompressed .npz, atomically replacing the previous snapshot"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _run_ensemble(ensemble: EnsemblePredictor, city_ids: List[str], fused_inputs: List[Dict],
+                  hours_ahead: int, verbosity: str, include_breakdown: bool, commit: bool,
+                  members: int = 0) -> List[Dict]:
+    """Run one ensemble pass; committed predictions first feed the city's history"""
+    if commit:
+        for city_id, current_data in zip(city_ids, fused_inputs):
+            ensemble.add_historical_data(city_id, current_data)
+
+    return ensemble.predict_batch(city_ids, fused_inputs, hours_ahead, verbosity,
+                                  include_breakdown, commit, members)
+
+
+def _ingest_observations(ensemble: EnsemblePredictor, city_ids: List[str], fused_inputs: List[Dict]):
+    """Feed observations whose forecast is reused: history and quality tracking, no model run"""
+    data_quality_checker = get_data_quality_checker()
+    for city_id, current_data in zip(city_ids, fused_inputs):
+        ensemble.add_historical_data(city_id, current_data)
+        data_quality_checker.validate_reading(current_data, track=True, city_id=city_id)
+
+
+# Predictor state of a process-pool shard, created once per worker process
+_worker_ensemble: Optional[EnsemblePredictor] = None
+
+
+def _init_worker(disabled_models=()):
+    global _worker_ensemble
+    _worker_ensemble = EnsemblePredictor()
+    for name in disabled_models:
+        _worker_ensemble.set_model_enabled(name, False)
+
+
+def _worker_restore(path: str, shard: int, shards: int) -> str:
+    return restore_predictor(_worker_ensemble, path, lambda city_id: shard_index(city_id, shards) == shard)
+
+
+def _worker_state() -> Dict[str, np.ndarray]:
+    return _worker_ensemble.state_arrays()
+
+
+def _worker_set_model(name: str, enabled: bool):
+    _worker_ensemble.set_model_enabled(name, enabled)
+
+
+def _worker_load_gbm() -> Optional[str]:
+    return _worker_ensemble.load_gbm()
+
+
+def _worker_model_report() -> List[Dict]:
+    return _worker_ensemble.models.report(_worker_ensemble.model_weights)
+
+
+def merge_model_reports(reports: List[List[Dict]]) -> List[Dict]:
+    """Combine per-shard model reports: run counts and time add up, the rest comes from the busiest shard"""
+    merged = []
+    for entries in zip(*reports):
+        busiest = max(entries, key=lambda entry: entry['runs'])
+        runs = sum(entry['runs'] for entry in entries)
+        total_seconds = sum(entry['total_seconds'] for entry in entries)
+        merged.append(dict(
+            busiest, runs=runs, total_seconds=round(total_seconds, 6),
+            avg_ms=round(total_seconds * 1000 / runs, 3) if runs else None
+        ))
+    return merged
+
+
+def _worker_ingest(city_ids: List[str], fused_inputs: List[Dict]) -> Dict[str, Dict]:
+    """Ingest in a shard process; returns the cities' quality tracking state for the main process"""
+    _ingest_observations(_worker_ensemble, city_ids, fused_inputs)
+    return get_data_quality_checker().city_state(city_ids)
+
+
+def _worker_predict(city_ids: List[str], fused_inputs: List[Dict], hours_ahead: int, verbosity: str,
+                    include_breakdown: bool, commit: bool, members: int, tracker_state: Tuple[Dict, Dict, Dict]):
+    """Predict in a shard process.
+
+    The main process owns accuracy tracking, so its calibration and accuracy
+    summary are used here and the predictions, ledger rows and quality tracking
+    state (scores, recent readings, baselines) recorded by a commit are shipped
+    back along with the results.
+    """
+    accuracy_tracker = get_accuracy_tracker()
+    (accuracy_tracker.calibration_factors, accuracy_tracker.bias_corrections,
+     accuracy_tracker.cached_summary) = tracker_state
+
+    results = _run_ensemble(_worker_ensemble, city_ids, fused_inputs, hours_ahead,
+                            verbosity, include_breakdown, commit, members)
+    if not commit:
+        return results, {}, {}, []
+
+    recorded = {city_id: accuracy_tracker.prediction_buffer.pop(city_id).entries()
+                for city_id in city_ids if city_id in accuracy_tracker.prediction_buffer}
+    quality = get_data_quality_checker().city_state(city_ids)
+    return results, recorded, quality, accuracy_tracker.drain_ledger()
+
 
 class PredictionEngine:
-    """Wrapper for the ensemble predictor"""
+    """Wrapper for the ensemble predictor
+
+    The ensemble is CPU-bound, so every prediction runs in an executor and
+    the event loop only awaits the result. In "thread" mode one predictor is
+    shared by a thread pool and commits are serialized by a lock. In
+    "process" mode cities are sharded (by crc32 of the id) across
+    single-worker process pools, each holding the predictor state of its own
+    cities, so a city is always predicted by the same process.
+
+    Predictor state is snapshotted to state_path every
+    PREDICTOR_SNAPSHOT_INTERVAL seconds and restored by warm_start().
+    """
     
-    def __init__(self):
+    def __init__(self, cache_ttl: int = settings.PREDICTION_CACHE_TTL, max_cache_entries: int = 512,
+                 executor: str = settings.PREDICTION_EXECUTOR, workers: int = settings.PREDICTION_WORKERS,
+                 state_path: str = PREDICTOR_STATE_PATH):
+        if executor not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown prediction executor '{executor}', expected one of {EXECUTOR_MODES}")
         self.ensemble = EnsemblePredictor()
+        
+        self.executor_mode = executor
+        self.workers = max(1, workers)
+        self._executors: List[Executor] = []
+        self._commit_lock = threading.Lock()
+        
+        self.state_path = state_path
+        self.last_snapshot = time.monotonic()
+        self.last_verification = time.monotonic()
+        
+        # (city, input fingerprint, forecast hour, hours, payload options) -> (stored_at, result)
+        self.cache_ttl = cache_ttl
+        self.max_cache_entries = max_cache_entries
+        self._cache: Dict[Tuple, Tuple[float, Dict]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # city -> ((input fingerprint, forecast hour, hours, verbosity), last committed result)
+        self._committed: Dict[str, Tuple[Tuple, Dict]] = {}
+        self.refresh_reused = 0
+        self.refresh_recomputed = 0
     
-    async def predict(self, city_id: str, current_data: Dict, hours_ahead: int = 72) -> Dict:
+    async def predict(self, city_id: str, current_data: Dict, hours_ahead: int = 72,
+                      verbosity: str = PAYLOAD_FULL, include_breakdown: bool = False) -> Dict:
         """Generate predictions using ensemble model"""
-        # Add current data to history for learning
-        self.ensemble.add_historical_data(city_id, current_data)
+        results = await self.predict_batch([city_id], [current_data], hours_ahead, verbosity, include_breakdown)
+        return results[0]
+
+    async def predict_batch(self, city_ids: List[str], fused_inputs: List[Dict], hours_ahead: int = 72,
+                            verbosity: str = PAYLOAD_FULL, include_breakdown: bool = False) -> List[Dict]:
+        """Generate predictions for several cities in a single ensemble pass"""
+        return await self._run(city_ids, fused_inputs, hours_ahead, verbosity, include_breakdown, commit=True)
+
+    async def refresh_batch(self, city_ids: List[str], fused_inputs: List[Dict], hours_ahead: int = 72,
+                            verbosity: str = PAYLOAD_FULL) -> List[Dict]:
+        """Collection-cycle predict_batch that skips cities whose input has not changed.
+
+        A city is re-predicted (and committed) only when its input
+        fingerprint differs from the last committed one or the forecast hour
+        has rolled over; otherwise its previous forecast is re-timestamped.
+        Every observation is still ingested - history, learned patterns and
+        quality tracking advance each cycle - only the model run is skipped.
+        """
+        now = datetime.utcnow()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        keys = [(input_fingerprint(data), hour, hours_ahead, verbosity) for data in fused_inputs]
+        
+        results: List[Optional[Dict]] = [None] * len(city_ids)
+        changed, reused = [], []
+        for i, (city_id, key) in enumerate(zip(city_ids, keys)):
+            previous = self._committed.get(city_id)
+            if previous and previous[0] == key:
+                results[i] = shift_prediction(previous[1], now)
+                reused.append(i)
+            else:
+                changed.append(i)
+        
+        if reused:
+            await self._ingest([city_ids[i] for i in reused], [fused_inputs[i] for i in reused])
+        if changed:
+            batch = await self.predict_batch([city_ids[i] for i in changed], [fused_inputs[i] for i in changed],
+                                             hours_ahead, verbosity)
+            for i, result in zip(changed, batch):
+                self._committed[city_ids[i]] = (keys[i], result)
+                results[i] = result
+        
+        self.refresh_recomputed += len(changed)
+        self.refresh_reused += len(city_ids) - len(changed)
+        return results
+
+    async def query(self, city_id: str, current_data: Dict, hours_ahead: int = 72,
+                    verbosity: str = PAYLOAD_FULL, include_breakdown: bool = False,
+                    members: int = 0) -> Dict:
+        """Side-effect-free prediction for API reads.
+
+        Unlike predict(), this neither appends to history nor advances the
+        Kalman filter nor records the forecast for accuracy tracking; only the
+        collection cycle commits predictions. members > 0 adds the
+        probabilistic quantile forecast.
+        """
+        results = await self._run([city_id], [current_data], hours_ahead, verbosity,
+                                  include_breakdown, commit=False, members=members)
+        return results[0]
+
+    async def predict_cached(self, city_id: str, current_data: Dict, hours_ahead: int = 72,
+                             verbosity: str = PAYLOAD_FULL, include_breakdown: bool = False,
+                             members: int = 0) -> Dict:
+        """Serve a prediction from the cache, running the ensemble only on a miss.
+
+        Entries are keyed by the input fingerprint and the wall-clock forecast
+        hour, expire after cache_ttl seconds and are dropped whenever the
+        collector publishes a new reading for the city.
+        """
+        key = (city_id, input_fingerprint(current_data), int(time.time() // 3600),
+               hours_ahead, verbosity, include_breakdown, members)
+        now = time.monotonic()
+        
+        entry = self._cache.get(key)
+        if entry and now - entry[0] < self.cache_ttl:
+            self.cache_hits += 1
+            return entry[1]
+        
+        self.cache_misses += 1
+        result = await self.query(city_id, current_data, hours_ahead, verbosity, include_breakdown, members)
+        self._store(key, result, now)
+        return result
+
+    def invalidate(self, city_id: Optional[str] = None):
+        """Drop cached predictions for a city (or all cities).
+
+        Dropping everything (after a model change) also forces the next
+        refresh_batch to re-predict every city.
+        """
+        if city_id is None:
+            self._cache.clear()
+            self._committed.clear()
+            return
+        for key in [k for k in self._cache if k[0] == city_id]:
+            del self._cache[key]
+
+    async def warm_start(self) -> str:
+        """Restore predictor state on startup; returns where it came from"""
+        loop = asyncio.get_running_loop()
+        executors = self._get_executors()
+        started = time.perf_counter()
         
-        # Generate prediction
-        return self.ensemble.predict(city_id, current_data, hours_ahead)
+        if self.executor_mode == EXECUTOR_THREAD:
+            source = await loop.run_in_executor(executors[0], restore_predictor, self.ensemble, self.state_path)
+        else:
+            sources = await asyncio.gather(*[
+                loop.run_in_executor(executor, _worker_restore, self.state_path, shard, len(executors))
+                for shard, executor in enumerate(executors)
+            ])
+            source = sources[0]
+        
+        logger.info(f"Predictor state restored from {source} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        
+        try:
+            rows = await loop.run_in_executor(None, get_accuracy_tracker().load_ledger)
+            logger.info(f"Prediction buffers refilled from {rows} ledger rows")
+        except Exception as e:
+            logger.warning(f"Could not read the prediction ledger: {e}")
+        
+        await self.reload_models()
+        return source
+
+    async def reload_models(self) -> Optional[str]:
+        """Memory-map the latest trained GBM artifacts into every predictor; returns the version"""
+        loop = asyncio.get_running_loop()
+        executors = self._get_executors()
+        
+        try:
+            if self.executor_mode == EXECUTOR_THREAD:
+                version = await loop.run_in_executor(executors[0], self.ensemble.load_gbm)
+            else:
+                versions = await asyncio.gather(*[
+                    loop.run_in_executor(executor, _worker_load_gbm) for executor in executors
+                ])
+                version = versions[0]
+                # Keep the local registry in step so the model can be toggled
+                await loop.run_in_executor(None, self.ensemble.load_gbm)
+        except Exception as e:
+            logger.error(f"Could not load GBM artifacts: {e}")
+            return None
+        
+        if version is not None:
+            logger.info(f"GBM model {version} loaded")
+            self.invalidate()
+        return version
+
+    async def train_models(self) -> str:
+        """Train new GBM artifacts in a separate process, then hot-swap them in"""
+        from app.ml.gbm_model import train_and_save
+        
+        loop = asyncio.get_running_loop()
+        trainer = ProcessPoolExecutor(1)
+        try:
+            version = await loop.run_in_executor(trainer, train_and_save, settings.GBM_TRAIN_DAYS)
+        finally:
+            trainer.shutdown(wait=False)
+        await self.reload_models()
+        return version
+
+    async def train_forever(self):
+        """Retrain the GBM member every GBM_TRAIN_INTERVAL seconds (0 disables)"""
+        if settings.GBM_TRAIN_INTERVAL <= 0:
+            return
+        
+        # Train straight away only when there is nothing to serve yet
+        if self.ensemble.gbm is not None:
+            await asyncio.sleep(settings.GBM_TRAIN_INTERVAL)
+        while True:
+            try:
+                await self.train_models()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"GBM training skipped: {e}")
+            await asyncio.sleep(settings.GBM_TRAIN_INTERVAL)
+
+    async def validate_accuracy(self, hours: int = 24) -> Dict[str, Dict]:
+        """Validate every city's stored predictions in one pass, off the event loop"""
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(None, get_accuracy_tracker().validate_recent, hours)
+        matches = sum(result.get('matches', 0) for result in results.values())
+        logger.info(f"Validated {len(results)} cities against {matches} matched readings")
+        return results
+
+    async def validate_forever(self):
+        """Validate accuracy every ACCURACY_VALIDATION_INTERVAL seconds (0 disables)"""
+        if settings.ACCURACY_VALIDATION_INTERVAL <= 0:
+            return
+        
+        while True:
+            await asyncio.sleep(settings.ACCURACY_VALIDATION_INTERVAL)
+            try:
+                await self.validate_accuracy()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Accuracy validation skipped: {e}")
+
+    async def set_model_enabled(self, name: str, enabled: bool):
+        """Enable or disable an ensemble member everywhere it runs.
+
+        Raises KeyError for an unknown model and ValueError when disabling
+        the last base model.
+        """
+        registry = self.ensemble.models
+        if name in registry.specs and (name not in registry.disabled) == enabled:
+            return  # Already in that state: nothing to propagate, keep the cache
+        
+        # The local registry validates the change and seeds shards started later
+        self.ensemble.set_model_enabled(name, enabled)
+        if self.executor_mode == EXECUTOR_PROCESS:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[
+                loop.run_in_executor(executor, _worker_set_model, name, enabled)
+                for executor in self._get_executors()
+            ])
+        self.invalidate()
+
+    async def model_report(self) -> List[Dict]:
+        """Per-model weight, toggle state, run count, timing and last output summary"""
+        if self.executor_mode == EXECUTOR_THREAD:
+            return self.ensemble.models.report(self.ensemble.model_weights)
+        
+        loop = asyncio.get_running_loop()
+        reports = await asyncio.gather(*[
+            loop.run_in_executor(executor, _worker_model_report) for executor in self._get_executors()
+        ])
+        return merge_model_reports(reports)
+
+    async def snapshot(self):
+        """Write the current predictor state to state_path"""
+        loop = asyncio.get_running_loop()
+        executors = self._get_executors()
+        
+        if self.executor_mode == EXECUTOR_THREAD:
+            arrays = await loop.run_in_executor(executors[0], self._state_local)
+        else:
+            # Every shard holds different cities; only the shared weights overlap
+            arrays = {}
+            for part in await asyncio.gather(*[
+                loop.run_in_executor(executor, _worker_state) for executor in executors
+            ]):
+                arrays.update(part)
+        
+        await loop.run_in_executor(None, write_snapshot, self.state_path, arrays)
+        self.last_snapshot = time.monotonic()
+
+    async def snapshot_if_due(self):
+        if time.monotonic() - self.last_snapshot >= settings.PREDICTOR_SNAPSHOT_INTERVAL:
+            await self.snapshot()
+
+    async def persist_forecasts(self, verify: bool = True):
+        """Write the queued prediction-ledger rows in one batch, and fill in the
+        actuals of pending ones (then roll up completed days) every
+        LEDGER_VERIFY_INTERVAL seconds"""
+        loop = asyncio.get_running_loop()
+        accuracy_tracker = get_accuracy_tracker()
+        
+        await loop.run_in_executor(None, accuracy_tracker.flush_ledger)
+        if verify and time.monotonic() - self.last_verification >= settings.LEDGER_VERIFY_INTERVAL:
+            self.last_verification = time.monotonic()
+            result = await loop.run_in_executor(None, accuracy_tracker.verify_ledger)
+            logger.info(f"Prediction ledger: {result['updated']} forecasts updated, {result['verified']} verified")
+            rollups = await loop.run_in_executor(None, accuracy_tracker.save_daily_accuracy)
+            if rollups:
+                logger.info(f"Daily accuracy: {rollups} city rollups written")
+
+    def shutdown(self):
+        """Stop the executor workers"""
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+
+    async def _run(self, city_ids: List[str], fused_inputs: List[Dict], hours_ahead: int,
+                   verbosity: str, include_breakdown: bool, commit: bool, members: int = 0) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        executors = self._get_executors()
+        
+        if self.executor_mode == EXECUTOR_THREAD:
+            return await loop.run_in_executor(
+                executors[0], self._run_local, city_ids, fused_inputs,
+                hours_ahead, verbosity, include_breakdown, commit, members
+            )
+        
+        # Group cities by shard, predict every shard concurrently, then restore the input order
+        shards: Dict[int, List[int]] = {}
+        for i, city_id in enumerate(city_ids):
+            shards.setdefault(shard_index(city_id, len(executors)), []).append(i)
+        
+        accuracy_tracker = get_accuracy_tracker()
+        tracker_state = (dict(accuracy_tracker.calibration_factors), dict(accuracy_tracker.bias_corrections),
+                         accuracy_tracker.get_overall_accuracy())
+        outputs = await asyncio.gather(*[
+            loop.run_in_executor(
+                executors[shard], _worker_predict,
+                [city_ids[i] for i in rows], [fused_inputs[i] for i in rows],
+                hours_ahead, verbosity, include_breakdown, commit, members, tracker_state
+            )
+            for shard, rows in shards.items()
+        ])
+        
+        results: List[Optional[Dict]] = [None] * len(city_ids)
+        for rows, (batch, recorded, quality, ledger) in zip(shards.values(), outputs):
+            for i, result in zip(rows, batch):
+                results[i] = result
+            self._merge_worker_state(recorded, quality, ledger)
+        return results
+
+    async def _ingest(self, city_ids: List[str], fused_inputs: List[Dict]):
+        """Ingest observations without predicting, wherever each city's state lives"""
+        loop = asyncio.get_running_loop()
+        executors = self._get_executors()
+        
+        if self.executor_mode == EXECUTOR_THREAD:
+            await loop.run_in_executor(executors[0], self._ingest_local, city_ids, fused_inputs)
+            return
+        
+        shards: Dict[int, List[int]] = {}
+        for i, city_id in enumerate(city_ids):
+            shards.setdefault(shard_index(city_id, len(executors)), []).append(i)
+        qualities = await asyncio.gather(*[
+            loop.run_in_executor(executors[shard], _worker_ingest,
+                                 [city_ids[i] for i in rows], [fused_inputs[i] for i in rows])
+            for shard, rows in shards.items()
+        ])
+        for quality in qualities:
+            self._merge_worker_state({}, quality, [])
+
+    def _ingest_local(self, city_ids: List[str], fused_inputs: List[Dict]):
+        with self._commit_lock:
+            _ingest_observations(self.ensemble, city_ids, fused_inputs)
+
+    def _run_local(self, city_ids: List[str], fused_inputs: List[Dict], hours_ahead: int,
+                   verbosity: str, include_breakdown: bool, commit: bool, members: int = 0) -> List[Dict]:
+        if not commit:
+            return _run_ensemble(self.ensemble, city_ids, fused_inputs, hours_ahead,
+                                 verbosity, include_breakdown, commit, members)
+        with self._commit_lock:
+            return _run_ensemble(self.ensemble, city_ids, fused_inputs, hours_ahead,
+                                 verbosity, include_breakdown, commit, members)
+
+    def _state_local(self) -> Dict[str, np.ndarray]:
+        with self._commit_lock:
+            return self.ensemble.state_arrays()
+
+    def _get_executors(self) -> List[Executor]:
+        # Created lazily so importing the global instance never spawns workers
+        if not self._executors:
+            if self.executor_mode == EXECUTOR_THREAD:
+                self._executors = [ThreadPoolExecutor(self.workers, thread_name_prefix="prediction")]
+            else:
+                disabled = tuple(self.ensemble.models.disabled)
+                self._executors = [ProcessPoolExecutor(1, initializer=_init_worker, initargs=(disabled,))
+                                   for _ in range(self.workers)]
+        return self._executors
+
+    @staticmethod
+    def _merge_worker_state(recorded: Dict[str, Dict[str, np.ndarray]], quality: Dict[str, Dict],
+                            ledger: List[tuple]):
+        accuracy_tracker = get_accuracy_tracker()
+        for city_id, entries in recorded.items():
+            accuracy_tracker.merge_predictions(city_id, entries)
+        accuracy_tracker.queue_ledger(ledger)
+        get_data_quality_checker().merge_city_state(quality)
+
+    def cache_stats(self) -> Dict:
+        return {
+            'entries': len(self._cache),
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'ttl_seconds': self.cache_ttl,
+            'refresh_reused': self.refresh_reused,
+            'refresh_recomputed': self.refresh_recomputed
+        }
+
+    def _store(self, key: Tuple, result: Dict, now: float):
+        # Purge expired entries, then the oldest ones if still over capacity
+        for stale in [k for k, (stored_at, _) in self._cache.items() if now - stored_at >= self.cache_ttl]:
+            del self._cache[stale]
+        while len(self._cache) >= self.max_cache_entries:
+            del self._cache[next(iter(self._cache))]
+        self._cache[key] = (now, result)
+
+
+# Global instance shared by the collector and the API
+prediction_engine = PredictionEngine()
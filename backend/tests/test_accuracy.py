@@ -1,5 +1,5 @@
 import pytest
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import sys
 import os
 
@@ -30,6 +30,29 @@ def test_record_prediction():
     assert len(tracker.prediction_buffer["dubai"]) == 1
 
 
+def test_validate_predictions_matches_nearest_reading():
+    tracker = AccuracyTracker()
+    base = datetime(2026, 6, 1, 12, 0)
+    for hour, predicted in ((1, 50.0), (2, 80.0), (5, 40.0)):
+        tracker.record_prediction("dubai", base + timedelta(hours=hour), predicted, 90.0)
+    
+    readings = [
+        {"timestamp": (base + timedelta(hours=1, minutes=20)).isoformat(), "dust": 10.0},
+        {"timestamp": (base + timedelta(hours=1, minutes=5)).isoformat(), "dust": 40.0},
+        {"timestamp": (base + timedelta(hours=2)).isoformat() + "Z", "dust": 100.0},
+        {"timestamp": "not a timestamp", "dust": 80.0},
+        {"timestamp": (base + timedelta(hours=5, minutes=31)).isoformat(), "dust": 40.0},
+    ]
+    result = tracker.validate_predictions("dubai", readings)
+    
+    # 50 vs 40 (the closer of the two readings) and 80 vs 100; hour 5 has no reading in range
+    assert result["matches"] == 2
+    assert result["mae"] == 15.0
+    assert result["mape"] == 22.5
+    assert result["bias"] == -5.0
+    assert tracker.validate_predictions("dubai", readings[3:]) == {"error": "No matching readings found", "matches": 0}
+
+
 def test_data_quality_validation():
     checker = DataQualityChecker()
     
@@ -60,6 +83,77 @@ def test_data_quality_invalid():
     assert result["quality_score"] < 100
 
 
+def test_columnar_quality_matches_row_by_row():
+    """validate_columns scores like validate_reading applied in order, without touching live state"""
+    np = pytest.importorskip("numpy")
+    import copy
+    
+    rng = np.random.default_rng(1)
+    checker = DataQualityChecker()
+    checker.update_baselines("dubai", [{"dust": 40 + i % 7, "temperature": 35, "humidity": 40} for i in range(60)])
+    for dust in (30, None, 35, 40):
+        checker._track_reading("dubai", {"dust": dust, "temperature": 35}, 90.0)
+    checker._track_reading("sharjah", {"dust": 20}, 90.0)
+    
+    readings = []
+    for i in range(400):
+        reading = {
+            "city_id": ["dubai", "sharjah", "al_ain"][i % 3],
+            "dust": float(rng.choice([rng.uniform(0, 300), rng.uniform(-50, 3000)])),
+            "temperature": float(rng.uniform(-5, 60)),
+            "humidity": float(rng.uniform(0, 100)),
+            "visibility": float(rng.uniform(0, 60000)),
+            "pm10": float(rng.uniform(0, 400)),
+            "pm2_5": float(rng.uniform(0, 400))
+        }
+        if i % 11 == 0:
+            del reading["visibility"]
+        if i % 17 == 0:
+            reading["wind_speed"] = "n/a"
+        readings.append(reading)
+    
+    row_checker = copy.deepcopy(checker)
+    # Batch z-scores use the baselines from before the batch
+    row_checker._update_baseline = lambda city_id, data: None
+    expected = [row_checker.validate_reading(r)["quality_score"] for r in readings]
+    state = copy.deepcopy((checker.recent_readings, checker.quality_scores))
+    
+    columns, invalid = checker.readings_to_columns(readings)
+    scored = checker.score_columns(columns, invalid)
+    assert np.round(scored["quality_score"], 1).tolist() == pytest.approx(expected)
+    
+    summary = checker.validate_batch(readings)
+    assert summary["valid_readings"] == sum(score >= 50 for score in expected)
+    assert summary["average_quality_score"] == round(float(np.mean(expected)), 1)
+    assert summary["issue_summary"]["wind_speed"] == len(range(0, 400, 17))
+    assert (checker.recent_readings, checker.quality_scores) == state
+
+
+def test_streaming_baselines_detect_anomalies():
+    """Baselines build up from normal ingestion and are robust to the spikes they flag"""
+    np = pytest.importorskip("numpy")
+    
+    rng = np.random.default_rng(2)
+    checker = DataQualityChecker()
+    for i in range(600):
+        dust = 900.0 if i % 100 == 50 else float(rng.normal(50, 10))
+        checker.validate_reading({"city_id": "dubai", "dust": dust, "temperature": 35.0})
+    
+    baseline = checker.baselines["dubai"]
+    assert checker.historical_means["dubai"]["dust"] == pytest.approx(50, abs=3)
+    # Clipped to the 10-90% sketch range: the 900 spikes barely move the spread
+    assert 5 < checker.historical_stds["dubai"]["dust"] < 10
+    q10, q50, q90 = baseline.quantile_estimates()["dust"]
+    assert q10 < q50 < q90 and q50 == pytest.approx(50, abs=5)
+    assert "wind_speed" not in checker.historical_means["dubai"]
+    
+    result = checker.validate_reading({"city_id": "dubai", "dust": 120.0, "temperature": 35.0}, track=False)
+    assert any(w.startswith("dust: statistical anomaly") for w in result["warnings"])
+    result = checker.validate_reading({"city_id": "dubai", "dust": 52.0, "temperature": 35.0}, track=False)
+    assert not any(w.startswith("dust:") for w in result["warnings"])
+    assert "baseline" in checker.get_quality_report()["city_quality"]["dubai"]
+
+
 def test_accuracy_status():
     tracker = AccuracyTracker()
     
@@ -99,9 +193,286 @@ def test_calibration():
     assert calibrated != 100
 
 
+def test_overall_accuracy_summary_is_cached():
+    tracker = AccuracyTracker()
+    first = tracker.get_overall_accuracy()
+    assert tracker.get_overall_accuracy() is first
+    
+    base = datetime(2026, 6, 1, 12, 0)
+    tracker.record_prediction("dubai", base, 50.0, 90.0)
+    tracker.validate_predictions("dubai", [{"timestamp": base.isoformat(), "dust": 50.0}])
+    
+    summary = tracker.get_overall_accuracy()
+    assert summary is not first
+    assert summary["cities"]["dubai"]["accuracy"] == 100.0
+    assert tracker.get_overall_accuracy() is summary
+
+
+def test_city_accuracy_is_read_only():
+    np = pytest.importorskip("numpy")
+    
+    tracker = AccuracyTracker()
+    assert tracker.get_city_accuracy("dubai")["accuracy"] is None
+    
+    base = datetime(2026, 6, 1, 12, 0)
+    tracker.record_prediction("dubai", base, 50.0, 90.0)
+    tracker.validate_predictions("dubai", [{"timestamp": base.isoformat(), "dust": 50.0}])
+    tracker.record_errors("dubai", np.array([1.0, 30.0]), np.array([50.0, 60.0]), np.array([45.0, 50.0]))
+    summary = tracker.get_overall_accuracy()
+    bias = dict(tracker.bias_corrections)
+    
+    result = tracker.get_city_accuracy("dubai")
+    assert (result["matches"], result["mae"], result["bias"]) == (2, 7.5, 7.5)
+    assert set(result["horizon_accuracy"]) == {"0-6h", "24-72h"}
+    assert result["recent_validation"]["accuracy"] == 100.0
+    # Reading does not validate: no new history entry, bias or summary
+    assert len(tracker.accuracy_history["dubai"]) == 1
+    assert tracker.bias_corrections == bias
+    assert tracker.get_overall_accuracy() is summary
+
+
 def test_overall_accuracy_no_data():
     tracker = AccuracyTracker()
     result = tracker.get_overall_accuracy()
     
     assert result["overall_accuracy"] == 92.5
     assert result["status"] == "INITIALIZING"
+
+
+def test_prediction_ledger_round_trip(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from app.core import database
+    from app.ml.accuracy_tracker import unpack
+    
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "haboob.db"))
+    database.init_database()
+    
+    tracker = AccuracyTracker()
+    now = datetime.utcnow().replace(microsecond=0)
+    old = now - timedelta(hours=80)
+    recent = now - timedelta(hours=2)
+    leads = np.array([0.0, 1.0, 2.0, 3.0])
+    tracker.record_forecast("dubai", old, leads, np.array([40.0, 50.0, 60.0, 70.0]), np.full(4, 90.0), "test")
+    tracker.record_forecast("dubai", recent, leads, np.array([40.0, 50.0, 60.0, 70.0]), np.full(4, 90.0), "test")
+    assert len(tracker.prediction_buffer["dubai"]) == 8
+    
+    # One row per forecast, written in a single batch
+    assert tracker.flush_ledger() == 2
+    assert tracker.pending_ledger == []
+    
+    for start in (old, recent):
+        database.save_reading("dubai", {"timestamp": (start + timedelta(minutes=10)).isoformat(), "dust": 45.0})
+        database.save_reading("dubai", {"timestamp": (start + timedelta(hours=2)).isoformat(), "dust": 66.0})
+    
+    assert tracker.verify_ledger(now) == {"updated": 2, "verified": 1}
+    conn = database.get_db_connection()
+    rows = conn.execute("SELECT * FROM prediction_ledger ORDER BY prediction_time").fetchall()
+    conn.close()
+    
+    actual = unpack(rows[0]["actual_dust"])
+    assert np.array_equal(actual[[0, 2]], [45.0, 66.0]) and np.isnan(actual[[1, 3]]).all()
+    assert np.array_equal(unpack(rows[0]["error"])[[0, 2]], [-5.0, -6.0])
+    assert rows[0]["verified_at"] is not None
+    # The recent forecast's horizon has not elapsed yet: filled so far, still pending
+    assert unpack(rows[1]["actual_dust"])[0] == 45.0
+    assert rows[1]["verified_at"] is None
+    
+    # Each verified step is folded into the accumulators once, however often verification runs
+    horizons = tracker.get_horizon_accuracy("dubai")
+    assert horizons["0-6h"]["count"] == 4
+    assert horizons["0-6h"]["mae"] == pytest.approx((5 + 6 + 5 + 6) / 4)
+    # Nothing new matched and nothing completed: no rows are rewritten
+    assert tracker.verify_ledger(now) == {"updated": 0, "verified": 0}
+    assert tracker.get_horizon_accuracy()["0-6h"]["count"] == 4
+    
+    # A restart refills the buffer and accumulators from the ledger
+    restarted = AccuracyTracker()
+    assert restarted.load_ledger(hours=24) == 1
+    restored = restarted.prediction_buffer["dubai"].entries()
+    assert restored["predicted_dust"].tolist() == [40.0, 50.0, 60.0, 70.0]
+    assert restored["target_time"].tolist() == [recent.replace(tzinfo=timezone.utc).timestamp() + lead * 3600
+                                                for lead in leads]
+    assert restarted.get_horizon_accuracy("dubai")["0-6h"]["count"] == 2
+
+
+def test_prediction_store_keeps_every_lead_in_fixed_slots():
+    """A day of one-minute commits fits the fixed store and stays validatable at every lead"""
+    np = pytest.importorskip("numpy")
+    from app.ml.accuracy_tracker import PredictionStore
+    from app.ml.ensemble_predictor import to_epoch
+    
+    tracker = AccuracyTracker()
+    start = datetime(2026, 6, 1)
+    leads = np.concatenate([np.arange(24.0), np.arange(24.0, 72.0, 3)])
+    for minute in range(24 * 60):
+        now = start + timedelta(minutes=minute)
+        tracker.record_forecast("dubai", now, leads, np.full(len(leads), 50.0 + minute % 60),
+                                np.full(len(leads), 90.0), "test")
+    tracker.drain_ledger()
+    
+    store = tracker.prediction_buffer["dubai"]
+    assert store.target_hour.shape == (PredictionStore.HOURS, 4)
+    entries = store.entries()
+    assert len(store) <= store.target_hour.size
+    assert np.all(np.diff(entries["target_time"]) >= 0)
+    # The earliest target hour still holds its 0-6h prediction after 1440 commits
+    first = entries["target_time"] < to_epoch(start + timedelta(hours=1))
+    assert first.any()
+    
+    readings = [{"timestamp": (start + timedelta(hours=h)).isoformat(), "dust": 55.0} for h in range(96)]
+    result = tracker.validate_predictions("dubai", readings)
+    assert set(result["horizon_accuracy"]) >= {0, 10, 30, 69}
+    
+    # Each slot keeps the first, longest-lead prediction of its bucket, not the newest:
+    # hour 30 holds the 30h lead committed at 00:00 and the 23h lead committed at 07:00
+    at_hour = np.floor(entries["target_time"] / 3600) == to_epoch(start + timedelta(hours=30)) / 3600
+    assert sorted(entries["lead"][at_hour].tolist()) == [23.0, 30.0]
+
+
+def test_validate_all_matches_per_city_validation(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from app.core import database
+    
+    base = datetime(2026, 6, 1, 12, 0)
+    readings = {
+        "dubai": [{"timestamp": (base + timedelta(hours=h, minutes=5)).isoformat(), "dust": 40.0 + h}
+                  for h in range(4)],
+        # Sharjah readings sit on Dubai's target times but must never match Dubai
+        "sharjah": [{"timestamp": (base + timedelta(hours=10)).isoformat(), "dust": 90.0}]
+    }
+    
+    def tracker_with_predictions():
+        tracker = AccuracyTracker()
+        for h in range(4):
+            tracker.record_prediction("dubai", base + timedelta(hours=h), 45.0, 90.0)
+            tracker.record_prediction("sharjah", base + timedelta(hours=h), 45.0, 90.0)
+        return tracker
+    
+    expected = tracker_with_predictions().validate_predictions("dubai", readings["dubai"])
+    
+    tracker = tracker_with_predictions()
+    rows = [(city_id, reading["timestamp"], reading["dust"]) for city_id in readings for reading in readings[city_id]]
+    results = tracker.validate_all(
+        np.array([r[0] for r in rows]),
+        np.array([datetime.fromisoformat(r[1]).replace(tzinfo=timezone.utc).timestamp() for r in rows]),
+        np.array([r[2] for r in rows])
+    )
+    assert results["sharjah"]["matches"] == 0
+    assert results["dubai"]["matches"] == 4
+    for key in ("accuracy", "mae", "rmse", "bias", "horizon_accuracy"):
+        assert results["dubai"][key] == expected[key]
+    
+    # The scheduled path reads the same columns from SQLite in one query
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "haboob.db"))
+    database.init_database()
+    now = datetime.utcnow().replace(microsecond=0)
+    tracker = AccuracyTracker()
+    tracker.record_prediction("dubai", now - timedelta(hours=1), 50.0, 90.0)
+    database.save_reading("dubai", {"timestamp": (now - timedelta(hours=1, minutes=3)).isoformat(), "dust": 40.0})
+    database.save_reading("sharjah", {"timestamp": (now - timedelta(hours=1)).isoformat(), "dust": 10.0})
+    
+    recent = tracker.validate_recent(hours=24)
+    assert recent["dubai"]["matches"] == 1
+    assert recent["dubai"]["mae"] == 10.0
+    assert tracker.last_validated["dubai"]
+
+
+def test_accuracy_history_ring_windows():
+    np = pytest.importorskip("numpy")
+    from app.ml.accuracy_tracker import AccuracyHistory
+    
+    history = AccuracyHistory(capacity=8)
+    for step in range(13):
+        history.append(1000.0 + step * 100, accuracy=float(step), matches=1)
+    
+    # Only the newest 8 survive, in time order across the ring's wrap point
+    assert len(history) == 8
+    assert history.latest(20).tolist() == [float(s) for s in range(5, 13)]
+    for since, until in ((0, None), (1650, 2050), (1700, 1700), (1750, 9000), (5000, None)):
+        expected = [float(s) for s in range(5, 13)
+                    if 1000 + s * 100 >= since and (until is None or 1000 + s * 100 < until)]
+        assert history.window(since, until)["accuracy"].tolist() == expected
+
+
+def test_daily_accuracy_rollups(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from app.core import database
+    from app.ml.accuracy_tracker import pack
+    
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "haboob.db"))
+    database.init_database()
+    
+    # Forecasts issued every hour of 2026-06-01 plus one from the day before,
+    # each with steps landing on both days
+    tracker = AccuracyTracker()
+    day = datetime(2026, 6, 1)
+    leads = np.array([0.0, 12.0, 30.0])
+    for start in [day - timedelta(hours=6)] + [day + timedelta(hours=h) for h in range(24)]:
+        tracker.record_forecast("dubai", start, leads, np.full(3, 50.0), np.full(3, 90.0), "test")
+    tracker.flush_ledger()
+    conn = database.get_db_connection()
+    conn.execute("UPDATE prediction_ledger SET actual_dust = ?", (pack([45.0, 40.0, np.nan]),))
+    conn.commit()
+    conn.close()
+    
+    # Each verified step landing on the day counts once: every 0h step, the 12h steps
+    # issued before noon and the 12h step issued the evening before
+    rows = tracker.daily_rollups(day.date())
+    assert len(rows) == 1
+    model_name, date, count, mae, rmse, accuracy = rows[0]
+    assert (model_name, date, count) == ("ensemble:dubai", "2026-06-01", 24 + 12 + 1)
+    assert mae == pytest.approx((24 * 5 + 13 * 10) / 37, abs=0.01)
+    
+    # Only completed days are written, each once, and a restart picks up where it left off
+    now = day + timedelta(days=1, minutes=30)
+    tracker.rolled_up_through = day.date() - timedelta(days=1)
+    assert tracker.save_daily_accuracy(now) == 0
+    assert tracker.save_daily_accuracy(now + timedelta(hours=1)) == 1
+    restarted = AccuracyTracker()
+    assert restarted.save_daily_accuracy(now + timedelta(hours=2)) == 0
+    assert restarted.rolled_up_through == day.date()
+    
+    conn = database.get_db_connection()
+    saved = conn.execute("SELECT model_name, date, predictions_count FROM model_accuracy").fetchall()
+    conn.close()
+    assert [tuple(row) for row in saved] == [("ensemble:dubai", "2026-06-01", 37)]
+
+
+def test_tracker_is_safe_across_threads():
+    """Commits, validation and ledger verification run on different threads"""
+    np = pytest.importorskip("numpy")
+    import threading
+    
+    tracker = AccuracyTracker()
+    start = datetime(2026, 6, 1)
+    leads = np.arange(40.0)
+    errors = []
+    
+    def commit(worker: int):
+        try:
+            for i in range(200):
+                tracker.record_forecast(f"city_{worker}_{i % 50}", start + timedelta(minutes=i), leads,
+                                        np.full(40, 50.0), np.full(40, 90.0), "test")
+                tracker.record_errors(f"city_{worker}_{i}", leads[:5], np.full(5, 50.0), np.full(5, 45.0))
+        except Exception as e:
+            errors.append(e)
+    
+    def read():
+        try:
+            times = np.array([start.replace(tzinfo=timezone.utc).timestamp() + h * 3600 for h in range(40)])
+            for _ in range(50):
+                tracker.validate_all(np.array(["city_0_1"] * 40), times, np.full(40, 50.0))
+                tracker.get_horizon_accuracy()
+                tracker.get_overall_accuracy()
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=commit, args=(w,)) for w in range(3)] + [threading.Thread(target=read)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert errors == []
+    assert tracker.get_horizon_accuracy()["0-6h"]["count"] == 3 * 200 * 5
+    assert len(tracker.drain_ledger()) == 3 * 200
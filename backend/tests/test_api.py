@@ -76,3 +76,42 @@ def test_health_metrics():
     
     assert response.status_code == 200
     assert "haboob_accuracy_percent" in response.text
+
+
+def test_prediction_horizon_is_bounded():
+    """Test that oversized forecast horizons are rejected before any work"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    client = TestClient(app)
+    response = client.get("/api/v1/predictions/dubai?hours=100000")
+    
+    assert response.status_code == 422
+
+
+def test_model_toggle_requires_operator_key(monkeypatch):
+    """Model toggles are off without a configured key and reject a wrong one"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.config import settings
+    from app.services.prediction_engine import prediction_engine
+    
+    client = TestClient(app)
+    monkeypatch.setattr(settings, "OPERATOR_API_KEY", "")
+    assert client.post("/api/v1/predictions/models/persistence/disable").status_code == 403
+    
+    monkeypatch.setattr(settings, "OPERATOR_API_KEY", "secret")
+    assert client.post("/api/v1/predictions/models/persistence/disable").status_code == 401
+    response = client.post("/api/v1/predictions/models/persistence/disable",
+                           headers={"X-Operator-Key": "wrong"})
+    assert response.status_code == 401
+    assert "persistence" not in prediction_engine.ensemble.models.disabled
+    
+    headers = {"X-Operator-Key": "secret"}
+    try:
+        response = client.post("/api/v1/predictions/models/persistence/disable", headers=headers)
+        assert response.status_code == 200
+        assert "persistence" in prediction_engine.ensemble.models.disabled
+    finally:
+        client.post("/api/v1/predictions/models/persistence/enable", headers=headers)
+    assert "persistence" not in prediction_engine.ensemble.models.disabled
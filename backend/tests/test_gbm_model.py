@@ -0,0 +1,95 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+pytest.importorskip("sklearn")
+
+from app.ml.ensemble_predictor import EnsemblePredictor
+from app.ml.gbm_model import GBMHorizonModel, horizon_bucket, save_artifacts, train_models
+
+
+def _readings(days: int = 4):
+    """Two cities of 5-minute readings with a diurnal dust cycle"""
+    rng = np.random.default_rng(0)
+    start = datetime(2024, 6, 1)
+    readings = []
+    for city_id in ("dubai", "abu_dhabi"):
+        for step in range(days * 24 * 12):
+            timestamp = start + timedelta(minutes=5 * step)
+            readings.append({
+                'city_id': city_id,
+                'timestamp': timestamp.isoformat(),
+                'dust': 40 + 20 * math.sin(2 * math.pi * timestamp.hour / 24) + rng.normal(0, 3),
+                'wind_speed': 15 + rng.normal(0, 3),
+                'wind_direction': 220,
+                'humidity': 30,
+                'temperature': 38,
+                'visibility': None
+            })
+    return readings
+
+
+def test_artifacts_round_trip_memory_mapped(tmp_path):
+    trained = train_models(_readings(), max_iter=10)
+    version = save_artifacts(trained, str(tmp_path))
+
+    model = GBMHorizonModel.load_latest(str(tmp_path))
+    assert model.version == version
+    assert len(model.models) == len(trained['models'])
+    assert isinstance(model.models[0]._predictors[0][0].nodes, np.memmap)
+
+    inputs = {
+        'dust': np.array([[50.0], [80.0]]), 'wind_speed': np.array([[15.0], [25.0]]),
+        'wind_direction': np.array([[220.0], [180.0]]), 'humidity': np.array([[30.0], [20.0]]),
+        'temperature': np.array([[38.0], [40.0]]), 'visibility': np.array([[10000.0], [10000.0]])
+    }
+    lead = np.arange(72)
+    calendar = {'hour': lead % 24, 'month': np.full(72, 6)}
+    predicted = model.predict(inputs, lead, calendar)
+
+    assert predicted.shape == (2, 72)
+    assert np.all(predicted >= 0)
+    # Each bucket's model answers its own rows
+    row = model.models[horizon_bucket(30)].predict(
+        np.array([[50, 15, math.sin(math.radians(220)), math.cos(math.radians(220)), 30, 38, 10000,
+                   30, math.sin(2 * math.pi * 6 / 24), math.cos(2 * math.pi * 6 / 24), 6]], dtype=float)
+    )
+    assert predicted[0, 30] == pytest.approx(max(0, row[0]))
+
+
+def test_loaded_gbm_joins_the_ensemble(tmp_path):
+    predictor = EnsemblePredictor()
+    assert predictor.load_gbm(str(tmp_path)) is None
+
+    save_artifacts(train_models(_readings(), max_iter=10), str(tmp_path))
+    version = predictor.load_gbm(str(tmp_path))
+
+    assert version is not None
+    assert 'gbm' in predictor.models.names
+    result = predictor.predict("dubai", {"dust": 50, "wind_speed": 15}, hours_ahead=48,
+                               include_breakdown=True, commit=False)
+    assert 'gbm' in result['forecast_24h'][0]['model_breakdown']
+    assert result['accuracy_info']['models_active'] == 8
+
+
+def test_save_prunes_old_versions(tmp_path):
+    for i in range(5):
+        old = tmp_path / f"20240101T00000{i}"
+        old.mkdir()
+        (old / "manifest.json").write_text("{}")
+    (tmp_path / "notes").mkdir()
+
+    version = save_artifacts(train_models(_readings(), max_iter=10), str(tmp_path))
+
+    versions = sorted(p.name for p in tmp_path.iterdir() if (p / "manifest.json").exists())
+    # The newest KEEP_VERSIONS (3) survive; other directories are left alone
+    assert versions == ["20240101T000003", "20240101T000004", version]
+    assert (tmp_path / "notes").exists()
+    assert GBMHorizonModel.load_latest(str(tmp_path)).version == version
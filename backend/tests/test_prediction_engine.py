@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.prediction_engine import PredictionEngine, input_fingerprint
+
+
+CURRENT_DATA = {
+    "dust": 45.0,
+    "temperature": 34,
+    "humidity": 35,
+    "wind_speed": 18,
+    "wind_direction": 200
+}
+
+
+def test_input_fingerprint_ignores_irrelevant_fields():
+    reading = dict(CURRENT_DATA, timestamp="2026-06-01T10:00:00", city_name="Dubai")
+    
+    assert input_fingerprint(reading) == input_fingerprint(CURRENT_DATA)
+    assert input_fingerprint(dict(CURRENT_DATA, dust=45.001)) == input_fingerprint(CURRENT_DATA)
+    assert input_fingerprint(dict(CURRENT_DATA, dust=46)) != input_fingerprint(CURRENT_DATA)
+
+
+def test_prediction_cache_hits_and_invalidation():
+    engine = PredictionEngine(cache_ttl=60)
+    
+    first = asyncio.run(engine.predict_cached("dubai", CURRENT_DATA))
+    second = asyncio.run(engine.predict_cached("dubai", dict(CURRENT_DATA)))
+    assert second is first
+    assert engine.cache_stats()["hits"] == 1
+    
+    # A different horizon or payload is a different entry
+    asyncio.run(engine.predict_cached("dubai", CURRENT_DATA, 24))
+    assert engine.cache_stats()["misses"] == 2
+    
+    engine.invalidate("dubai")
+    third = asyncio.run(engine.predict_cached("dubai", CURRENT_DATA))
+    assert third is not first
+    assert engine.cache_stats()["entries"] == 1
+
+
+def test_refresh_batch_reuses_unchanged_forecasts():
+    from datetime import datetime
+    from app.services.prediction_engine import shift_prediction
+    
+    from app.ml.data_quality import data_quality_checker
+    
+    engine = PredictionEngine()
+    city_ids = ["dubai", "ras_al_khaimah"]
+    # Fused inputs carry no city_id: the engine must file them under the city itself
+    inputs = [dict(CURRENT_DATA), dict(CURRENT_DATA, dust=60)]
+    unknown = len(data_quality_checker.recent_readings.get("unknown", []))
+    first = asyncio.run(engine.refresh_batch(city_ids, inputs, verbosity="lite"))
+    assert {"dubai", "ras_al_khaimah"} <= set(data_quality_checker.baselines)
+    appended = engine.ensemble.history["dubai"].total_appended
+    kalman = engine.ensemble.kalman_filters["dubai"]
+    state = (kalman.estimate, kalman.error_estimate)
+    scored = len(data_quality_checker.recent_readings["dubai"])
+    
+    second = asyncio.run(engine.refresh_batch(city_ids, [inputs[0], dict(inputs[1], dust=90)],
+                                              verbosity="lite"))
+    
+    # Dubai is re-timestamped, not re-predicted; Ras Al Khaimah's input changed.
+    # Dubai's observation is still ingested: history and quality tracking advance every cycle
+    assert engine.ensemble.history["dubai"].total_appended == appended + 1
+    assert len(data_quality_checker.recent_readings["dubai"]) == min(scored + 1, 50)
+    assert len(data_quality_checker.recent_readings.get("unknown", [])) == unknown
+    assert (kalman.estimate, kalman.error_estimate) == state
+    assert second[0]["forecast"]["dust"] == first[0]["forecast"]["dust"]
+    assert second[0]["generated_at"] >= first[0]["generated_at"]
+    assert second[1]["forecast"]["dust"] != first[1]["forecast"]["dust"]
+    assert engine.cache_stats()["refresh_reused"] == 1
+    assert engine.cache_stats()["refresh_recomputed"] == 3
+    
+    # A model change forces a full refresh
+    engine.invalidate()
+    asyncio.run(engine.refresh_batch(city_ids, inputs, verbosity="lite"))
+    assert engine.ensemble.history["dubai"].total_appended == appended + 2
+    
+    later = datetime.fromisoformat(first[0]["generated_at"]).replace(second=59, microsecond=0)
+    shifted = shift_prediction(first[0], later)
+    offset = datetime.fromisoformat(shifted["forecast"]["times"][5]) - datetime.fromisoformat(first[0]["forecast"]["times"][5])
+    assert offset == later - datetime.fromisoformat(first[0]["generated_at"])
+
+
+def test_query_has_no_side_effects():
+    from app.ml.accuracy_tracker import accuracy_tracker
+    
+    engine = PredictionEngine()
+    asyncio.run(engine.predict("abu_dhabi", CURRENT_DATA))
+    kalman = engine.ensemble.kalman_filters["abu_dhabi"]
+    state = (kalman.estimate, kalman.error_estimate)
+    recorded = len(accuracy_tracker.prediction_buffer["abu_dhabi"])
+    appended = engine.ensemble.history["abu_dhabi"].total_appended
+    
+    result = asyncio.run(engine.query("abu_dhabi", dict(CURRENT_DATA, dust=80)))
+    asyncio.run(engine.query("sharjah", CURRENT_DATA))
+    
+    assert len(result["forecast_72h"]) == 40
+    assert (kalman.estimate, kalman.error_estimate) == state
+    assert len(accuracy_tracker.prediction_buffer["abu_dhabi"]) == recorded
+    assert engine.ensemble.history["abu_dhabi"].total_appended == appended
+    assert "sharjah" not in engine.ensemble.kalman_filters
+    assert "sharjah" not in accuracy_tracker.prediction_buffer
+
+
+def test_process_executor_shards_cities():
+    from app.ml.accuracy_tracker import accuracy_tracker
+    from app.ml.data_quality import data_quality_checker
+    
+    engine = PredictionEngine(executor="process", workers=2)
+    city_ids = ["ajman", "fujairah", "al_ain"]
+    try:
+        results = asyncio.run(engine.predict_batch(city_ids, [CURRENT_DATA] * 3))
+        query = asyncio.run(engine.query("ajman", CURRENT_DATA))
+    finally:
+        engine.shutdown()
+    
+    assert [r["city_id"] for r in results] == city_ids
+    assert query["city_id"] == "ajman"
+    # Predictions and quality tracking (baselines included) recorded in the shard
+    # processes are kept by the main process
+    for city_id in city_ids:
+        assert len(accuracy_tracker.prediction_buffer[city_id]) == 40
+        assert len(data_quality_checker.recent_readings[city_id]) == 1
+        assert data_quality_checker.baselines[city_id].count.max() == 1
+
+
+def test_snapshot_round_trip(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from app.core import database
+    from app.ml import gbm_model
+    
+    # warm_start also reads the ledger and GBM artifacts: keep both inside tmp_path
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "haboob.db"))
+    monkeypatch.setattr(gbm_model, "GBM_MODEL_DIR", str(tmp_path / "gbm"))
+    database.init_database()
+    
+    path = str(tmp_path / "predictor_state.npz")
+    engine = PredictionEngine(state_path=path)
+    for i in range(250):
+        engine.ensemble.add_historical_data("dubai", dict(
+            CURRENT_DATA, dust=30 + i % 40, wind_speed=10 + i % 7,
+            timestamp=f"2026-06-{1 + i // 24:02d}T{i % 24:02d}:00:00"
+        ))
+    asyncio.run(engine.predict("dubai", CURRENT_DATA))
+    asyncio.run(engine.snapshot())
+    engine.shutdown()
+    
+    restored = PredictionEngine(state_path=path)
+    assert asyncio.run(restored.warm_start()) == "snapshot"
+    restored.shutdown()
+    
+    before, after = engine.ensemble, restored.ensemble
+    assert after.learned_patterns["dubai"] == before.learned_patterns["dubai"]
+    assert after.kalman_filters["dubai"].estimate == before.kalman_filters["dubai"].estimate
+    assert np.array_equal(after.history["dubai"].window("dust"), before.history["dubai"].window("dust"))
+    assert after.model_weights == before.model_weights
@@ -4,7 +4,9 @@ import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from app.ml.ensemble_predictor import EnsemblePredictor
+from datetime import datetime, timedelta
+
+from app.ml.ensemble_predictor import EnsemblePredictor, HistoryRingBuffer, LearnedPatternStats
 
 
 def test_predictor_initialization():
@@ -94,3 +96,312 @@ def test_model_weights_update():
     
     # Weights should still sum to 1
     assert sum(predictor.model_weights.values()) == pytest.approx(1.0, rel=0.01)
+
+
+def test_forecast_interval_and_breakdown():
+    predictor = EnsemblePredictor()
+    
+    current_data = {
+        "dust": 80,
+        "temperature": 38,
+        "humidity": 25,
+        "wind_speed": 28,
+        "wind_direction": 230,
+        "forecast_dust": [75, None, 90]
+    }
+    
+    result = predictor.predict("abu_dhabi", current_data, hours_ahead=72)
+    
+    # Hourly to 24h, then 3-hourly
+    assert len(result["forecast_72h"]) == 24 + 16
+    assert [h["hour"] for h in result["forecast_72h"][22:26]] == [22, 23, 24, 27]
+    for hour in result["forecast_72h"]:
+        assert hour["confidence_interval"]["lower"] <= hour["dust"] <= hour["confidence_interval"]["upper"]
+        assert set(hour["model_breakdown"]) == {
+            "pattern", "weather", "persistence", "climatology", "api", "neural", "meta"
+        }
+    
+    assert result["summary"]["peak_dust"] == max(h["dust"] for h in result["forecast_72h"])
+
+
+def test_predict_batch_matches_single_city_predictions():
+    np = pytest.importorskip("numpy")
+    
+    inputs = {
+        "dubai": {"dust": 50, "temperature": 35, "humidity": 40, "wind_speed": 15, "wind_direction": 180},
+        "al_ain": {"dust": 120, "temperature": 41, "humidity": 15, "wind_speed": 32, "wind_direction": 240,
+                   "forecast_dust": [110, 130, None, 150]},
+    }
+    
+    batch = EnsemblePredictor().predict_batch(list(inputs), list(inputs.values()), hours_ahead=48)
+    
+    single = EnsemblePredictor()
+    expected = [single.predict(city_id, data, hours_ahead=48) for city_id, data in inputs.items()]
+    
+    assert [r["city_id"] for r in batch] == list(inputs)
+    for got, want in zip(batch, expected):
+        assert [h["dust"] for h in got["forecast_72h"]] == [h["dust"] for h in want["forecast_72h"]]
+        assert got["summary"]["peak_dust"] == want["summary"]["peak_dust"]
+        assert got["summary"]["avg_dust"] == want["summary"]["avg_dust"]
+
+
+def test_calendar_cache_refreshes_on_hour_rollover():
+    predictor = EnsemblePredictor()
+    cache = predictor.calendar_cache
+    
+    first = cache.get(datetime(2026, 6, 30, 22, 5), 72)
+    again = cache.get(datetime(2026, 6, 30, 22, 55), 24)
+    
+    # Same wall-clock hour: shared arrays, sliced to the requested horizon
+    assert len(again["diurnal"]) == 24
+    assert again["diurnal"].base is first["diurnal"]
+    assert first["hour"][0] == 22 and first["month"][2] == 7
+    
+    rolled = cache.get(datetime(2026, 6, 30, 23, 0), 72)
+    assert rolled["hour"][0] == 23
+    assert rolled["diurnal"][0] == predictor.diurnal_factors[23]
+
+
+def test_climatology_is_deterministic_within_the_hour():
+    np = pytest.importorskip("numpy")
+    
+    now = datetime(2026, 6, 30, 22, 5)
+    first = EnsemblePredictor().calendar_cache.get(now, 24)
+    longer = EnsemblePredictor().calendar_cache.get(now.replace(minute=40), 96)
+    
+    assert np.array_equal(longer["climatology_noise"][:24], first["climatology_noise"])
+    predictor = EnsemblePredictor()
+    assert first["climatology"][0] == pytest.approx(
+        68 * predictor.diurnal_factors[22] * predictor.weekly_factors[now.weekday()]
+    )
+    
+    data = {"dust": 50, "temperature": 35, "humidity": 40, "wind_speed": 15, "wind_direction": 180}
+    a = predictor.predict("dubai", data, verbosity="lite", commit=False)
+    b = EnsemblePredictor().predict("dubai", data, verbosity="lite", commit=False)
+    assert a["forecast"]["dust"] == b["forecast"]["dust"]
+
+
+def test_calendar_cache_is_consistent_across_threads():
+    """Readers racing hour rollovers and longer builds always get their own hour and horizon"""
+    np = pytest.importorskip("numpy")
+    import threading
+    from app.ml.ensemble_predictor import forecast_leads
+    
+    cache = EnsemblePredictor().calendar_cache
+    hours = [datetime(2026, 6, 30, 20) + timedelta(hours=h) for h in range(4)]
+    errors = []
+    
+    def read(horizon: int):
+        try:
+            for i in range(300):
+                start = hours[i % len(hours)]
+                arrays = cache.scheduled(start, horizon)
+                assert len(arrays["hour"]) == len(forecast_leads(horizon))
+                assert arrays["hour"][0] == start.hour
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=read, args=(horizon,)) for horizon in (24, 72, 240, 72)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_meta_ensemble_matches_per_hour_iqr_median():
+    np = pytest.importorskip("numpy")
+    
+    rng = np.random.default_rng(0)
+    model_tensor = rng.gamma(2, 20, size=(3, 6, 72))
+    model_tensor[rng.random(model_tensor.shape) < 0.1] *= 8  # outliers
+    model_tensor[:, :2, 10] = 42.0  # ties
+    
+    expected = np.empty((3, 72))
+    for row, city_preds in enumerate(model_tensor):
+        for i, hour_preds in enumerate(city_preds.T):
+            q1, q3 = np.percentile(hour_preds, 25), np.percentile(hour_preds, 75)
+            iqr = q3 - q1
+            kept = [p for p in hour_preds if q1 - 1.5 * iqr <= p <= q3 + 1.5 * iqr]
+            expected[row, i] = max(0, np.median(kept))
+    
+    assert np.array_equal(EnsemblePredictor()._meta_ensemble_model(model_tensor), expected)
+
+
+def test_lite_payload_is_columnar():
+    predictor = EnsemblePredictor()
+    
+    current_data = {
+        "dust": 60,
+        "temperature": 36,
+        "humidity": 30,
+        "wind_speed": 22,
+        "wind_direction": 220
+    }
+    
+    lite = predictor.predict("sharjah", current_data, hours_ahead=72, verbosity="lite")
+    
+    assert "forecast_72h" not in lite
+    forecast = lite["forecast"]
+    assert set(forecast) == {"lead_hours", "times", "dust", "confidence", "lower", "upper"}
+    assert all(len(column) == 40 for column in forecast.values())
+    assert forecast["lead_hours"][23:26] == [23, 24, 27]
+    assert lite["summary"]["peak_dust"] == max(forecast["dust"])
+    
+    with_breakdown = predictor.predict("sharjah", current_data, hours_ahead=72,
+                                       verbosity="lite", include_breakdown=True)
+    assert len(with_breakdown["forecast"]["breakdown"]["meta"]) == 40
+    
+    with pytest.raises(ValueError):
+        predictor.predict("sharjah", current_data, verbosity="verbose")
+
+
+def test_multi_resolution_horizon():
+    np = pytest.importorskip("numpy")
+    from app.ml.ensemble_predictor import MAX_FORECAST_HOURS, forecast_leads
+    
+    leads = forecast_leads(240)
+    assert np.array_equal(leads[:25], np.arange(25))
+    assert np.all(np.diff(leads[(leads >= 24) & (leads <= 168)]) == 3)
+    assert np.all(np.diff(leads[leads >= 168]) == 6)
+    assert len(leads) == 24 + 48 + 12
+    
+    predictor = EnsemblePredictor()
+    current_data = {"dust": 120, "temperature": 40, "humidity": 15, "wind_speed": 35, "wind_direction": 230}
+    result = predictor.predict("dubai", current_data, hours_ahead=240, verbosity="lite", commit=False)
+    assert len(result["forecast"]["dust"]) == len(leads)
+    
+    # Coarse steps count for every hour they cover
+    dust = np.array(result["forecast"]["dust"])
+    widths = np.diff(leads, append=240)
+    assert result["summary"]["hours_above_high"] == int(widths[dust >= 50].sum())
+    assert result["summary"]["peak_hour"] == int(leads[np.argmax(dust)])
+    
+    with pytest.raises(ValueError):
+        predictor.predict("dubai", current_data, hours_ahead=MAX_FORECAST_HOURS + 1)
+
+
+def test_probabilistic_members_give_quantiles():
+    predictor = EnsemblePredictor()
+    current_data = {"dust": 90, "temperature": 39, "humidity": 25, "wind_speed": 28, "wind_direction": 230}
+    
+    result = predictor.predict("al_ain", current_data, hours_ahead=48, verbosity="lite",
+                               commit=False, members=200)
+    again = predictor.predict("al_ain", current_data, hours_ahead=48, verbosity="lite",
+                              commit=False, members=200)
+    probabilistic = result["probabilistic"]
+    
+    assert probabilistic == again["probabilistic"]
+    assert probabilistic["members"] == 200
+    assert set(probabilistic["exceedance"]) == {"50", "100", "200"}
+    for hour in range(len(result["forecast"]["dust"])):
+        assert probabilistic["p10"][hour] <= probabilistic["p50"][hour] <= probabilistic["p90"][hour]
+        exceedance = [probabilistic["exceedance"][t][hour] for t in ("50", "100", "200")]
+        assert 1 >= exceedance[0] >= exceedance[1] >= exceedance[2] >= 0
+    
+    # Member passes do not count as model runs in the operator stats
+    report = {model["name"]: model for model in predictor.models.report(predictor.model_weights)}
+    assert report["pattern"]["runs"] == 2
+    assert probabilistic["p90"][0] > probabilistic["p10"][0]
+    assert "probabilistic" not in predictor.predict("al_ain", current_data, commit=False)
+
+
+def test_history_ring_buffer_wraps_with_contiguous_windows():
+    buffer = HistoryRingBuffer(capacity=5)
+    
+    for i in range(12):
+        buffer.append(1000.0 + i, {"dust": float(i), "wind_speed": None})
+    
+    assert len(buffer) == 5
+    assert buffer.window("dust").tolist() == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert buffer.window("dust", 2).tolist() == [10.0, 11.0]
+    assert buffer.window("timestamp", 1).tolist() == [1011.0]
+    
+    # Windows are views into the preallocated storage, not copies
+    assert buffer.window("dust").base is buffer.columns["dust"]
+
+
+def test_learned_patterns_track_history_incrementally():
+    np = pytest.importorskip("numpy")
+    
+    predictor = EnsemblePredictor()
+    rng = np.random.default_rng(3)
+    start = datetime(2026, 5, 1)
+    
+    for i in range(4500):
+        predictor.add_historical_data("dubai", {
+            "timestamp": (start + timedelta(minutes=5 * i)).isoformat(),
+            "dust": float(rng.gamma(2, 20)),
+            "wind_speed": float(rng.uniform(2, 30)),
+        })
+    
+    # Past capacity the accumulators must equal a full recomputation of the window
+    expected = LearnedPatternStats()
+    expected.rebuild(predictor.history["dubai"])
+    got = predictor.learned_patterns["dubai"]
+    want = expected.patterns()
+    
+    assert set(got["hourly_averages"]) == set(range(24))
+    for hour, avg in want["hourly_averages"].items():
+        assert got["hourly_averages"][hour] == pytest.approx(avg, rel=1e-9)
+    assert got["baseline_dust"] == pytest.approx(want["baseline_dust"], rel=1e-9)
+    assert got["wind_correlation"] == pytest.approx(
+        np.corrcoef(predictor.history["dubai"].window("dust"), predictor.history["dubai"].window("wind_speed"))[0, 1],
+        abs=1e-6
+    )
+
+
+def test_ring_buffer_bulk_extend_matches_appends():
+    np = pytest.importorskip("numpy")
+    
+    appended = HistoryRingBuffer(capacity=8, fields=("dust",))
+    extended = HistoryRingBuffer(capacity=8, fields=("dust",))
+    for i in range(3):
+        appended.append(float(i), {"dust": i})
+        extended.append(float(i), {"dust": i})
+    for i in range(3, 14):
+        appended.append(float(i), {"dust": i})
+    extended.extend(np.arange(3, 14, dtype=float), {"dust": np.arange(3, 14)})
+    
+    assert len(extended) == 8 and extended.head == appended.head
+    assert extended.window("dust").tolist() == appended.window("dust").tolist()
+    assert extended.window("timestamp").tolist() == list(range(6, 14))
+
+
+def test_load_readings_rebuilds_learned_patterns():
+    readings = [
+        {"city_id": city_id, "timestamp": f"2026-06-{1 + i // 24:02d}T{i % 24:02d}:00:00",
+         "dust": 20 + i % 24, "wind_speed": 12, "humidity": None}
+        for i in range(240) for city_id in ("dubai", "ajman")
+    ]
+    predictor = EnsemblePredictor()
+    
+    assert predictor.load_readings(readings, keep=lambda city_id: city_id == "dubai") == 1
+    assert set(predictor.history) == {"dubai"}
+    patterns = predictor.learned_patterns["dubai"]
+    assert patterns["hourly_averages"][5] == 25
+
+
+def test_disabled_model_is_skipped_and_weights_renormalized():
+    predictor = EnsemblePredictor()
+    current_data = {"dust": 70, "temperature": 37, "humidity": 30, "wind_speed": 20, "wind_direction": 210}
+    
+    predictor.set_model_enabled("climatology", False)
+    result = predictor.predict("dubai", current_data, verbosity="lite", include_breakdown=True, commit=False)
+    
+    assert "climatology" not in result["forecast"]["breakdown"]
+    assert "climatology" not in result["model_weights"]
+    assert sum(result["model_weights"].values()) == pytest.approx(1.0)
+    assert result["model_weights"]["pattern"] == pytest.approx(0.22 / 0.88)
+    
+    report = {model["name"]: model for model in predictor.models.report(predictor.model_weights)}
+    assert report["climatology"]["enabled"] is False and report["climatology"]["runs"] == 0
+    assert report["pattern"]["runs"] == 1 and report["pattern"]["last_ms"] is not None
+    assert report["meta_ensemble"]["last_output"]["max"] >= report["meta_ensemble"]["last_output"]["min"]
+    
+    with pytest.raises(KeyError):
+        predictor.set_model_enabled("unknown", False)
+    for name in ("pattern", "weather", "persistence", "api_forecast"):
+        predictor.set_model_enabled(name, False)
+    with pytest.raises(ValueError):
+        predictor.set_model_enabled("neural_pattern", False)
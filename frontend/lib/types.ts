@@ -33,9 +33,32 @@ export interface DustReading {
   data_quality?: string;
   forecast_24h?: ForecastPoint[];
   forecast_72h?: ForecastPoint[];
+  // Only with READING_FORECAST_VERBOSITY=lite, in place of the lists above
+  forecast?: ColumnarForecast | null;
   next_risk_period?: RiskPeriod;
 }
 
+// Struct-of-arrays forecast ("lite" payload). Element i of every array is the
+// step lead_hours[i] hours ahead: hourly to 24h, then 3-hourly, then 6-hourly
+export interface ColumnarForecast {
+  lead_hours: number[];
+  times: string[];
+  dust: number[];
+  confidence: number[];
+  lower: number[];
+  upper: number[];
+  breakdown?: Record<string, number[]>;
+}
+
+// Quantile forecast from perturbed input members (predictions?members=N)
+export interface ProbabilisticForecast {
+  members: number;
+  p10: number[];
+  p50: number[];
+  p90: number[];
+  exceedance: Record<string, number[]>;
+}
+
 export interface ForecastPoint {
   hour: number;
   time: string;
@@ -69,6 +92,7 @@ export interface Prediction {
   accuracy_info?: AccuracyInfo;
   model_weights?: Record<string, number>;
   data_quality?: DataQuality;
+  probabilistic?: ProbabilisticForecast;
 }
 
 export interface PredictionSummary {